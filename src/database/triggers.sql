@@ -18,3 +18,27 @@ CREATE TRIGGER subscription_element_update_timestamp BEFORE UPDATE ON subscripti
 CREATE TRIGGER trigger_update_timestamp BEFORE UPDATE ON trigger FOR EACH ROW EXECUTE PROCEDURE update_timestamp();
 CREATE TRIGGER workflow_update_timestamp BEFORE UPDATE ON workflow FOR EACH ROW EXECUTE PROCEDURE update_timestamp();
 CREATE TRIGGER workflow_instance_update_timestamp BEFORE UPDATE ON workflow_instance FOR EACH ROW EXECUTE PROCEDURE update_timestamp();
+
+
+-- wakes up engine workers when an action becomes QUEUED, or when an in-flight action finishes (freeing capacity).
+-- PENDING -> QUEUED is skipped, since that is an engine worker backing off when there is no capacity.
+CREATE OR REPLACE FUNCTION notify_action_dispatch()
+RETURNS TRIGGER AS $$
+DECLARE
+    old_state TEXT;
+    new_state TEXT := NEW.data->>'state';
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        old_state := OLD.data->>'state';
+    END IF;
+    IF (new_state = 'QUEUED' AND old_state IS DISTINCT FROM 'QUEUED' AND old_state IS DISTINCT FROM 'PENDING')
+        OR (old_state IN ('PENDING', 'RUNNING', 'FINISHING') AND new_state NOT IN ('PENDING', 'RUNNING', 'FINISHING'))
+    THEN
+        PERFORM pg_notify('dart_action_dispatch', NEW.id);
+    END IF;
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+
+CREATE TRIGGER action_notify_dispatch AFTER INSERT OR UPDATE ON action FOR EACH ROW EXECUTE PROCEDURE notify_action_dispatch();
@@ -110,6 +110,10 @@ class Dart(object):
         """ :type datastore_id: str """
         self._get_response_data('delete', '/datastore/%s' % datastore_id)
 
+    def await_datastore_purge(self, datastore_id, timeout_seconds=2):
+        """ :type datastore_id: str """
+        self._await_purge('/datastore/%s' % datastore_id, timeout_seconds)
+
     def patch_action(self, action, **data_properties):
         """ :type action: dart.model.action.Action
             :rtype: dart.model.action.Action """
@@ -155,17 +159,10 @@ class Dart(object):
     def find_actions(self, filters=None):
         """ :type filters: list[dart.model.query.Filter]
             :rtype: list[dart.model.action.Action] """
-        limit = 20
-        offset = 0
-        while True:
-            fs_string = json.dumps([' '.join([f.key, f.operator, f.value]) for f in filters or []])
-            params = {'limit': limit, 'offset': offset, 'filters': fs_string}
-            results = self._request_list('get', '/action', params=params, model_class=Action)
-            if len(results) == 0:
-                break
-            for e in results:
-                yield e
-            offset += limit
+        fs_string = json.dumps([' '.join([f.key, f.operator, f.value]) for f in filters or []])
+        params = {'limit': 20, 'filters': fs_string}
+        for e in self._request_pages('/action', params, Action):
+            yield e
 
     def get_actions(self, datastore_id=None, workflow_id=None):
         """ :type datastore_id: str
@@ -229,6 +226,11 @@ class Dart(object):
         """ :type workflow_id: str """
         self._get_response_data('delete', '/workflow/%s' % workflow_id)
 
+    def await_workflow_purge(self, workflow_id, timeout_seconds=2):
+        """ waits for the workflow to be removed (its instances are removed by delete_workflow_instances)
+            :type workflow_id: str """
+        self._await_purge('/workflow/%s' % workflow_id, timeout_seconds)
+
     def delete_workflow_instances(self, workflow_id):
         """ :type workflow_id: str """
         self._get_response_data('delete', '/workflow/%s/instance' % workflow_id)
@@ -266,37 +268,46 @@ class Dart(object):
     def get_subscription_elements(self, action_id):
         """ :type action_id: str
             :rtype: list[dart.model.subscription.SubscriptionElement] """
-        limit = 10000
-        offset = 0
-        while True:
-            params = {'limit': limit, 'offset': offset}
-            results = self._request_list('get', '/action/%s/subscription/elements' % action_id, params=params, model_class=SubscriptionElement)
-            if len(results) == 0:
-                break
-            for e in results:
-                yield e
-            offset += limit
+        params = {'limit': 10000}
+        for e in self._request_pages('/action/%s/subscription/elements' % action_id, params, SubscriptionElement):
+            yield e
 
     def find_subscription_elements(self, subscription_id, state=None, processed_after_s3_path=None):
         """ :type subscription_id: str
             :type state: str
             :type processed_after_s3_path: str
             :rtype: list[dart.model.subscription.SubscriptionElement] """
-        limit = 10000
-        offset = 0
-        while True:
-            params = {
-                'limit': limit,
-                'offset': offset,
-                'state': state,
-                'processed_after_s3_path': processed_after_s3_path if processed_after_s3_path else None
-            }
-            results = self._request_list('get', '/subscription/%s/elements' % subscription_id, params=params, model_class=SubscriptionElement)
-            if len(results) == 0:
-                break
-            for e in results:
-                yield e
-            offset += limit
+        params = {
+            'limit': 10000,
+            'state': state,
+            'processed_after_s3_path': processed_after_s3_path if processed_after_s3_path else None
+        }
+        for e in self._request_pages('/subscription/%s/elements' % subscription_id, params, SubscriptionElement):
+            yield e
+
+    def stream_subscription_elements(self, action_id):
+        """ like get_subscription_elements, but streamed in a single response so memory use stays constant
+
+            :type action_id: str
+            :rtype: list[dart.model.subscription.SubscriptionElement] """
+        url_prefix = '/action/%s/subscription/elements/stream' % action_id
+        for e in self._request_stream(url_prefix, None, SubscriptionElement):
+            yield e
+
+    def stream_find_subscription_elements(self, subscription_id, state=None, processed_after_s3_path=None):
+        """ like find_subscription_elements, but streamed in a single response so memory use stays constant
+
+            :type subscription_id: str
+            :type state: str
+            :type processed_after_s3_path: str
+            :rtype: list[dart.model.subscription.SubscriptionElement] """
+        params = {
+            'state': state,
+            'processed_after_s3_path': processed_after_s3_path if processed_after_s3_path else None
+        }
+        url_prefix = '/subscription/%s/elements/stream' % subscription_id
+        for e in self._request_stream(url_prefix, params, SubscriptionElement):
+            yield e
 
     def get_subscription_element_stats(self, subscription_id):
         """ :type subscription_id: str
@@ -307,6 +318,10 @@ class Dart(object):
         """ :type subscription_id: str """
         self._get_response_data('delete', '/subscription/%s' % subscription_id)
 
+    def await_subscription_purge(self, subscription_id, timeout_seconds=2):
+        """ :type subscription_id: str """
+        self._await_purge('/subscription/%s' % subscription_id, timeout_seconds)
+
     def save_trigger(self, trigger):
         """ :type trigger: dart.model.trigger.Trigger
             :rtype: dart.model.trigger.Trigger """
@@ -360,15 +375,83 @@ class Dart(object):
         return self._request('get', '/graph/%s/%s' % (entity_type, entity_id), model_class=Graph)
 
     def _get_response_data(self, method, url_prefix, data=None, params=None):
+        return self._get_response(method, url_prefix, data, params)['results']
+
+    def _get_response(self, method, url_prefix, data=None, params=None):
         response = requests.request(method, self._base_url + '/' + url_prefix.lstrip('/'), json=data, params=params)
         try:
             data = response.json()
             if data['results'] == 'ERROR':
                 raise
-            return data['results']
+            return data
         except:
             raise DartRequestException(response)
 
+    def _await_purge(self, url_prefix, timeout_seconds):
+        """ a deleted entity is gone from the API right away, but its rows are removed by the subscription worker
+            afterwards - include_deleting keeps it visible until that has finished """
+        while True:
+            response = requests.get(self._base_url + '/' + url_prefix.lstrip('/'), params={'include_deleting': 'true'})
+            if response.status_code == 404:
+                return
+            if response.status_code != 200:
+                raise DartRequestException(response)
+            time.sleep(timeout_seconds)
+
+    def _request_stream(self, url_prefix, params, model_class):
+        """ yields one model per line of a newline delimited json response (gzip is decoded by requests).  the
+            server ends the stream with a {"_end": true, "count": N} line - without it the response was cut short,
+            so this raises rather than let the caller take a partial result for the whole one """
+        response = requests.get(self._base_url + '/' + url_prefix.lstrip('/'), params=params, stream=True)
+        if response.status_code != 200:
+            raise DartRequestException(response)
+        try:
+            count = 0
+            end = None
+            for line in response.iter_lines(chunk_size=64 * 1024):
+                if not line:
+                    continue
+                if end:
+                    raise DartRequestException(response, 'stream (%s) continued after its end line' % url_prefix)
+                value = json.loads(line)
+                if value.get('_end'):
+                    end = value
+                    continue
+                count += 1
+                yield model_class.from_dict(value)
+            if not end:
+                raise DartRequestException(response, 'stream (%s) ended after %s results without its end line'
+                                           % (url_prefix, count))
+            if end['count'] != count:
+                raise DartRequestException(response, 'stream (%s) sent %s results but its end line says %s'
+                                           % (url_prefix, count, end['count']))
+        finally:
+            response.close()
+
+    def _request_pages(self, url_prefix, params, model_class):
+        """ yields every result of a GET list endpoint, following its next_cursor until there are no more pages.
+            servers from before cursor paging ignore the cursor and send no next_cursor, so those are paged through
+            with limit/offset instead """
+        cursor = ''
+        while cursor is not None:
+            response = self._get_response('get', url_prefix, params=dict(params, cursor=cursor))
+            for e in response['results']:
+                yield model_class.from_dict(e)
+            if 'next_cursor' not in response:
+                for e in self._request_offset_pages(url_prefix, params, model_class, len(response['results'])):
+                    yield e
+                return
+            cursor = response['next_cursor']
+
+    def _request_offset_pages(self, url_prefix, params, model_class, offset):
+        while True:
+            results = self._request_list('get', url_prefix, params=dict(params, offset=offset), model_class=model_class)
+            if len(results) == 0:
+                break
+            for e in results:
+                yield e
+            offset += len(results)
+
     def _request(self, method, url_prefix=None, data=None, params=None, model_class=None):
         response_data = self._get_response_data(method, url_prefix, data, params)
         return model_class.from_dict(response_data)
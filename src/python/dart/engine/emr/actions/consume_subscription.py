@@ -43,5 +43,5 @@ def consume_subscription(emr_engine, datastore, action, consume_successful=False
 
 
 def subscription_s3_path_and_file_size_generator(dart, action_id):
-    for element in dart.get_subscription_elements(action_id):
+    for element in dart.stream_subscription_elements(action_id):
         yield element.s3_path, element.file_size
@@ -33,8 +33,8 @@ class NoOpEngine(object):
                 error_message = '%s failed as expected' % NoOpActionTypes.action_that_fails.name
 
             if action.data.action_type_name == NoOpActionTypes.consume_subscription.name:
-                subscription_elements = self.dart.get_subscription_elements(action.id)
-                _logger.info('consuming subscription, size = %s' % len(list(subscription_elements)))
+                subscription_elements = self.dart.stream_subscription_elements(action.id)
+                _logger.info('consuming subscription, size = %s' % sum(1 for _ in subscription_elements))
 
         except Exception as e:
             state = ActionResultState.FAILURE
@@ -43,10 +43,10 @@ def get_most_recently_processed_s3_path(conn, action):
 def _s3_path_and_updated_generator(dart, subscription_id, action_id, processed_after_s3_path):
     # first process anything we have missed (e.g. the cluster has been restored from a backup)
     if processed_after_s3_path:
-        for e in dart.find_subscription_elements(subscription_id,
-                                                 SubscriptionElementState.CONSUMED,
-                                                 processed_after_s3_path):
+        for e in dart.stream_find_subscription_elements(subscription_id,
+                                                        SubscriptionElementState.CONSUMED,
+                                                        processed_after_s3_path):
             yield e.s3_path, e.updated
 
-    for e in dart.get_subscription_elements(action_id):
+    for e in dart.stream_subscription_elements(action_id):
         yield e.s3_path, e.updated
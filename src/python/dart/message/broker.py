@@ -2,13 +2,21 @@ from abc import abstractmethod
 import base64
 import json
 import logging
+from multiprocessing.pool import ThreadPool
 from pydoc import locate
 import random
+import sys
+import time
+import traceback
 from boto.regioninfo import RegionInfo
 from boto.sqs.connection import SQSConnection
 from boto.sqs.jsonmessage import JSONMessage
+from sqlalchemy import create_engine, text
+from dart.context.database import db
 from dart.model.message import MessageState
 from dart.service.message import MessageService
+from dart.util.pg_notify import PostgresNotificationListener
+from dart.util.rand import random_id
 
 
 _logger = logging.getLogger(__name__)
@@ -21,25 +29,92 @@ class MessageBroker(object):
         raise NotImplementedError
 
     @abstractmethod
-    def send_message(self, message):
+    def send_message(self, message, delay_seconds=0):
         """
         :param message: the message to send
         :type message: dict
+        :param delay_seconds: how long the message stays invisible to receivers after it is sent (at most 900)
+        :type delay_seconds: int
         """
         raise NotImplementedError
 
     @abstractmethod
     def receive_message(self, handler):
         """
+        an exception raised by the handler propagates to the caller, leaving the message to be redelivered.  when a
+        batch of messages is received, every message of it is still handled, and the first failure is raised after.
+
         :param handler: callback function that handles the message
         :type handler: function[str, dict]
         """
         raise NotImplementedError
 
+    @abstractmethod
+    def extend_visibility(self, message_id):
+        """
+        keeps a message that is still being handled hidden from other receivers for another visibility timeout.  long
+        running handlers call this as they make progress, and it does nothing within a third of a timeout of the last
+        extension, so it is cheap to call often.
+
+        :param message_id: the id the message was handed to the handler with
+        :type message_id: str
+        """
+        raise NotImplementedError
+
+
+def handle_tracked_message(message_service, message_id, message_body, handler, delete_message):
+    """ runs handler once per message_id, using the message table to skip redeliveries of messages that already
+        finished and to detect handlers whose container was lost
+
+        :type message_service: dart.service.message.MessageService
+        :type message_body: dict
+        :param delete_message: removes the message from the broker's queue
+        :type delete_message: function[] """
+    message = message_service.get_message(message_id, raise_when_missing=False)
+    previous_handler_failed = False
+    result_state = MessageState.COMPLETED
+    if not message:
+        message = message_service.save_message(message_id, json.dumps(message_body), MessageState.RUNNING)
+
+    elif message:
+        if message.state in [MessageState.COMPLETED, MessageState.FAILED]:
+            _logger.warn('bailing on message with id=%s because it was redelivered' % message_id)
+            delete_message()
+            return
+
+        if message.state in [MessageState.RUNNING]:
+            # the DB says its running, but is it REALLY running?
+            ecs_task_status = message_service.get_ecs_task_status(message)
+            if ecs_task_status == 'RUNNING':
+                # ok, it was really running.  return and let the broker redeliver the message later
+                return
+            if not ecs_task_status or ecs_task_status == 'STOPPED':
+                # it seems the container was lost, so mark this message as failed
+                previous_handler_failed = True
+                result_state = MessageState.FAILED
+
+    handler(message_id, message_body, previous_handler_failed)
+    message_service.update_message_state(message, result_state)
+    delete_message()
+
+
+def _raise_first_failure(failures):
+    """ re-raises the first of a batch's handler failures (with its traceback) once every message of the batch has
+        been handled, logging any others, so that the pooled and serial paths fail alike and no failure goes unseen
+
+        :type failures: list[tuple] """
+    for exc_info in failures[1:]:
+        _logger.error(json.dumps(''.join(traceback.format_exception(*exc_info))))
+    if failures:
+        raise failures[0][0], failures[0][1], failures[0][2]
+
 
 class SqsJsonMessageBroker(MessageBroker):
     def __init__(self, queue_name, aws_access_key_id=None, aws_secret_access_key=None, region='us-east-1',
-                 endpoint=None, is_secure=True, port=None, incoming_message_class='boto.sqs.jsonmessage.JSONMessage'):
+                 endpoint=None, is_secure=True, port=None, incoming_message_class='boto.sqs.jsonmessage.JSONMessage',
+                 receive_batch_size=1, handler_pool_size=1, visibility_timeout_seconds=300):
+        assert 1 <= receive_batch_size <= 10, 'SQS allows receiving between 1 and 10 messages at a time'
+        assert handler_pool_size >= 1, 'handler_pool_size must be at least 1'
         self._region = RegionInfo(name=region, endpoint=endpoint) if region and endpoint else None
         self._queue_name = queue_name
         self._is_secure = is_secure
@@ -47,53 +122,79 @@ class SqsJsonMessageBroker(MessageBroker):
         self._incoming_message_class = incoming_message_class
         self._aws_access_key_id = aws_access_key_id
         self._aws_secret_access_key = aws_secret_access_key
+        self._receive_batch_size = receive_batch_size
+        self._handler_pool_size = handler_pool_size
+        self._visibility_timeout_seconds = visibility_timeout_seconds
         self._message_class = locate(self._incoming_message_class)
         self._queue = None
+        self._pool = None
         self._message_service = None
+        # message id -> [message, time its visibility was last extended], for the messages being handled
+        self._in_flight = {}
 
     def set_app_context(self, app_context):
         self._message_service = app_context.get(MessageService)
 
-    def send_message(self, message):
+    def send_message(self, message, delay_seconds=0):
         # dart always uses the JSONMessage format
-        self.queue.write(JSONMessage(self.queue, message))
+        self.queue.write(JSONMessage(self.queue, message), delay_seconds=delay_seconds or None)
 
     def receive_message(self, handler, wait_time_seconds=20):
         # randomly purge old messages
         if random.randint(0, 100) < 1:
             self._message_service.purge_old_messages()
 
-        sqs_message = self.queue.read(wait_time_seconds=wait_time_seconds)
-        if not sqs_message:
+        if self._receive_batch_size == 1:
+            sqs_message = self.queue.read(wait_time_seconds=wait_time_seconds)
+            sqs_messages = [sqs_message] if sqs_message else []
+        else:
+            sqs_messages = self.queue.get_messages(
+                num_messages=self._receive_batch_size,
+                wait_time_seconds=wait_time_seconds
+            )
+
+        if not sqs_messages:
             return
 
-        sqs_message_body = self._get_body(sqs_message)
-        message = self._message_service.get_message(sqs_message.id, raise_when_missing=False)
-        previous_handler_failed = False
-        result_state = MessageState.COMPLETED
-        if not message:
-            message = self._message_service.save_message(sqs_message.id, json.dumps(sqs_message_body), MessageState.RUNNING)
-
-        elif message:
-            if message.state in [MessageState.COMPLETED, MessageState.FAILED]:
-                _logger.warn('bailing on sqs message with id=%s because it was redelivered' % sqs_message.id)
-                self.queue.delete_message(sqs_message)
-                return
+        if self._handler_pool_size == 1 or len(sqs_messages) == 1:
+            failures = [self._try_handle_message(m, handler) for m in sqs_messages]
+        else:
+            # each message keeps its own idempotency/redelivery bookkeeping, so they can be handled independently
+            failures = self.pool.map(lambda m: self._try_handle_message_in_pool(m, handler), sqs_messages)
+        _raise_first_failure([f for f in failures if f])
+
+    def _try_handle_message(self, sqs_message, handler):
+        """ :return: the sys.exc_info() of a failed handler (the message is left on the queue, so the visibility
+                     timeout will resend it later), or None """
+        try:
+            self._handle_message(sqs_message, handler)
+            return None
+        except Exception:
+            exc_info = sys.exc_info()
+            db.session.rollback()
+            return exc_info
+
+    def _try_handle_message_in_pool(self, sqs_message, handler):
+        try:
+            return self._try_handle_message(sqs_message, handler)
+        finally:
+            # sessions are thread local, so clean up the one owned by this pool thread
+            db.session.rollback()
 
-            if message.state in [MessageState.RUNNING]:
-                # the DB says its running, but is it REALLY running?
-                ecs_task_status = self._message_service.get_ecs_task_status(message)
-                if ecs_task_status == 'RUNNING':
-                    # ok, it was really running.  return and let the visibility timeout resend the message later
-                    return
-                if not ecs_task_status or ecs_task_status == 'STOPPED':
-                    # it seems the container was lost, so mark this message as failed
-                    previous_handler_failed = True
-                    result_state = MessageState.FAILED
-
-        handler(sqs_message.id, sqs_message_body, previous_handler_failed)
-        self._message_service.update_message_state(message, result_state)
-        self.queue.delete_message(sqs_message)
+    def _handle_message(self, sqs_message, handler):
+        self._in_flight[sqs_message.id] = [sqs_message, time.time()]
+        try:
+            handle_tracked_message(self._message_service, sqs_message.id, self._get_body(sqs_message), handler,
+                                   lambda: self.queue.delete_message(sqs_message))
+        finally:
+            self._in_flight.pop(sqs_message.id, None)
+
+    def extend_visibility(self, message_id):
+        in_flight = self._in_flight.get(message_id)
+        if not in_flight or time.time() - in_flight[1] < self._visibility_timeout_seconds / 3.0:
+            return
+        in_flight[0].change_visibility(self._visibility_timeout_seconds)
+        in_flight[1] = time.time()
 
     @staticmethod
     def _get_body(message):
@@ -116,3 +217,141 @@ class SqsJsonMessageBroker(MessageBroker):
         self._queue = conn.create_queue(self._queue_name)
         self._queue.set_message_class(self._message_class)
         return self._queue
+
+    @property
+    def pool(self):
+        if self._pool:
+            return self._pool
+        self._pool = ThreadPool(self._handler_pool_size)
+        return self._pool
+
+
+class PostgresMessageBroker(MessageBroker):
+    # Messages live in the message_queue table (created by the add_message_queue migration) and are claimed with
+    # FOR UPDATE SKIP LOCKED (postgres 9.5+), while consumers are woken up with LISTEN/NOTIFY.  A claimed message stays
+    # invisible to other consumers for lease_seconds.  Handling goes through the same message table bookkeeping as
+    # SqsJsonMessageBroker, so a message redelivered after its lease ran out (a slow handler, or a crash between
+    # handling and deleting it) is not handled twice, and a lost handler is reported with previous_handler_failed=True.
+    def __init__(self, queue_name, lease_seconds=300, database_uri=None):
+        self._queue_name = queue_name
+        self._lease_seconds = lease_seconds
+        self._database_uri = database_uri
+        self._channel = 'dart_queue_' + queue_name
+        self._engine = None
+        self._listener = None
+        self._message_service = None
+        # message id -> time its lease was last extended, for the message being handled
+        self._in_flight = {}
+
+    def set_app_context(self, app_context):
+        self._database_uri = self._database_uri or app_context.config['flask']['SQLALCHEMY_DATABASE_URI']
+        self._message_service = app_context.get(MessageService)
+
+    def send_message(self, message, delay_seconds=0):
+        # a dedicated engine keeps sends independent of whatever transaction the caller has open on db.session,
+        # and the notification is only delivered once the insert commits
+        with self.engine.begin() as conn:
+            conn.execute(
+                text("""
+                    INSERT INTO message_queue (id, version_id, created, updated, queue_name, message_body,
+                                               visible_after, receive_count)
+                    VALUES (:id, 0, NOW(), NOW(), :queue_name, :message_body,
+                            NOW() + :delay_seconds * INTERVAL '1 second', 0)
+                    """),
+                id=random_id(), queue_name=self._queue_name, message_body=json.dumps(message),
+                delay_seconds=delay_seconds
+            )
+            conn.execute(text("SELECT pg_notify(:channel, '')"), channel=self._channel)
+
+    def receive_message(self, handler, wait_time_seconds=20):
+        # randomly purge old messages
+        if random.randint(0, 100) < 1:
+            self._message_service.purge_old_messages()
+
+        # drop stale notifications before claiming, anything sent after this point will still wake us up below
+        self.listener.drain()
+
+        claimed = self._claim_message()
+        if not claimed:
+            # wake up for a new message, or when a delayed (or leased) one becomes visible
+            self.listener.await_notifications(self._seconds_until_visible(wait_time_seconds))
+            claimed = self._claim_message()
+            if not claimed:
+                # nothing arrived, or another consumer got there first
+                return
+
+        message_id, message_body = claimed
+        self._in_flight[message_id] = time.time()
+        try:
+            handle_tracked_message(self._message_service, message_id, json.loads(message_body), handler,
+                                   lambda: self._delete_message(message_id))
+        finally:
+            self._in_flight.pop(message_id, None)
+
+    def extend_visibility(self, message_id):
+        extended_at = self._in_flight.get(message_id)
+        if extended_at is None or time.time() - extended_at < self._lease_seconds / 3.0:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(
+                text("""
+                    UPDATE message_queue
+                    SET visible_after = NOW() + :lease_seconds * INTERVAL '1 second', updated = NOW()
+                    WHERE id = :id
+                    """),
+                id=message_id, lease_seconds=self._lease_seconds
+            )
+        self._in_flight[message_id] = time.time()
+
+    def _delete_message(self, message_id):
+        with self.engine.begin() as conn:
+            conn.execute(text('DELETE FROM message_queue WHERE id = :id'), id=message_id)
+
+    def _claim_message(self):
+        with self.engine.begin() as conn:
+            return conn.execute(
+                text("""
+                    UPDATE message_queue
+                    SET receive_count = receive_count + 1,
+                        visible_after = NOW() + :lease_seconds * INTERVAL '1 second',
+                        updated = NOW()
+                    WHERE id = (
+                        SELECT id
+                        FROM message_queue
+                        WHERE queue_name = :queue_name AND visible_after <= NOW()
+                        ORDER BY created
+                        LIMIT 1
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING id, message_body
+                    """),
+                queue_name=self._queue_name, lease_seconds=self._lease_seconds
+            ).first()
+
+    def _seconds_until_visible(self, wait_time_seconds):
+        with self.engine.begin() as conn:
+            seconds = conn.execute(
+                text("""
+                    SELECT EXTRACT(EPOCH FROM MIN(visible_after) - NOW())
+                    FROM message_queue
+                    WHERE queue_name = :queue_name
+                    """),
+                queue_name=self._queue_name
+            ).scalar()
+        if seconds is None:
+            return wait_time_seconds
+        return min(wait_time_seconds, max(float(seconds), 0))
+
+    @property
+    def engine(self):
+        if self._engine:
+            return self._engine
+        self._engine = create_engine(self._database_uri, pool_size=2)
+        return self._engine
+
+    @property
+    def listener(self):
+        if self._listener:
+            return self._listener
+        self._listener = PostgresNotificationListener(self._database_uri, self._channel)
+        return self._listener
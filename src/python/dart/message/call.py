@@ -6,3 +6,7 @@ class TriggerCall(object):
 
 class SubscriptionCall(object):
     GENERATE = 'GENERATE'
+    DELETE_SUBSCRIPTION = 'DELETE_SUBSCRIPTION'
+    DELETE_WORKFLOW = 'DELETE_WORKFLOW'
+    DELETE_WORKFLOW_INSTANCES = 'DELETE_WORKFLOW_INSTANCES'
+    DELETE_DATASTORE = 'DELETE_DATASTORE'
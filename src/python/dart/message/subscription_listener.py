@@ -14,15 +14,21 @@ _logger = logging.getLogger(__name__)
 @injectable
 class SubscriptionListener(object):
     def __init__(self, subscription_broker, subscription_service, subscription_element_service, trigger_service,
-                 subscription_batch_trigger_processor, emailer):
+                 subscription_batch_trigger_processor, workflow_service, datastore_service, emailer):
         self._subscription_broker = subscription_broker
         self._subscription_service = subscription_service
         self._subscription_element_service = subscription_element_service
         self._trigger_service = trigger_service
         self._subscription_batch_trigger_processor = subscription_batch_trigger_processor
+        self._workflow_service = workflow_service
+        self._datastore_service = datastore_service
         self._emailer = emailer
         self._handlers = {
-            SubscriptionCall.GENERATE: self._handle_create_subscription_call
+            SubscriptionCall.GENERATE: self._handle_create_subscription_call,
+            SubscriptionCall.DELETE_SUBSCRIPTION: self._handle_delete_subscription_call,
+            SubscriptionCall.DELETE_WORKFLOW: self._handle_delete_workflow_call,
+            SubscriptionCall.DELETE_WORKFLOW_INSTANCES: self._handle_delete_workflow_instances_call,
+            SubscriptionCall.DELETE_DATASTORE: self._handle_delete_datastore_call,
         }
 
     def await_call(self, wait_time_seconds=20):
@@ -51,20 +57,27 @@ class SubscriptionListener(object):
         #     - http://docs.aws.amazon.com/AmazonS3/latest/dev/notification-content-structure.html
         #     - dart/tools/sample-s3event_sqs-message.json
         #
+        elements = []
+        subscriptions_by_id = {}
         for record in json.loads(message['Message'])['Records']:
             if not record['eventName'].startswith('ObjectCreated:'):
                 continue
             s3_path = 's3://' + record['s3']['bucket']['name'] + '/' + urllib.unquote(record['s3']['object']['key'])
             size = record['s3']['object']['size']
             for subscription in self._subscription_service.find_matching_subscriptions(s3_path):
-                success = self._subscription_element_service.conditional_insert_subscription_element(
-                    subscription, s3_path, size
-                )
-                if success:
-                    self._trigger_service.evaluate_subscription_triggers(subscription)
+                subscriptions_by_id[subscription.id] = subscription
+                elements.append((subscription.id, s3_path, size))
+
+        # all records go in with one insert, and triggers are evaluated once per subscription that gained elements
+        inserted_subscription_ids = self._subscription_element_service.insert_subscription_elements(elements)
+        for subscription_id in set(inserted_subscription_ids):
+            self._trigger_service.evaluate_subscription_triggers(subscriptions_by_id[subscription_id])
 
     def _handle_create_subscription_call(self, message_id, message, previous_handler_failed):
-        subscription = self._subscription_service.get_subscription(message['subscription_id'])
+        subscription = self._subscription_service.get_subscription(message['subscription_id'], raise_when_missing=False)
+        if not subscription or subscription.data.state == SubscriptionState.DELETING:
+            _logger.info('skipping generation of deleted subscription (id=%s)' % message['subscription_id'])
+            return
         subscription = self._subscription_service.update_subscription_message_id(subscription, message_id)
 
         if previous_handler_failed:
@@ -75,3 +88,25 @@ class SubscriptionListener(object):
         self._subscription_element_service.generate_subscription_elements(subscription)
         self._trigger_service.evaluate_subscription_triggers(subscription)
         self._emailer.send_subscription_completed_email(subscription)
+
+    # the purges pick up where an earlier (failed or interrupted) attempt left off, so a redelivered message is
+    # simply handled again.  while a purge runs, the message is kept invisible after every batch so that it isn't
+    # redelivered (and purged concurrently) just because the purge outlasts the queue's visibility timeout
+    # noinspection PyUnusedLocal
+    def _handle_delete_subscription_call(self, message_id, message, previous_handler_failed):
+        self._subscription_service.purge_subscription(message['subscription_id'], self._keep_alive(message_id))
+
+    # noinspection PyUnusedLocal
+    def _handle_delete_workflow_call(self, message_id, message, previous_handler_failed):
+        self._workflow_service.purge_workflow(message['workflow_id'])
+
+    # noinspection PyUnusedLocal
+    def _handle_delete_workflow_instances_call(self, message_id, message, previous_handler_failed):
+        self._workflow_service.purge_workflow_instances(message['workflow_id'], self._keep_alive(message_id))
+
+    # noinspection PyUnusedLocal
+    def _handle_delete_datastore_call(self, message_id, message, previous_handler_failed):
+        self._datastore_service.purge_datastore(message['datastore_id'])
+
+    def _keep_alive(self, message_id):
+        return lambda: self._subscription_broker.extend_visibility(message_id)
@@ -14,3 +14,18 @@ class SubscriptionProxy(object):
         state = subscription.data.state
         assert state == SubscriptionState.QUEUED, 'expected subscription (id=%s) to be in QUEUED state' % sid
         self._subscription_broker.send_message({'call': SubscriptionCall.GENERATE, 'subscription_id': sid})
+
+    def delete_subscription(self, subscription_id):
+        self._subscription_broker.send_message({'call': SubscriptionCall.DELETE_SUBSCRIPTION,
+                                                'subscription_id': subscription_id})
+
+    def delete_workflow(self, workflow_id):
+        self._subscription_broker.send_message({'call': SubscriptionCall.DELETE_WORKFLOW, 'workflow_id': workflow_id})
+
+    def delete_workflow_instances(self, workflow_id):
+        self._subscription_broker.send_message({'call': SubscriptionCall.DELETE_WORKFLOW_INSTANCES,
+                                                'workflow_id': workflow_id})
+
+    def delete_datastore(self, datastore_id):
+        self._subscription_broker.send_message({'call': SubscriptionCall.DELETE_DATASTORE,
+                                                'datastore_id': datastore_id})
@@ -73,7 +73,12 @@ class TriggerListener(object):
             _logger.error('previous handler for message id=%s failed... see if retrying is possible' % message_id)
             return
 
-        datastore = self._datastore_service.get_datastore(message['datastore_id'])
+        datastore_id = message['datastore_id']
+        datastore = self._datastore_service.get_datastore(datastore_id, raise_when_missing=False)
+        if not datastore or datastore.data.state == DatastoreState.DELETING:
+            _logger.info('datastore (id=%s) is deleted or being deleted' % datastore_id)
+            return
+
         running_or_queued_workflow_ids = self._action_service.find_running_or_queued_action_workflow_ids(datastore.id)
         exists_non_workflow_action = self._action_service.exists_running_or_queued_non_workflow_action(datastore.id)
         next_action = self._action_service.find_next_runnable_action(
@@ -114,18 +119,21 @@ class TriggerListener(object):
                 if action.data.on_failure == ActionOnFailure.DEACTIVATE:
                     try_next_action = False
                     if wf and wfi:
-                        self._workflow_service.update_workflow_state(wf, WorkflowState.INACTIVE)
-                        self._workflow_service.update_workflow_instance_state(wfi, WorkflowInstanceState.FAILED)
+                        # anything being deleted keeps its DELETING state
+                        if wf.data.state != WorkflowState.DELETING:
+                            self._workflow_service.update_workflow_state(wf, WorkflowState.INACTIVE)
+                        if wfi.data.state != WorkflowInstanceState.DELETING:
+                            self._workflow_service.update_workflow_instance_state(wfi, WorkflowInstanceState.FAILED)
                         f1 = Filter('workflow_instance_id', Operator.EQ, wfiid)
                         f2 = Filter('state', Operator.EQ, ActionState.HAS_NEVER_RUN)
                         for a in self._action_service.query_actions_all(filters=[f1, f2]):
                             error_msg = 'A prior action (id=%s) in this workflow instance failed' % action.id
                             self._action_service.update_action_state(a, ActionState.SKIPPED, error_msg)
                         if wf.data.on_failure == WorkflowOnFailure.DEACTIVATE:
-                            self._datastore_service.update_datastore_state(datastore, DatastoreState.INACTIVE)
+                            self._deactivate_datastore(datastore)
                         callbacks.append(lambda: self._emailer.send_workflow_failed_email(wf, wfi))
                     else:
-                        self._datastore_service.update_datastore_state(datastore, DatastoreState.INACTIVE)
+                        self._deactivate_datastore(datastore)
                 else:
                     if wfi and action.data.last_in_workflow:
                         self._handle_complete_workflow(callbacks, wf, wfi, wfid)
@@ -143,8 +151,13 @@ class TriggerListener(object):
         if try_next_action:
             self._trigger_proxy.try_next_action(datastore.id)
 
+    def _deactivate_datastore(self, datastore):
+        if datastore.data.state != DatastoreState.DELETING:
+            self._datastore_service.update_datastore_state(datastore, DatastoreState.INACTIVE)
+
     def _handle_complete_workflow(self, callbacks, wf, wfi, wfid):
-        self._workflow_service.update_workflow_instance_state(wfi, WorkflowInstanceState.COMPLETED)
+        if wfi.data.state != WorkflowInstanceState.DELETING:
+            self._workflow_service.update_workflow_instance_state(wfi, WorkflowInstanceState.COMPLETED)
         self._trigger_proxy.trigger_workflow_completion(wfid)
         self._trigger_subscription_evaluations(wfi.data.trigger_id)
         if wf.data.on_success_email:
@@ -1,14 +1,27 @@
+import logging
+import math
+import threading
+import time
+
 from dart.context.locator import injectable
 from dart.message.call import TriggerCall
 from dart.trigger.subscription import subscription_batch_trigger
 from dart.trigger.workflow import workflow_completion_trigger
 from dart.trigger.super import super_trigger
 
+_logger = logging.getLogger(__name__)
+
 
 @injectable
 class TriggerProxy(object):
-    def __init__(self, trigger_broker):
+    def __init__(self, trigger_broker, dart_config, clock=time.time):
         self._trigger_broker = trigger_broker
+        self._try_next_action_window_seconds = dart_config['dart'].get('try_next_action_coalesce_seconds', 1)
+        self._clock = clock
+        self._try_next_action_lock = threading.Lock()
+        # datastore_id -> [window end time, whether the trailing call for that window has been sent]
+        self._try_next_action_windows = {}
+        self.try_next_action_merged_count = 0
 
     def process_trigger(self, trigger_type, message):
         """ :type trigger_type: dart.model.trigger.TriggerType
@@ -17,8 +30,40 @@ class TriggerProxy(object):
         self._trigger_broker.send_message(args)
 
     def try_next_action(self, datastore_id):
+        if self._try_next_action_window_seconds <= 0:
+            self._send_try_next_action(datastore_id)
+            return
+
+        # the first call for a datastore is sent right away and opens a window.  the first call made during that
+        # window is sent with a delay that lasts until the window ends, and any others are dropped, so the listener
+        # still evaluates the datastore after the last call without this process having to send anything later
+        now = self._clock()
+        with self._try_next_action_lock:
+            self._evict_expired_try_next_action_windows(now)
+            window = self._try_next_action_windows.get(datastore_id)
+            if not window:
+                self._try_next_action_windows[datastore_id] = [now + self._try_next_action_window_seconds, False]
+                delay_seconds = 0
+            elif not window[1]:
+                window[1] = True
+                delay_seconds = int(math.ceil(window[0] - now))
+                self.try_next_action_merged_count += 1
+            else:
+                self.try_next_action_merged_count += 1
+                return
+
+        if delay_seconds:
+            _logger.info('sending delayed try_next_action for datastore (id=%s), %s calls merged so far'
+                         % (datastore_id, self.try_next_action_merged_count))
+        self._send_try_next_action(datastore_id, delay_seconds)
+
+    def _evict_expired_try_next_action_windows(self, now):
+        for datastore_id in [k for k, w in self._try_next_action_windows.iteritems() if w[0] <= now]:
+            del self._try_next_action_windows[datastore_id]
+
+    def _send_try_next_action(self, datastore_id, delay_seconds=0):
         args = {'call': TriggerCall.TRY_NEXT_ACTION, 'datastore_id': datastore_id}
-        self._trigger_broker.send_message(args)
+        self._trigger_broker.send_message(args, delay_seconds)
 
     def complete_action(self, action_id, action_state, error_message):
         args = {'call': TriggerCall.COMPLETE_ACTION, 'action_id': action_id, 'action_state': action_state,
@@ -20,56 +20,152 @@ class BaseModel(object):
         return self.from_dict(self.to_dict())
 
 
+def _identity(value):
+    return value
+
+
+def _encode_dictable(value):
+    return {field: to_dict(v) for field, v in vars(value).iteritems()}
+
+
+def _encode_dict(value):
+    return {k: to_dict(v) for k, v in value.iteritems()}
+
+
+def _encode_list(value):
+    return [to_dict(v) for v in value]
+
+
+def _encode_date(value):
+    return value.isoformat()
+
+
+# exact type -> encoder, so the common cases skip the isinstance/hasattr chain.  @dictable classes register here.
+_encoders_by_type = {
+    str: _identity,
+    unicode: _identity,
+    int: _identity,
+    long: _identity,
+    float: _identity,
+    bool: _identity,
+    datetime.datetime: _encode_date,
+    datetime.date: _encode_date,
+    dict: _encode_dict,
+    list: _encode_list,
+}
+
+
 def to_dict(value):
     if not value:
         return value
+    encoder = _encoders_by_type.get(type(value))
+    if encoder:
+        return encoder(value)
     if isinstance(value, datetime.datetime):
         return value.isoformat()
     if isinstance(value, datetime.date):
         return value.isoformat()
     if isinstance(value, dict):
-        return {k: to_dict(v) for k, v in value.iteritems()}
+        return _encode_dict(value)
     if isinstance(value, list):
-        return [to_dict(v) for v in value]
+        return _encode_list(value)
     if hasattr(value, '__dictable_public_fields_with_defaults'):
-        return {field: to_dict(getattr(value, field)) for field in vars(value)}
+        return _encode_dictable(value)
     return value
 
 
 def from_dict(cls, dict_obj):
+    plan = cls.__dict__.get('_dictable_decode_plan')
+    if plan is None:
+        plan = _compile_decode_plan(cls)
     args = {}
+    for field, default, decoder in plan:
+        args[field] = decoder(dict_obj.get(field, default))
+    return cls(**args)
+
+
+def _compile_decode_plan(cls):
+    plan = []
     for field, default in cls.__dictable_public_fields_with_defaults:
         field_typestr = cls.__dictable_public_field_typestr_by_name.get(field)
-        value = decode_from_dict(field_typestr, dict_obj.get(field, default))
-        args[field] = value
-    return cls(**args)
+        plan.append((field, default, _decoder(field_typestr)))
+    cls._dictable_decode_plan = plan
+    return plan
 
 
-def decode_from_dict(field_typestr, value):
-    if not value or not field_typestr:
+# the format produced by datetime.isoformat() for naive datetimes, which is what to_dict writes
+_isoformat_pattern = re.compile(r'^(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.(\d{6}))?$')
+
+
+def _decode_datetime(value):
+    if not value or isinstance(value, datetime.datetime):
         return value
+    m = _isoformat_pattern.match(value)
+    if m:
+        return datetime.datetime(*[int(g) for g in m.groups() if g is not None])
+    return dateutil.parser.parse(value)
+
+
+def decode_from_dict(field_typestr, value):
+    return _decoder(field_typestr)(value)
+
+
+_decoders_by_typestr = {}
+
+
+def _decoder(field_typestr):
+    """ returns a function that decodes values for the given type string, built once per distinct type string """
+    decoder = _decoders_by_typestr.get(field_typestr)
+    if decoder is None:
+        decoder = _compile_decoder(field_typestr)
+        _decoders_by_typestr[field_typestr] = decoder
+    return decoder
+
+
+def _compile_decoder(field_typestr):
+    if not field_typestr:
+        return _identity
 
     if field_typestr == 'datetime.datetime':
-        return dateutil.parser.parse(value)
+        return _decode_datetime
+
     if field_typestr == 'datetime.date':
-        return dateutil.parser.parse(value).date()
+        def decode_date(value):
+            return dateutil.parser.parse(value).date() if value else value
+        return decode_date
+
     if field_typestr.startswith('dict'):
         if field_typestr == 'dict':
-            return value
+            return _identity
         # ensure sensible keys
         assert field_typestr[:9] == 'dict[str,'
-        dict_value_typestr = field_typestr[9:-1]
-        return {k: decode_from_dict(dict_value_typestr, v) for k, v in value.iteritems()}
+        decode_dict_value = _decoder(field_typestr[9:-1])
+
+        def decode_dict(value):
+            return {k: decode_dict_value(v) for k, v in value.iteritems()} if value else value
+        return decode_dict
 
     if field_typestr.startswith('list'):
-        list_typestr = field_typestr[5:-1]
-        return [decode_from_dict(list_typestr, v) for v in value]
+        decode_list_item = _decoder(field_typestr[5:-1])
 
-    cls = locate(field_typestr)
-    if hasattr(cls, '__dictable_public_fields_with_defaults'):
-        return from_dict(cls, value)
+        def decode_list(value):
+            return [decode_list_item(v) for v in value] if value else value
+        return decode_list
 
-    return cls(value)
+    # classes are resolved on first use rather than here, since a model may reference one defined later on
+    resolved = []
+
+    def decode_class(value):
+        if not value:
+            return value
+        if not resolved:
+            cls = locate(field_typestr)
+            if hasattr(cls, '__dictable_public_fields_with_defaults'):
+                resolved.append(lambda v: from_dict(cls, v))
+            else:
+                resolved.append(cls)
+        return resolved[0](value)
+    return decode_class
 
 
 def dictable(cls):
@@ -89,7 +185,9 @@ def dictable(cls):
     assert kwargs is None
 
     cls.__dictable_public_fields_with_defaults = list(izip_longest(reversed(arg_names[1:]), reversed(defaults or [])))
-    cls.to_dict = lambda self: to_dict(self)
+    cls._dictable_decode_plan = None
+    _encoders_by_type[cls] = _encode_dictable
+    cls.to_dict = lambda self: _encode_dictable(self)
     cls.from_dict = classmethod(lambda clz, dict_obj: from_dict(clz, dict_obj))
 
     return cls
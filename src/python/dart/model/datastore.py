@@ -23,6 +23,8 @@ class DatastoreState(object):
     ACTIVE = 'ACTIVE'
     DONE = 'DONE'
     TEMPLATE = 'TEMPLATE'
+    # set by DELETE /datastore/<id> only, so it is left out of all() (the schema enum) and can't be left again
+    DELETING = 'DELETING'
 
     @staticmethod
     def all():
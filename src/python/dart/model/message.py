@@ -37,3 +37,26 @@ class Message(BaseModel):
         self.ecs_family = ecs_family
         self.ecs_task_arn = ecs_task_arn
         self.state = state
+
+
+@dictable
+class QueuedMessage(BaseModel):
+    def __init__(self, id, version_id, created, updated, queue_name, message_body, visible_after, receive_count=0):
+        """
+        :type id: str
+        :type version_id: int
+        :type created: datetime.datetime
+        :type updated: datetime.datetime
+        :type queue_name: str
+        :type message_body: str
+        :type visible_after: datetime.datetime
+        :type receive_count: int
+        """
+        self.id = id
+        self.version_id = version_id
+        self.created = created
+        self.updated = updated
+        self.queue_name = queue_name
+        self.message_body = message_body
+        self.visible_after = visible_after
+        self.receive_count = receive_count
@@ -1,8 +1,7 @@
-import json
-
 from flask.ext.jsontools import JsonSerializableBase
-from sqlalchemy import BigInteger, Column, Integer, TIMESTAMP, String, Text
+from sqlalchemy import BigInteger, Column, Float, Index, Integer, PrimaryKeyConstraint, TIMESTAMP, String, Text, text
 from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import validates
 from dart.model.action import Action
 
 from dart.model.dataset import Dataset
@@ -11,12 +10,12 @@ from dart.context.database import db
 from dart.model.engine import Engine
 from dart.model.event import Event
 from dart.model.graph import SubGraphDefinition
-from dart.model.message import Message
+from dart.model.message import Message, QueuedMessage
 from dart.model.mutex import Mutex
 from dart.model.subscription import Subscription, SubscriptionElement
 from dart.model.trigger import Trigger
 from dart.model.workflow import Workflow, WorkflowInstance
-from dart.util.json_util import DartJsonEncoder
+from dart.util.json_util import copy_json
 
 
 class VersionedAuditableSerializable(JsonSerializableBase):
@@ -28,12 +27,19 @@ class VersionedAuditableSerializable(JsonSerializableBase):
     __modelclass__ = None
 
     def to_model(self):
-        return self.__modelclass__.from_dict(json.loads(json.dumps(self, cls=DartJsonEncoder)))
+        # built straight from the column values - the JSONB data is copied so the model never aliases the dao
+        values = {p.key: copy_json(getattr(self, p.key)) for p in self.__mapper__.column_attrs}
+        return self.__modelclass__.from_dict(values)
 
 
 class VersionedAuditableData(VersionedAuditableSerializable):
     data = Column(JSONB)
 
+    @classmethod
+    def promoted_column_values(cls, data):
+        """ values for any columns that mirror fields of data, keyed by column name """
+        return {}
+
 
 class EngineDao(db.Model, VersionedAuditableData):
     __tablename__ = 'engine'
@@ -55,6 +61,35 @@ class DatasetDao(db.Model, VersionedAuditableData):
 class ActionDao(db.Model, VersionedAuditableData):
     __tablename__ = 'action'
     __modelclass__ = Action
+    # hot fields copied out of the JSONB data so the worker and listener queries can use btree indexes
+    state = Column(String(length=50))
+    datastore_id = Column(String(length=36))
+    workflow_id = Column(String(length=36))
+    order_idx = Column(Float)
+    __table_args__ = (
+        Index('ix_action_datastore_id_state_order_idx', 'datastore_id', 'state', 'order_idx'),
+        Index('ix_action_workflow_id_state', 'workflow_id', 'state'),
+        Index('ix_action_state_updated', 'state', 'updated'),
+        Index('ix_action_updated_id', 'updated', 'id'),
+        Index('ix_action_created_id', 'created', 'id'),
+    )
+
+    @classmethod
+    def promoted_column_values(cls, data):
+        values = data or {}
+        order_idx = values.get('order_idx')
+        return {
+            'state': values.get('state'),
+            'datastore_id': values.get('datastore_id'),
+            'workflow_id': values.get('workflow_id'),
+            'order_idx': float(order_idx) if order_idx is not None else None,
+        }
+
+    @validates('data')
+    def _sync_promoted_columns(self, key, data):
+        for column, value in self.promoted_column_values(data).iteritems():
+            setattr(self, column, value)
+        return data
 
 
 class DatastoreDao(db.Model, VersionedAuditableData):
@@ -90,6 +125,7 @@ class SubscriptionDao(db.Model, VersionedAuditableData):
 class SubscriptionElementDao(db.Model, VersionedAuditableSerializable):
     __tablename__ = 'subscription_element'
     __modelclass__ = SubscriptionElement
+    id = Column(String(length=36), nullable=False)
     subscription_id = Column(String(length=36), nullable=False)
     s3_path = Column(String(length=1024), nullable=False)
     file_size = Column(BigInteger, nullable=False)
@@ -97,6 +133,38 @@ class SubscriptionElementDao(db.Model, VersionedAuditableSerializable):
     action_id = Column(String(length=36))
     batch_id = Column(String(length=36))
     processed = Column(TIMESTAMP)
+    # matches the partitioned table (see dart/tool/migration/partition_subscription_element.py), where the primary
+    # key has to include the partition key
+    __table_args__ = (
+        PrimaryKeyConstraint('subscription_id', 'id'),
+        Index('ix_subscription_element_subscription_id_s3_path', 'subscription_id', 's3_path', unique=True),
+        Index('ix_subscription_element_action_id_s3_path', 'action_id', 's3_path'),
+        Index('ix_subscription_element_processed_consumed', 'processed', postgresql_where=text("state = 'CONSUMED'")),
+    )
+
+
+class SubscriptionElementArchiveDao(db.Model):
+    """ CONSUMED subscription elements moved out of subscription_element once they pass the retention age, keeping
+        only what is needed to replay them (see SubscriptionElementService.archive_subscription_elements) """
+    __tablename__ = 'subscription_element_archive'
+    subscription_id = Column(String(length=36), primary_key=True)
+    s3_path = Column(String(length=1024), primary_key=True)
+    id = Column(String(length=36), nullable=False)
+    created = Column(TIMESTAMP)
+    updated = Column(TIMESTAMP)
+    file_size = Column(BigInteger, nullable=False)
+    action_id = Column(String(length=36))
+    processed = Column(TIMESTAMP)
+
+
+class SubscriptionElementCounterDao(db.Model):
+    """ the running count and file size sum of a subscription's elements in each state, kept up to date by the
+        statements in SubscriptionElementService that insert elements or change their state """
+    __tablename__ = 'subscription_element_counter'
+    subscription_id = Column(String(length=36), primary_key=True)
+    state = Column(String(length=50), primary_key=True)
+    count = Column(BigInteger, nullable=False, server_default='0')
+    file_size_sum = Column(BigInteger, nullable=False, server_default='0')
 
 
 class MessageDao(db.Model, VersionedAuditableSerializable):
@@ -111,6 +179,16 @@ class MessageDao(db.Model, VersionedAuditableSerializable):
     state = Column(String(length=50), nullable=False)
 
 
+class QueuedMessageDao(db.Model, VersionedAuditableSerializable):
+    __tablename__ = 'message_queue'
+    __modelclass__ = QueuedMessage
+    queue_name = Column(String(length=255), nullable=False)
+    message_body = Column(Text(), nullable=False)
+    visible_after = Column(TIMESTAMP, nullable=False, server_default=db.func.current_timestamp())
+    receive_count = Column(Integer, nullable=False, server_default='0')
+    __table_args__ = (Index('message_queue_queue_name_visible_after_idx', queue_name, visible_after),)
+
+
 class MutexDao(db.Model, VersionedAuditableSerializable):
     __tablename__ = 'mutex'
     __modelclass__ = Mutex
@@ -24,6 +24,8 @@ class SubscriptionState(object):
     GENERATING = 'GENERATING'
     FAILED = 'FAILED'
     ACTIVE = 'ACTIVE'
+    # set by DELETE /subscription/<id> only, so it is left out of all() (the schema enum) and can't be left again
+    DELETING = 'DELETING'
 
     @staticmethod
     def all():
@@ -75,6 +77,11 @@ class SubscriptionElementState(object):
     ASSIGNED = 'ASSIGNED'
     CONSUMED = 'CONSUMED'
 
+    @staticmethod
+    def all():
+        return [SubscriptionElementState.UNCONSUMED, SubscriptionElementState.RESERVED,
+                SubscriptionElementState.ASSIGNED, SubscriptionElementState.CONSUMED]
+
 
 @dictable
 class SubscriptionElement(BaseModel):
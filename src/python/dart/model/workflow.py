@@ -21,6 +21,8 @@ class Workflow(BaseModel):
 class WorkflowState(object):
     ACTIVE = 'ACTIVE'
     INACTIVE = 'INACTIVE'
+    # set by DELETE /workflow/<id> only, so it is left out of all() (the schema enum) and can't be left again
+    DELETING = 'DELETING'
 
     @staticmethod
     def all():
@@ -70,6 +72,8 @@ class WorkflowInstanceState(object):
     RUNNING = 'RUNNING'
     COMPLETED = 'COMPLETED'
     FAILED = 'FAILED'
+    # set by DELETE /workflow/<id>/instance only, so it is left out of all() (the schema enum) and can't be left again
+    DELETING = 'DELETING'
 
     @staticmethod
     def all():
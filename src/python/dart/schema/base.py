@@ -2,6 +2,7 @@ from jsonschema import Draft4Validator
 from jsonschema.exceptions import best_match
 
 from dart.model.exception import DartValidationException
+from dart.util.json_util import copy_json
 
 
 def apply_defaults(instance, schema):
@@ -15,12 +16,73 @@ def apply_defaults(instance, schema):
 
 
 def default_and_validate(model, schema):
-    instance = model.to_dict()
-    apply_defaults(instance, schema)
-    errors = list(Draft4Validator(schema).iter_errors(instance))
-    if len(errors) > 0:
-        raise DartValidationException(str(best_match(errors)))
-    return model.from_dict(instance)
+    return SchemaValidator(schema).default_and_validate(model)
+
+
+class SchemaValidator(object):
+    """ a schema along with its validator and the plan for applying its defaults, so both can be reused """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self._validator = Draft4Validator(schema)
+        self._defaults_plan = _compile_defaults_plan(schema)
+
+    def default_and_validate(self, model):
+        instance = model.to_dict()
+        _apply_defaults_plan(instance, self._defaults_plan)
+        errors = list(self._validator.iter_errors(instance))
+        if len(errors) > 0:
+            raise DartValidationException(str(best_match(errors)))
+        return model.from_dict(instance)
+
+
+def _compile_defaults_plan(schema):
+    """ the same walk as apply_defaults, reduced to the properties that have (or contain) defaults """
+    plan = []
+    if not schema:
+        return plan
+    for prop, subschema in schema.get('properties', {}).iteritems():
+        if not subschema:
+            continue
+        has_default = 'default' in subschema
+        subplan = _compile_defaults_plan(subschema)
+        if has_default or subplan:
+            plan.append((prop, has_default, subschema.get('default'), subplan))
+    return plan
+
+
+def _apply_defaults_plan(instance, plan):
+    if not instance:
+        return
+    for prop, has_default, default, subplan in plan:
+        if has_default and instance.get(prop) is None:
+            # copied, since the cached schema's default must not end up shared with (and mutated through) a model
+            instance[prop] = copy_json(default)
+        if subplan and prop in instance:
+            _apply_defaults_plan(instance[prop], subplan)
+
+
+_schema_validators = {}
+
+
+def cached_schema_validator(key, version, schema_factory):
+    """ returns the SchemaValidator cached under key, building it from schema_factory() if it is missing or was
+        built for a different version of whatever the schema is derived from (e.g. an engine's version_id)
+
+        :type key: tuple
+        :rtype: SchemaValidator """
+    entry = _schema_validators.get(key)
+    if entry and entry[0] == version:
+        return entry[1]
+    schema_validator = SchemaValidator(schema_factory())
+    _schema_validators[key] = (version, schema_validator)
+    return schema_validator
+
+
+def evict_schema_validators(owner):
+    """ drops cached validators whose key names owner as its second element, e.g. ('action', engine_name, ...) """
+    for key in [k for k in _schema_validators.keys() if len(k) > 1 and k[1] == owner]:
+        _schema_validators.pop(key, None)
 
 
 def base_schema(data_json_schema):
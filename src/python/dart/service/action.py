@@ -1,6 +1,7 @@
 from datetime import datetime, timedelta
+import json
 
-from sqlalchemy import Float, func, desc, not_, or_
+from sqlalchemy import func, desc, not_, or_, text, tuple_
 from sqlalchemy.sql.expression import nullslast
 
 from dart.context.database import db
@@ -11,7 +12,7 @@ from dart.model.exception import DartValidationException
 from dart.model.orm import ActionDao, DatastoreDao
 from dart.model.query import Direction, OrderBy
 from dart.schema.action import action_schema
-from dart.schema.base import default_and_validate
+from dart.schema.base import cached_schema_validator
 from dart.service.patcher import patch_difference, retry_stale_data
 from dart.util.rand import random_id
 
@@ -27,7 +28,7 @@ class ActionService(object):
         """ :type actions: list[dart.model.action.Action]
             :type datastore: dart.model.datastore.Datastore """
 
-        engine = self._engine_service.get_engine_by_name(engine_name)
+        engine = self._engine_service.get_cached_engine(engine_name)
         assert isinstance(engine, Engine)
         action_types_by_name = {at.name: at for at in engine.data.supported_action_types}
 
@@ -42,7 +43,7 @@ class ActionService(object):
             action_dao.id = random_id()
 
             action_type = action_types_by_name.get(action.data.action_type_name)
-            action = self.default_and_validate_action(action, action_type)
+            action = self.default_and_validate_action(action, action_type, engine)
 
             action_dao.data = action.data.to_dict()
             db.session.add(action_dao)
@@ -53,9 +54,10 @@ class ActionService(object):
             db.session.commit()
         return [a.to_model() for a in action_daos]
 
-    def default_and_validate_action(self, action, action_type=None):
+    def default_and_validate_action(self, action, action_type=None, engine=None):
+        if not engine:
+            engine = self._engine_service.get_cached_engine(action.data.engine_name)
         if not action_type:
-            engine = self._engine_service.get_engine_by_name(action.data.engine_name)
             action_types_by_name = {at.name: at for at in engine.data.supported_action_types}
             action_type = action_types_by_name.get(action.data.action_type_name)
         if not action_type:
@@ -63,14 +65,18 @@ class ActionService(object):
         assert isinstance(action_type, ActionType)
         if not action.data.args:
             action.data.args = {}
-        action = default_and_validate(action, action_schema(action_type.params_json_schema))
-        return action
+        schema_validator = cached_schema_validator(
+            ('action', engine.data.name, action_type.name),
+            engine.version_id,
+            lambda: action_schema(action_type.params_json_schema)
+        )
+        return schema_validator.default_and_validate(action)
 
     @staticmethod
     def _get_max_order_idx(datastore_id):
         return db.session\
-            .query(func.max(ActionDao.data['order_idx'].cast(Float)))\
-            .filter(ActionDao.data['datastore_id'].astext == datastore_id).all()[0][0] or 0
+            .query(func.max(ActionDao.order_idx))\
+            .filter(ActionDao.datastore_id == datastore_id).all()[0][0] or 0
 
     @staticmethod
     def get_action(action_id, raise_when_missing=True):
@@ -82,6 +88,19 @@ class ActionService(object):
     def find_action_count(self, datastore_id=None, states=None, action_type_names=None, gt_order_idx=None, offset=None):
         return self._find_action_query(datastore_id, None, gt_order_idx, None, action_type_names, states, None, None, offset).count()
 
+    @staticmethod
+    def find_action_counts_by_datastore(datastore_ids, states):
+        """ :rtype: dict[str, int] """
+        if not datastore_ids:
+            return {}
+        resultset = db.session\
+            .query(ActionDao.datastore_id, func.count())\
+            .filter(ActionDao.datastore_id.in_(datastore_ids))\
+            .filter(ActionDao.state.in_(states))\
+            .group_by(ActionDao.datastore_id)\
+            .all()
+        return {r[0]: int(r[1]) for r in resultset}
+
     def find_actions(self, datastore_id=None, datastore_state=None, states=None, action_type_names=None, gt_order_idx=None, limit=None, workflow_id=None, order_by=None, offset=None):
         rs = self._find_action_query(datastore_id, datastore_state, gt_order_idx, limit, action_type_names, states, workflow_id, order_by, offset).all()
         return [a.to_model() for a in rs]
@@ -89,7 +108,7 @@ class ActionService(object):
     @staticmethod
     def find_stale_pending_actions():
         query = ActionDao.query\
-            .filter(ActionDao.data['state'].astext == ActionState.PENDING)\
+            .filter(ActionDao.state == ActionState.PENDING)\
             .filter(ActionDao.data['ecs_task_arn'] == 'null')\
             .filter(ActionDao.updated < (datetime.utcnow() - timedelta(minutes=2)))
         return [r.to_model() for r in query.all()]
@@ -97,38 +116,38 @@ class ActionService(object):
     @staticmethod
     def find_running_or_queued_action_workflow_ids(datastore_id):
         resultset = db.session\
-            .query(func.distinct(ActionDao.data['workflow_id'].astext))\
-            .filter(ActionDao.data['datastore_id'].astext == datastore_id)\
-            .filter(ActionDao.data['state'].astext.in_([ActionState.RUNNING, ActionState.QUEUED]))\
-            .filter(ActionDao.data['workflow_id'] != 'null')\
+            .query(func.distinct(ActionDao.workflow_id))\
+            .filter(ActionDao.datastore_id == datastore_id)\
+            .filter(ActionDao.state.in_([ActionState.RUNNING, ActionState.QUEUED]))\
+            .filter(ActionDao.workflow_id.isnot(None))\
             .all()
         return [r[0] for r in resultset]
 
     @staticmethod
     def exists_running_or_queued_non_workflow_action(datastore_id):
         query = ActionDao.query\
-            .filter(ActionDao.data['datastore_id'].astext == datastore_id)\
-            .filter(ActionDao.data['state'].astext.in_([ActionState.RUNNING, ActionState.QUEUED]))\
-            .filter(ActionDao.data['workflow_id'] == 'null')\
+            .filter(ActionDao.datastore_id == datastore_id)\
+            .filter(ActionDao.state.in_([ActionState.RUNNING, ActionState.QUEUED]))\
+            .filter(ActionDao.workflow_id.is_(None))\
             .limit(1)
         return len(list(query.all())) > 0
 
     @staticmethod
     def find_next_runnable_action(datastore_id, not_in_workflow_ids, ensure_workflow_action):
         query = ActionDao.query\
-            .filter(ActionDao.data['datastore_id'].astext == datastore_id)\
-            .filter(ActionDao.data['state'].astext == ActionState.HAS_NEVER_RUN)
+            .filter(ActionDao.datastore_id == datastore_id)\
+            .filter(ActionDao.state == ActionState.HAS_NEVER_RUN)
         if not_in_workflow_ids:
             query = query.filter(
                 or_(
-                    ActionDao.data['workflow_id'] == 'null',
-                    not_(ActionDao.data['workflow_id'].astext.in_(not_in_workflow_ids)),
+                    ActionDao.workflow_id.is_(None),
+                    not_(ActionDao.workflow_id.in_(not_in_workflow_ids)),
                 ).self_group()
             )
         if ensure_workflow_action:
-            query = query.filter(ActionDao.data['workflow_id'] != 'null')
+            query = query.filter(ActionDao.workflow_id.isnot(None))
         query = query\
-            .order_by(ActionDao.data['order_idx'].cast(Float))\
+            .order_by(ActionDao.order_idx)\
             .limit(1)
         result = [a for a in query.all()]
         return result[0].to_model() if result else None
@@ -137,13 +156,13 @@ class ActionService(object):
     def _find_action_query(datastore_id=None, datastore_state=None, gt_order_idx=None, limit=None, action_type_names=None, states=None, workflow_id=None, order_by=None, offset=None):
         query = ActionDao.query
         if datastore_id:
-            query = query.join(DatastoreDao, DatastoreDao.id == ActionDao.data['datastore_id'].astext)
+            query = query.join(DatastoreDao, DatastoreDao.id == ActionDao.datastore_id)
             query = query.filter(DatastoreDao.id == datastore_id)
             query = query.filter(DatastoreDao.data['state'].astext == datastore_state) if datastore_state else query
-        query = query.filter(ActionDao.data['state'].astext.in_(states)) if states else query
+        query = query.filter(ActionDao.state.in_(states)) if states else query
         query = query.filter(ActionDao.data['action_type_name'].astext.in_(action_type_names)) if action_type_names else query
-        query = query.filter(ActionDao.data['order_idx'].cast(Float) > gt_order_idx) if gt_order_idx else query
-        query = query.filter(ActionDao.data['workflow_id'].astext == workflow_id) if workflow_id else query
+        query = query.filter(ActionDao.order_idx > gt_order_idx) if gt_order_idx else query
+        query = query.filter(ActionDao.workflow_id == workflow_id) if workflow_id else query
         if order_by:
             for field, direction in order_by:
                 if direction == 'desc':
@@ -151,7 +170,7 @@ class ActionService(object):
                 else:
                     query = query.order_by(nullslast(ActionDao.data[field].astext))
         else:
-            query = query.order_by(ActionDao.data['order_idx'].cast(Float))
+            query = query.order_by(ActionDao.order_idx)
             query = query.order_by(ActionDao.created)
         query = query.limit(limit) if limit else query
         query = query.offset(offset) if offset else query
@@ -161,14 +180,39 @@ class ActionService(object):
         """ :type filters: list[dart.model.query.Filter]
             :rtype: list[dart.model.action.Action] """
         limit = 20
-        offset = 0
+        if order_by:
+            offset = 0
+            while True:
+                results = self.query_actions(filters, limit, offset, order_by)
+                if len(results) == 0:
+                    break
+                for e in results:
+                    yield e
+                offset += limit
+            return
+
+        after = None
         while True:
-            results = self.query_actions(filters, limit, offset, order_by)
+            results = self.query_actions_after(filters, limit, after)
             if len(results) == 0:
                 break
             for e in results:
                 yield e
-            offset += limit
+            after = (results[-1].created, results[-1].id)
+
+    def query_actions_after(self, filters, limit=20, after=None):
+        """ keyset pagination in (created, id) descending order, so every page costs the same regardless of depth.
+            created never changes, so unlike updated (which moves whenever an action does) an action can't jump past
+            the cursor between pages and be skipped - actions created after the first page simply aren't included.
+
+            :type filters: list[dart.model.query.Filter]
+            :param after: the (created, id) of the last action on the previous page
+            :type after: (datetime, str) """
+        query = self._query_action_query(filters)
+        if after:
+            query = query.filter(tuple_(ActionDao.created, ActionDao.id) < tuple_(*after))
+        query = query.order_by(desc(ActionDao.created), desc(ActionDao.id)).limit(limit)
+        return [a.to_model() for a in query.all()]
 
     def query_actions(self, filters, limit=20, offset=0, order_by=None):
         """ :type filters: list[dart.model.query.Filter] """
@@ -188,10 +232,7 @@ class ActionService(object):
     def _query_action_query(self, filters, order_by=None):
         """ :type filters: list[dart.model.query.Filter]
             :type order_by: list[dart.model.query.OrderBy] """
-        action_types = []
-        for engine in self._engine_service.query_engines([], 1000, 0):
-            action_types.extend(engine.data.supported_action_types)
-        action_schemas = [action_schema(a.params_json_schema) for a in action_types]
+        action_schemas = self._engine_service.engine_metadata().action_schemas
 
         query = ActionDao.query
 
@@ -220,6 +261,37 @@ class ActionService(object):
             action.data.progress = 1
         return patch_difference(ActionDao, source_action, action, True, conditional)
 
+    @staticmethod
+    def claim_queued_actions(action_ids):
+        """ atomically transitions the given QUEUED actions to PENDING.  Rows that are locked by another worker or
+            are no longer QUEUED are skipped rather than waited on, so competing workers never do wasted work.
+
+            :type action_ids: list[str]
+            :rtype: list[dart.model.action.Action]
+            :return the actions that were claimed by this caller """
+        if not action_ids:
+            return []
+        sql = """
+            UPDATE action
+            SET data = data || CAST(:pending_state AS JSONB), state = :pending, version_id = version_id + 1
+            WHERE id IN (
+                SELECT id
+                FROM action
+                WHERE id IN :action_ids AND state = :queued_state
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING *
+            """
+        statement = text(sql).bindparams(
+            action_ids=tuple(action_ids),
+            queued_state=ActionState.QUEUED,
+            pending=ActionState.PENDING,
+            pending_state=json.dumps({'state': ActionState.PENDING})
+        )
+        claimed_actions = [a.to_model() for a in ActionDao.query.from_statement(statement).populate_existing().all()]
+        db.session.commit()
+        return claimed_actions
+
     @staticmethod
     def update_action_ecs_task_arn(action, ecs_task_arn):
         """ :type action: dart.model.action.Action """
@@ -0,0 +1,62 @@
+import logging
+import time
+
+from sqlalchemy import select
+
+from dart.context.database import db
+from dart.model.exception import DartValidationException, DartConditionalUpdateFailedException
+from dart.service.patcher import patch_difference
+
+_logger = logging.getLogger(__name__)
+
+
+def delete_in_batches(dao, criterion, description, batch_size=1000, key_column=None, keep_alive=None):
+    """ deletes the rows of dao matching criterion, batch_size rows per statement with a commit after each, so that
+        no single transaction holds row locks (or builds up dead tuples) for long and an interrupted delete can simply
+        be run again.  key_column identifies the rows of a batch, and defaults to dao.id.
+
+        :param keep_alive: called after every batch, e.g. to keep the message that asked for the delete from being
+                           redelivered while it is still being handled
+        :type keep_alive: function[]
+        :return: the number of rows deleted """
+    key_column = key_column if key_column is not None else dao.id
+    start_time = time.time()
+    total = 0
+    while True:
+        batch_keys = select([key_column]).where(criterion).limit(batch_size)
+        deleted = dao.query\
+            .filter(criterion)\
+            .filter(key_column.in_(batch_keys))\
+            .delete(synchronize_session=False)
+        db.session.commit()
+        total += deleted
+        if keep_alive:
+            keep_alive()
+        if deleted < batch_size:
+            break
+        _log_delete_progress(description, total, start_time)
+
+    if total > 0:
+        _log_delete_progress(description, total, start_time)
+    return total
+
+
+def patch_state_unless_deleting(dao, src_model, dest_model, deleting_state, commit=True):
+    """ patch_difference for a change of state, refused with a DartValidationException if it would take the row out
+        of the deleting_state that marks it for a background purge.  the check costs no extra query: the UPDATE made
+        by patch_difference is pinned to src_model's version, so src_model's state is the stored one, and a row that
+        has moved on is re-read (and checked) by its fallback instead """
+    state = dest_model.data.state
+    if state == deleting_state:
+        return patch_difference(dao, src_model, dest_model, commit)
+    try:
+        return patch_difference(dao, src_model, dest_model, commit,
+                                conditional=lambda m: m.data.state != deleting_state)
+    except DartConditionalUpdateFailedException:
+        raise DartValidationException('%s (id=%s) is being deleted, its state cannot be changed to %s'
+                                      % (dao.__tablename__, src_model.id, state))
+
+
+def _log_delete_progress(description, total, start_time):
+    elapsed = max(time.time() - start_time, 0.001)
+    _logger.info('deleted %s %s in %.1fs (%.0f rows/s)' % (total, description, elapsed, total / elapsed))
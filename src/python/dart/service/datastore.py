@@ -1,20 +1,25 @@
+import logging
 from sqlalchemy import desc
 from dart.context.locator import injectable
 from dart.model.datastore import DatastoreState, Datastore
 from dart.model.engine import Engine
 from dart.model.orm import DatastoreDao
 from dart.context.database import db
-from dart.schema.base import default_and_validate
+from dart.schema.base import cached_schema_validator, default_and_validate
 from dart.schema.datastore import datastore_schema
+from dart.service.batch_delete import patch_state_unless_deleting
 from dart.service.patcher import patch_difference, retry_stale_data
 from dart.util.rand import random_id
 from dart.util.secrets import purge_secrets
 
+_logger = logging.getLogger(__name__)
+
 
 @injectable
 class DatastoreService(object):
-    def __init__(self, trigger_proxy, dart_config, engine_service, filter_service, secrets):
+    def __init__(self, trigger_proxy, subscription_proxy, dart_config, engine_service, filter_service, secrets):
         self._trigger_proxy = trigger_proxy
+        self._subscription_proxy = subscription_proxy
         self._dart_config = dart_config
         self._engine_service = engine_service
         self._filter_service = filter_service
@@ -22,8 +27,9 @@ class DatastoreService(object):
 
     def save_datastore(self, datastore, commit_and_handle_state_change=True, flush=False):
         """ :type datastore: dart.model.datastore.Datastore """
-        schema = self.get_schema(datastore)
-        datastore = self.default_and_validate_datastore(datastore, schema)
+        schema_validator = self._schema_validator(datastore)
+        schema = schema_validator.schema
+        datastore = schema_validator.default_and_validate(datastore)
         datastore.id = random_id()
 
         secrets = {}
@@ -48,13 +54,21 @@ class DatastoreService(object):
         return datastore
 
     def default_and_validate_datastore(self, datastore, schema=None):
-        return default_and_validate(datastore, schema or self.get_schema(datastore))
+        if schema:
+            return default_and_validate(datastore, schema)
+        return self._schema_validator(datastore).default_and_validate(datastore)
 
     def get_schema(self, datastore):
-        engine = self._engine_service.get_engine_by_name(datastore.data.engine_name)
+        return self._schema_validator(datastore).schema
+
+    def _schema_validator(self, datastore):
+        engine = self._engine_service.get_cached_engine(datastore.data.engine_name)
         assert isinstance(engine, Engine)
-        schema = datastore_schema(engine.data.options_json_schema)
-        return schema
+        return cached_schema_validator(
+            ('datastore', engine.data.name),
+            engine.version_id,
+            lambda: datastore_schema(engine.data.options_json_schema)
+        )
 
     def patch_datastore(self, source_datastore, datastore):
         schema = self.get_schema(datastore)
@@ -75,6 +89,13 @@ class DatastoreService(object):
         datastore.data.s3_artifacts_path = '%s/%s/%s/artifacts/%s' % (s3_root, name, engine_name, ds_id)
         datastore.data.s3_logs_path = '%s/%s/%s/logs/%s' % (s3_root, name, engine_name, ds_id)
 
+    @staticmethod
+    def get_datastores(datastore_ids):
+        """ :rtype: list[dart.model.datastore.Datastore] """
+        if not datastore_ids:
+            return []
+        return [d.to_model() for d in DatastoreDao.query.filter(DatastoreDao.id.in_(datastore_ids)).all()]
+
     @staticmethod
     def get_datastore(datastore_id, raise_when_missing=True):
         datastore_dao = DatastoreDao.query.get(datastore_id)
@@ -114,22 +135,20 @@ class DatastoreService(object):
 
     def _query_datastore_query(self, filters):
         query = DatastoreDao.query.order_by(desc(DatastoreDao.updated))
+        datastore_schemas = self._get_datastore_schemas() if filters else None
         for f in filters:
-            query = self._filter_service.apply_filter(f, query, DatastoreDao, self._get_datastore_schemas())
+            query = self._filter_service.apply_filter(f, query, DatastoreDao, datastore_schemas)
         return query
 
     def _get_datastore_schemas(self):
-        options_schemas = []
-        for engine in self._engine_service.query_engines([], 1000, 0):
-            options_schemas.append(engine.data.options_json_schema)
-        datastore_schemas = [datastore_schema(s) for s in options_schemas]
-        return datastore_schemas
+        return self._engine_service.engine_metadata().datastore_schemas
 
     def update_datastore_state(self, datastore, state):
         source_datastore = datastore.copy()
         datastore.data.state = state
+        datastore = patch_state_unless_deleting(DatastoreDao, source_datastore, datastore, DatastoreState.DELETING)
         self.handle_datastore_state_change(datastore, source_datastore.data.state, state)
-        return patch_difference(DatastoreDao, source_datastore, datastore)
+        return datastore
 
     @staticmethod
     def update_datastore_extra_data(datastore, extra_data):
@@ -146,12 +165,24 @@ class DatastoreService(object):
         datastore.data.connection_url = connection_url
         return patch_difference(DatastoreDao, source_datastore, datastore)
 
+    def delete_datastore(self, datastore_id):
+        """ marks the datastore DELETING (so none of its actions are run) and leaves removing it to the subscription
+            worker, see purge_datastore """
+        datastore = self.get_datastore(datastore_id)
+        self.update_datastore_state(datastore, DatastoreState.DELETING)
+        self._subscription_proxy.delete_datastore(datastore_id)
+
     @staticmethod
     @retry_stale_data
-    def delete_datastore(datastore_id):
+    def purge_datastore(datastore_id):
+        """ removes the datastore row only, as deleting a datastore always has - its actions are left in place """
         datastore_dao = DatastoreDao.query.get(datastore_id)
+        if not datastore_dao:
+            _logger.info('datastore (id=%s) is already deleted' % datastore_id)
+            return
         db.session.delete(datastore_dao)
         db.session.commit()
+        _logger.info('deleted datastore (id=%s)' % datastore_id)
 
     def handle_datastore_state_change(self, datastore, previous_state, updated_state):
         if previous_state != DatastoreState.ACTIVE and updated_state == DatastoreState.ACTIVE:
@@ -10,7 +10,7 @@ from dart.model.exception import DartValidationException
 from dart.model.orm import EngineDao, SubGraphDefinitionDao
 from dart.context.database import db
 from dart.schema.action import action_schema
-from dart.schema.base import default_and_validate
+from dart.schema.base import default_and_validate, evict_schema_validators
 from dart.schema.datastore import datastore_schema
 from dart.schema.engine import engine_schema, subgraph_definition_schema
 from dart.service.patcher import retry_stale_data
@@ -24,6 +24,7 @@ class EngineService(object):
         self._engine_taskrunner_ecs_cluster = dart_config['dart'].get('engine_taskrunner_ecs_cluster')
         self._engine_task_definition_max_total_memory_mb =\
             dart_config['dart'].get('engine_task_definition_max_total_memory_mb')
+        self._engine_metadata = None
 
     def save_engine(self, engine):
         """ :type engine: dart.model.engine.Engine """
@@ -127,8 +128,39 @@ class EngineService(object):
                 raise Exception('engine with name=%s not found' % engine_name)
             return None
 
+    @staticmethod
+    def get_engines_by_name(engine_names):
+        """ :rtype: list[dart.model.engine.Engine] """
+        if not engine_names:
+            return []
+        return [e.to_model() for e in EngineDao.query.filter(EngineDao.name.in_(engine_names)).all()]
+
+    def get_cached_engine(self, engine_name, raise_when_missing=True):
+        """ the same as get_engine_by_name, but served from engine_metadata(), so validating many actions or
+            datastores does not load the engine row each time.  the engine is shared, so it must not be modified
+
+            :rtype: dart.model.engine.Engine """
+        engine = self.engine_metadata().engines_by_name.get(engine_name)
+        if not engine and raise_when_missing:
+            raise Exception('engine with name=%s not found' % engine_name)
+        return engine
+
     def all_engine_names(self):
-        return [e.data.name for e in self.query_engines([], 1000, 0)]
+        return [e.data.name for e in self.engine_metadata().engines]
+
+    def engine_metadata(self):
+        """ engines and the schemas derived from them, rebuilt only when an engine has been saved, updated or
+            deleted (by any process) since the last call - detected with a query for just the engine versions
+
+            :rtype: EngineMetadata """
+        versions = frozenset(db.session.query(EngineDao.id, EngineDao.version_id).all())
+        engine_metadata = self._engine_metadata
+        if engine_metadata and engine_metadata.versions == versions:
+            return engine_metadata
+        engines = [e.to_model() for e in EngineDao.query.order_by(EngineDao.updated).all()]
+        engine_metadata = EngineMetadata(engines)
+        self._engine_metadata = engine_metadata
+        return engine_metadata
 
     def query_engines(self, filters, limit=20, offset=0):
         """ :type filters: list[dart.model.query.Filter] """
@@ -163,6 +195,8 @@ class EngineService(object):
     @retry_stale_data
     def update_engine_data(engine_id, engine_data):
         engine_dao = EngineDao.query.get(engine_id)
+        # cached validators are keyed by engine version, so other processes pick up the change on their own
+        evict_schema_validators(engine_dao.name)
         engine_dao.name = engine_data.name
         engine_dao.data = engine_data.to_dict()
         db.session.commit()
@@ -181,3 +215,18 @@ class EngineService(object):
         engine_dao = EngineDao.query.get(engine.id)
         db.session.delete(engine_dao)
         db.session.commit()
+        evict_schema_validators(engine.data.name)
+
+
+class EngineMetadata(object):
+    def __init__(self, engines):
+        """ :type engines: list[dart.model.engine.Engine] """
+        self.engines = engines
+        self.versions = frozenset((e.id, e.version_id) for e in engines)
+        self.engines_by_name = {e.data.name: e for e in engines}
+        action_schemas = []
+        for engine in engines:
+            for action_type in engine.data.supported_action_types:
+                action_schemas.append(action_schema(action_type.params_json_schema))
+        self.action_schemas = tuple(action_schemas)
+        self.datastore_schemas = tuple(datastore_schema(e.data.options_json_schema) for e in engines)
@@ -27,10 +27,10 @@ class FilterService(object):
             Operator.LIKE: OperatorLike(),
             Operator.SEARCH: OperatorSearch(),
         }
+        self._filter_pattern = re.compile(r'\s*(\S+?)\s*(' + '|'.join(self._operator_handlers.keys()) + ')\s*(\S+)\s*')
 
     def from_string(self, f_string):
-        pattern = re.compile(r'\s*(\S+?)\s*(' + '|'.join(self._operator_handlers.keys()) + ')\s*(\S+)\s*')
-        m = pattern.match(f_string)
+        m = self._filter_pattern.match(f_string)
         try:
             return Filter(m.group(1), m.group(2), m.group(3))
         except:
@@ -43,8 +43,16 @@ class FilterService(object):
             return query.filter(op.evaluate(lambda v: v, getattr(dao, f.key), str, f.value))
 
         # at this point, assume we are dealing with a data/JSONB filter
-        path_keys = f.key.split('.')
         filters = []
+        for type_, key_groups, last_is_array in self.compile_filter_plan(f.key, schemas):
+            filters.append(self.expr(0, 'data', dao.data, key_groups, type_, f.value, op, last_is_array))
+        return query.filter(filters[0]) if len(filters) == 1 else query.filter(or_(*filters))
+
+    def compile_filter_plan(self, key, schemas):
+        """ resolves the (type, key_groups, last_is_array) combinations that a filter on key expands to across
+            schemas, de-duplicated in schema order """
+        path_keys = key.split('.')
+        plan = []
         visited = {}
         for schema in schemas:
             type_, array_indexes = self._get_type(path_keys, schema)
@@ -54,8 +62,8 @@ class FilterService(object):
             visited[identifier] = 1
             key_groups = self.get_key_groups(array_indexes, path_keys)
             last_is_array = array_indexes[-1] == len(path_keys) - 1 if len(array_indexes) > 0 else False
-            filters.append(self.expr(0, 'data', dao.data, key_groups, type_, f.value, op, last_is_array))
-        return query.filter(filters[0]) if len(filters) == 1 else query.filter(or_(*filters))
+            plan.append((type_, key_groups, last_is_array))
+        return plan
 
     def expr(self, i, alias, col, key_groups, t, v, op, last_is_array):
         if i < len(key_groups) - 1:
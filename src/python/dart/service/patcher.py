@@ -1,15 +1,70 @@
+import json
+
 import jsonpatch
 from retrying import retry
+from sqlalchemy import text
 from sqlalchemy.orm.exc import StaleDataError
 from dart.context.database import db
 from dart.model.exception import DartConditionalUpdateFailedException
 
 
+_MISSING = object()
+
+
 def patch_difference(dao, src_model, dest_model, commit=True, conditional=None):
+    updated_model = _update_data_at_version(dao, src_model, dest_model, commit, conditional)
+    if updated_model:
+        return updated_model
     patch = jsonpatch.make_patch(src_model.to_dict(), dest_model.to_dict())
     return patch_data(dao, src_model.id, patch, commit, conditional)
 
 
+def _update_data_at_version(dao, src_model, dest_model, commit, conditional):
+    """ merges the changed top level keys of data into the row with a single UPDATE ... RETURNING, provided the row
+        is still at src_model's version.  returns None when that isn't possible (the row has moved on, the change
+        touches more than data or removes keys from it, or the conditional fails against src_model) so the caller
+        can fall back to re-reading and patching the current row. """
+    if 'data' not in dao.__table__.columns or src_model.version_id is None:
+        return None
+    src_dict = src_model.to_dict()
+    dest_dict = dest_model.to_dict()
+    src_data = src_dict.pop('data') or {}
+    dest_data = dest_dict.pop('data') or {}
+    if src_dict != dest_dict or _removes_keys(src_data, dest_data):
+        return None
+    changes = {k: v for k, v in dest_data.iteritems() if src_data.get(k, _MISSING) != v}
+    if not changes:
+        return None
+    # pinning the version below means the conditional sees exactly the row being updated
+    if conditional and not conditional(src_model):
+        return None
+
+    assignments = ['data = data || CAST(:changes AS JSONB)', 'version_id = version_id + 1']
+    params = {'id': src_model.id, 'version_id': src_model.version_id, 'changes': json.dumps(changes)}
+    for column, value in dao.promoted_column_values(dest_data).iteritems():
+        assignments.append('%s = :%s' % (column, column))
+        params[column] = value
+    sql = 'UPDATE %s SET %s WHERE id = :id AND version_id = :version_id RETURNING *' \
+          % (dao.__tablename__, ', '.join(assignments))
+    daos = dao.query.from_statement(text(sql).bindparams(**params)).populate_existing().all()
+    if not daos:
+        return None
+    model = daos[0].to_model()
+    if commit:
+        db.session.commit()
+    return model
+
+
+def _removes_keys(src, dest):
+    """ whether dest drops any key that src has, at any depth of nested dicts """
+    if not isinstance(src, dict) or not isinstance(dest, dict):
+        return False
+    for k, v in src.iteritems():
+        if k not in dest or _removes_keys(v, dest[k]):
+            return True
+    return False
+
+
 def _retry_stale_data_error(exception):
     if isinstance(exception, StaleDataError):
         db.session.rollback()
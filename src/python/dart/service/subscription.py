@@ -1,21 +1,31 @@
+from cStringIO import StringIO
 import logging
+import math
+import re
+import time
+import traceback
 
 from datetime import datetime
 import boto
-from sqlalchemy import insert, literal, not_, func, text, update, cast, String, or_, desc
+from sqlalchemy import literal, not_, func, text, cast, String, or_, desc, null
 from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.orm.exc import NoResultFound
 from dart.context.locator import injectable
+from dart.model.base import to_dict
 from dart.model.exception import DartValidationException
-from dart.model.orm import SubscriptionDao, DatasetDao, SubscriptionElementDao, TriggerDao
+from dart.model.orm import SubscriptionDao, DatasetDao, SubscriptionElementDao, TriggerDao, \
+    SubscriptionElementCounterDao, SubscriptionElementArchiveDao
 from dart.context.database import db
-from dart.model.subscription import SubscriptionElementState, SubscriptionState, SubscriptionElementStats
+from dart.model.subscription import SubscriptionElementState, SubscriptionState, SubscriptionElementStats, \
+    SubscriptionElement
 from dart.schema.base import default_and_validate
 from dart.schema.subscription import subscription_schema
+from dart.service.batch_delete import delete_in_batches, patch_state_unless_deleting
 from dart.service.patcher import patch_difference, retry_stale_data
 from dart.trigger.subscription import subscription_batch_trigger
 from dart.util.rand import random_id
-from dart.util.s3 import yield_s3_keys, get_bucket, get_s3_path
+from dart.util.s3 import yield_s3_keys, yield_s3_keys_parallel, get_bucket, get_s3_path
 
 
 _batch_size = 1000
@@ -24,10 +34,13 @@ _logger = logging.getLogger(__name__)
 
 @injectable
 class SubscriptionService(object):
-    def __init__(self, dataset_service, subscription_proxy, filter_service):
+    def __init__(self, dataset_service, subscription_proxy, filter_service, subscription_matching_index, dart_config):
         self._dataset_service = dataset_service
         self._subscription_proxy = subscription_proxy
         self._filter_service = filter_service
+        self._subscription_matching_index = subscription_matching_index
+        self._partitioned_elements = dart_config['dart'].get('subscription_element_partitioned', False)
+        self._delete_batch_size = dart_config['dart'].get('delete_batch_size', 1000)
 
     def save_subscription(self, subscription, commit_and_generate=True, flush=False):
         """ :type subscription: dart.model.subscription.Subscription """
@@ -51,8 +64,16 @@ class SubscriptionService(object):
     def generate_subscription_elements(self, subscription):
         self._subscription_proxy.generate_subscription_elements(subscription)
 
+    def find_matching_subscriptions(self, s3_path):
+        """ :rtype: list[dart.model.subscription.Subscription] """
+        if self._subscription_matching_index.enabled():
+            subscriptions = self._subscription_matching_index.find_matching_subscriptions(s3_path)
+            if subscriptions is not None:
+                return subscriptions
+        return self._query_matching_subscriptions(s3_path)
+
     @staticmethod
-    def find_matching_subscriptions(s3_path):
+    def _query_matching_subscriptions(s3_path):
         subscription_daos = SubscriptionDao.query\
             .join(DatasetDao, DatasetDao.id == SubscriptionDao.data['dataset_id'].astext)\
             .filter(SubscriptionDao.data['state'].astext == SubscriptionState.ACTIVE)\
@@ -137,62 +158,94 @@ class SubscriptionService(object):
         subscription.data.message_id = message_id
         return patch_difference(SubscriptionDao, source_subscription, subscription)
 
-    @staticmethod
+    def delete_subscription(self, subscription_id):
+        """ marks the subscription DELETING (so it stops matching s3 events) and leaves removing it and its elements
+            to the subscription worker, see purge_subscription """
+        subscription = self.get_subscription(subscription_id)
+        _update_subscription_state(subscription, SubscriptionState.DELETING)
+        self._subscription_proxy.delete_subscription(subscription_id)
+
     @retry_stale_data
-    def delete_subscription(subscription_id):
-        SubscriptionElementDao.query\
-            .filter(SubscriptionElementDao.subscription_id == subscription_id)\
-            .delete(synchronize_session='fetch')
+    def purge_subscription(self, subscription_id, keep_alive=None):
         subscription_dao = SubscriptionDao.query.get(subscription_id)
+        if not subscription_dao:
+            _logger.info('subscription (id=%s) is already deleted' % subscription_id)
+            return
+
+        # with partitioned elements this is a quick DROP TABLE rather than a DELETE of every element
+        if self._partitioned_elements and drop_subscription_element_partition(subscription_id):
+            db.session.commit()
+        else:
+            delete_in_batches(SubscriptionElementDao,
+                              SubscriptionElementDao.subscription_id == subscription_id,
+                              'elements of subscription (id=%s)' % subscription_id,
+                              self._delete_batch_size,
+                              keep_alive=keep_alive)
+        delete_in_batches(SubscriptionElementArchiveDao,
+                          SubscriptionElementArchiveDao.subscription_id == subscription_id,
+                          'archived elements of subscription (id=%s)' % subscription_id,
+                          self._delete_batch_size,
+                          key_column=SubscriptionElementArchiveDao.s3_path,
+                          keep_alive=keep_alive)
+        SubscriptionElementCounterDao.query\
+            .filter(SubscriptionElementCounterDao.subscription_id == subscription_id)\
+            .delete(synchronize_session=False)
         db.session.delete(subscription_dao)
         db.session.commit()
+        _logger.info('deleted subscription (id=%s)' % subscription_id)
 
 
 @injectable
 class SubscriptionElementService(object):
-    def __init__(self, dataset_service):
+    def __init__(self, dataset_service, dart_config):
         self._dataset_service = dataset_service
+        self._partitioned_elements = dart_config['dart'].get('subscription_element_partitioned', False)
+        self._generation_pool_size = dart_config['dart'].get('subscription_generation_pool_size', 0)
+        self._generation_shard_depth = dart_config['dart'].get('subscription_generation_shard_depth', 1)
+        self._copy_flush_size = dart_config['dart'].get('subscription_element_copy_flush_size', 50000)
 
     def generate_subscription_elements(self, subscription):
         """ :type subscription: dart.model.subscription.Subscription """
         _update_subscription_state(subscription, SubscriptionState.GENERATING)
+        # created here in the subscription worker, before the subscription has any elements, rather than while
+        # saving it in a web request.  without the partition (e.g. when its lock isn't granted in time), the
+        # elements simply go to the default partition
+        if self._partitioned_elements:
+            create_subscription_element_partition(subscription.id)
 
         dataset = self._dataset_service.get_dataset(subscription.data.dataset_id)
         conn = boto.connect_s3()
         bucket = get_bucket(conn, dataset.data.location)
-        s3_keys = yield_s3_keys(
-            bucket,
-            dataset.data.location,
-            subscription.data.s3_path_start_prefix_inclusive,
-            subscription.data.s3_path_end_prefix_exclusive,
-            subscription.data.s3_path_regex_filter,
-        )
-        elements = []
-        subscription_element_dict = {}
+        if self._generation_pool_size > 1:
+            s3_keys = yield_s3_keys_parallel(
+                bucket,
+                dataset.data.location,
+                subscription.data.s3_path_start_prefix_inclusive,
+                subscription.data.s3_path_end_prefix_exclusive,
+                subscription.data.s3_path_regex_filter,
+                pool_size=self._generation_pool_size,
+                shard_depth=self._generation_shard_depth,
+            )
+        else:
+            s3_keys = yield_s3_keys(
+                bucket,
+                dataset.data.location,
+                subscription.data.s3_path_start_prefix_inclusive,
+                subscription.data.s3_path_end_prefix_exclusive,
+                subscription.data.s3_path_regex_filter,
+            )
+        start_time = time.time()
+        count = 0
+        last_s3_path = None
+        loader = self.subscription_element_loader()
         for i, key_obj in enumerate(s3_keys):
-            sid = subscription.id
-            s3_path = get_s3_path(key_obj)
-            state = SubscriptionElementState.UNCONSUMED
-            now = datetime.now()
-            subscription_element_dict = {
-                'id': random_id(),
-                'version_id': 0,
-                'created': now,
-                'updated': now,
-                'subscription_id': sid,
-                's3_path': s3_path,
-                'file_size': key_obj.size,
-                'state': state
-            }
-            elements.append(subscription_element_dict)
-
-            batch_size_reached = (i + 1) % _batch_size == 0
-            if batch_size_reached:
-                self._insert_elements(elements)
-                elements = []
-
-        if len(elements) > 0:
-            self._insert_elements(elements)
+            last_s3_path = get_s3_path(key_obj)
+            loader.add(subscription.id, last_s3_path, key_obj.size)
+            count = i + 1
+            if count % (_batch_size * 100) == 0:
+                _log_generation_progress(subscription, count, start_time)
+        loader.flush()
+        _log_generation_progress(subscription, count, start_time)
 
         _update_subscription_state(subscription, SubscriptionState.ACTIVE)
 
@@ -203,51 +256,72 @@ class SubscriptionElementService(object):
         s3_keys = yield_s3_keys(
             bucket,
             dataset.data.location,
-            subscription_element_dict.get('s3_path'),
+            last_s3_path,
             subscription.data.s3_path_end_prefix_exclusive,
             subscription.data.s3_path_regex_filter,
         )
+        loader = self.subscription_element_loader()
         for key_obj in s3_keys:
-            self.conditional_insert_subscription_element(subscription, get_s3_path(key_obj), key_obj.size)
+            loader.add(subscription.id, get_s3_path(key_obj), key_obj.size)
+        loader.flush()
+        _logger.info('gap-filling listing added %s subscription elements for subscription (id=%s)'
+                     % (loader.inserted, subscription.id))
 
-    @staticmethod
-    def _insert_elements(elements):
-        # this will produce one multi-valued insert statement (rather than multiple single inserts)
-        db.session.execute(insert(SubscriptionElementDao).values(elements))
-        db.session.commit()
+    def subscription_element_loader(self, flush_size=None):
+        """ :rtype: SubscriptionElementLoader """
+        return SubscriptionElementLoader(flush_size or self._copy_flush_size)
 
     @staticmethod
-    def conditional_insert_subscription_element(subscription, s3_path, size):
-        # SQLAlchemy does not support conditional inserts as a part of its expression language.  Furthermore,
-        # this form of conditional update is required until postgres 9.5 is out and supported by RDS:
-        #
-        #    http://www.postgresql.org/docs/devel/static/sql-insert.html#SQL-ON-CONFLICT
-        #
-        sql = """
-            INSERT INTO subscription_element (
-                id,
-                version_id,
-                created,
-                updated,
-                subscription_id,
-                s3_path,
-                file_size,
-                state
-            )
-            SELECT :id, 0, NOW(), NOW(), :sid, :s3_path, :size, :state
-            WHERE NOT EXISTS
-                (SELECT NULL FROM subscription_element WHERE subscription_id = :sid AND s3_path = :s3_path)
-            """
-        sid = subscription.id
-        state = SubscriptionElementState.UNCONSUMED
-        statement = text(sql).bindparams(id=random_id(), sid=sid, s3_path=s3_path, size=size, state=state)
-        results = db.session.execute(statement)
-        if results.rowcount != 1:
-            db.session.rollback()
-            return False
-        else:
+    def insert_subscription_elements(elements):
+        """ inserts UNCONSUMED elements, skipping any (subscription_id, s3_path) that already exists (or has been
+            archived) and any for a subscription that is no longer ACTIVE (see _lock_live_subscriptions), with one
+            INSERT ... ON CONFLICT DO NOTHING per batch (which also counts the inserted rows).
+
+            :param elements: (subscription_id, s3_path, file_size) tuples
+            :type elements: list[(str, str, int)]
+            :return: the subscription_id of each row actually inserted
+            :rtype: list[str] """
+        inserted_subscription_ids = []
+        for start in range(0, len(elements), _batch_size):
+            batch = elements[start:start + _batch_size]
+            live_subscription_ids = _lock_live_subscriptions(set(sid for sid, s3_path, size in batch),
+                                                             [SubscriptionState.ACTIVE])
+            batch = [e for e in batch if e[0] in live_subscription_ids]
+            if not batch:
+                db.session.commit()
+                continue
+            values = []
+            params = {'state': SubscriptionElementState.UNCONSUMED}
+            for i, (sid, s3_path, size) in enumerate(batch):
+                values.append('(:id_%s, :sid_%s, :s3_path_%s, CAST(:size_%s AS BIGINT))' % (i, i, i, i))
+                params.update({'id_%s' % i: random_id(), 'sid_%s' % i: sid, 's3_path_%s' % i: s3_path, 'size_%s' % i: size})
+            sql = """
+                INSERT INTO subscription_element (
+                    id,
+                    version_id,
+                    created,
+                    updated,
+                    subscription_id,
+                    s3_path,
+                    file_size,
+                    state
+                )
+                SELECT v.id, 0, NOW(), NOW(), v.subscription_id, v.s3_path, v.file_size, :state
+                FROM (VALUES %s) AS v (id, subscription_id, s3_path, file_size)
+                WHERE NOT EXISTS (
+                    SELECT 1
+                    FROM subscription_element_archive a
+                    WHERE a.subscription_id = v.subscription_id
+                      AND a.s3_path = v.s3_path
+                )
+                ON CONFLICT (subscription_id, s3_path) DO NOTHING
+                RETURNING subscription_id, state, file_size
+                """ % ', '.join(values)
+            sql = _counted(sql, _INSERTED_COUNTER_CHANGES, 'SELECT subscription_id FROM changed')
+            results = db.session.execute(text(sql).bindparams(**params))
+            inserted_subscription_ids.extend([r[0] for r in results])
             db.session.commit()
-            return True
+        return inserted_subscription_ids
 
     @staticmethod
     def get_subscription_element(subscription_id, s3_path):
@@ -259,17 +333,70 @@ class SubscriptionElementService(object):
                 .one()\
                 .to_model()
         except NoResultFound:
+            archived = _archived_element_columns_query()\
+                .filter(SubscriptionElementArchiveDao.subscription_id == subscription_id)\
+                .filter(SubscriptionElementArchiveDao.s3_path == s3_path)\
+                .first()
+            if archived:
+                return SubscriptionElement.from_dict(archived._asdict())
             values = (subscription_id, s3_path)
             raise DartValidationException('no elements found for subscription (id=%s) key: %s' % values)
 
     def find_subscription_elements(self, subscription_id, state=SubscriptionElementState.UNCONSUMED, limit=None,
-                                   offset=None, gt_s3_path=None, action_id=None, gte_processed=None):
+                                   offset=None, gt_s3_path=None, action_id=None, gte_processed=None,
+                                   after_s3_path=None):
+        """ after_s3_path is a keyset cursor (the last s3_path of the previous page), which unlike offset costs the
+            same for every page """
+        if _includes_archived_elements(state, gte_processed):
+            query = self._element_columns_query(action_id, gt_s3_path, state, subscription_id, gte_processed,
+                                                after_s3_path)
+            query = query.limit(limit) if limit else query
+            query = query.offset(offset) if offset else query
+            return [SubscriptionElement.from_dict(row._asdict()) for row in query.all()]
+
         query = self._find_subscription_elements_query(action_id, gt_s3_path, state, subscription_id, gte_processed)
+        query = query.filter(SubscriptionElementDao.s3_path > after_s3_path) if after_s3_path else query
         query = query.order_by(SubscriptionElementDao.s3_path)
         query = query.limit(limit) if limit else query
         query = query.offset(offset) if offset else query
         return [se.to_model() for se in query.all()]
 
+    def stream_subscription_elements(self, subscription_id, state=None, gt_s3_path=None, action_id=None,
+                                     gte_processed=None, page_size=5000):
+        """ yields elements ordered by s3_path as plain dicts (the shape of SubscriptionElement.to_dict()), a keyset
+            page at a time so memory use doesn't grow with the number of elements.  each page is read in its own
+            short transaction and the session is released before the page is yielded, so a slow reader holds
+            neither a transaction nor a database connection """
+        after_s3_path = None
+        while True:
+            query = self._element_columns_query(action_id, gt_s3_path, state, subscription_id, gte_processed,
+                                                after_s3_path)
+            rows = [to_dict(row._asdict()) for row in query.limit(page_size).all()]
+            db.session.remove()
+            for row in rows:
+                yield row
+            if len(rows) < page_size:
+                return
+            after_s3_path = rows[-1]['s3_path']
+
+    def _element_columns_query(self, action_id, gt_s3_path, state, subscription_id, gte_processed, after_s3_path=None):
+        """ the matching elements' columns (keyed like SubscriptionElement fields), ordered by s3_path.  archived
+            elements are only read when replaying what was CONSUMED after some point (gte_processed), which is how
+            consumers such as redshift's consume_subscription recover, so that this keeps working past retention. """
+        query = self._find_subscription_elements_query(action_id, gt_s3_path, state, subscription_id, gte_processed)
+        query = query.with_entities(*_element_columns(SubscriptionElementDao))
+        if _includes_archived_elements(state, gte_processed):
+            archived = _archived_element_columns_query()
+            archived = archived.filter(SubscriptionElementArchiveDao.subscription_id == subscription_id)
+            archived = archived.filter(SubscriptionElementArchiveDao.processed >= gte_processed)
+            if gt_s3_path:
+                archived = archived.filter(SubscriptionElementArchiveDao.s3_path > gt_s3_path)
+            if action_id:
+                archived = archived.filter(SubscriptionElementArchiveDao.action_id == action_id)
+            query = query.union_all(archived)
+        query = query.filter(SubscriptionElementDao.s3_path > after_s3_path) if after_s3_path else query
+        return query.order_by(SubscriptionElementDao.s3_path)
+
     def find_subscription_elements_count(self, subscription_id, state=SubscriptionElementState.UNCONSUMED,
                                          gt_s3_path=None, action_id=None, gte_processed=None):
         query = self._find_subscription_elements_query(action_id, gt_s3_path, state, subscription_id, gte_processed)
@@ -286,38 +413,104 @@ class SubscriptionElementService(object):
         return query
 
     @staticmethod
-    def get_subscription_element_file_size_sum_and_avg(subscription_id, state=SubscriptionElementState.UNCONSUMED):
-        return db.session\
-            .query(func.sum(SubscriptionElementDao.file_size), func.avg(SubscriptionElementDao.file_size))\
-            .filter(SubscriptionElementDao.subscription_id == subscription_id)\
-            .filter(SubscriptionElementDao.state == state)\
-            .all()[0] or [0, 0]
+    def get_subscription_element_counter(subscription_id, state=SubscriptionElementState.UNCONSUMED):
+        """ :return: the running (count, file_size_sum) of the subscription's elements in this state
+            :rtype: (long, long) """
+        result = db.session\
+            .query(SubscriptionElementCounterDao.count, SubscriptionElementCounterDao.file_size_sum)\
+            .filter(SubscriptionElementCounterDao.subscription_id == subscription_id)\
+            .filter(SubscriptionElementCounterDao.state == state)\
+            .first()
+        return (long(result[0]), long(result[1])) if result else (0L, 0L)
+
+    def get_subscription_element_file_size_sum_and_avg(self, subscription_id,
+                                                       state=SubscriptionElementState.UNCONSUMED):
+        count, file_size_sum = self.get_subscription_element_counter(subscription_id, state)
+        return file_size_sum, (float(file_size_sum) / count if count else 0)
+
+    def find_subscription_element_batch(self, subscription_id, file_size_sum):
+        """ :return: the ids of the first UNCONSUMED elements (by s3_path) whose file sizes add up to at least
+                     file_size_sum, or [] if there aren't enough.  this is one cumulative-sum window query over a
+                     limit predicted from the running counters, so its cost follows the batch size rather than the
+                     number of unconsumed elements.
+            :rtype: list[str] """
+        count, unconsumed_file_size_sum = self.get_subscription_element_counter(subscription_id)
+        if count == 0 or unconsumed_file_size_sum < file_size_sum:
+            return []
+
+        # average = sum / count,  count = sum / avg,  adding 10% will help reduce more trips to the db
+        limit = int(math.ceil(file_size_sum / (float(unconsumed_file_size_sum) / count) * 1.1))
+        sql = """
+            SELECT id, running_file_size_sum
+            FROM (
+                SELECT id, file_size,
+                       SUM(file_size) OVER (ORDER BY s3_path ROWS UNBOUNDED PRECEDING) AS running_file_size_sum
+                FROM (
+                    SELECT id, s3_path, file_size
+                    FROM subscription_element
+                    WHERE subscription_id = :subscription_id
+                      AND state = :state
+                    ORDER BY s3_path
+                    LIMIT :limit
+                ) e
+            ) w
+            WHERE running_file_size_sum - file_size < :file_size_sum
+            ORDER BY running_file_size_sum
+            """
+        while True:
+            statement = text(sql).bindparams(subscription_id=subscription_id, state=SubscriptionElementState.UNCONSUMED,
+                                             limit=limit, file_size_sum=file_size_sum)
+            rows = db.session.execute(statement).fetchall()
+            if rows and rows[-1][1] >= file_size_sum:
+                return [r[0] for r in rows]
+            if len(rows) < limit:
+                _logger.warning('subscription (id=%s) counters show more unconsumed bytes than its elements hold'
+                                % subscription_id)
+                return []
+            limit *= 2
 
     @staticmethod
     def get_subscription_element_stats(subscription_id):
-        """ :rtype: dart.model.subscription.SubscriptionElementStats """
+        """ read from the running counters, so this costs the same however many elements the subscription has
+
+            :rtype: list[dart.model.subscription.SubscriptionElementStats] """
         results = db.session\
             .query(
-                SubscriptionElementDao.state,
-                func.count(),
-                func.sum(SubscriptionElementDao.file_size),
+                SubscriptionElementCounterDao.state,
+                SubscriptionElementCounterDao.count,
+                SubscriptionElementCounterDao.file_size_sum,
             )\
-            .filter(SubscriptionElementDao.subscription_id == subscription_id)\
-            .group_by(SubscriptionElementDao.state)\
+            .filter(SubscriptionElementCounterDao.subscription_id == subscription_id)\
+            .filter(SubscriptionElementCounterDao.count > 0)\
+            .order_by(SubscriptionElementCounterDao.state)\
             .all()
         return [SubscriptionElementStats(r[0], int(r[1]), long(r[2])) for r in results]
 
     @staticmethod
-    def reserve_subscription_elements(element_ids):
+    def count_subscription_element_stats(subscription_id):
+        """ the same stats as get_subscription_element_stats, counted from the elements themselves
+
+            :rtype: list[dart.model.subscription.SubscriptionElementStats] """
+        sql = """
+            SELECT state, COUNT(*), SUM(file_size)
+            FROM (%s) e
+            GROUP BY state
+            ORDER BY state
+            """ % _ALL_ELEMENT_STATES_SQL
+        statement = text(sql).bindparams(subscription_id=subscription_id, consumed=SubscriptionElementState.CONSUMED)
+        results = db.session.execute(statement).fetchall()
+        return [SubscriptionElementStats(r[0], int(r[1]), long(r[2])) for r in results]
+
+    @staticmethod
+    def reserve_subscription_elements(element_ids, subscription_id=None):
         # because this is called by the trigger worker (always a single consumer),
         # we shouldn't have to deal with optimistic locking
-        db.session.execute(
-            update(SubscriptionElementDao)
-            .where(SubscriptionElementDao.id.in_(element_ids))
-            .values(
-                state=SubscriptionElementState.RESERVED,
-                batch_id=random_id()
-            )
+        _update_subscription_elements_state(
+            subscription_id,
+            'id = ANY(:element_ids)',
+            {'element_ids': list(element_ids)},
+            SubscriptionElementState.RESERVED,
+            batch_id=random_id()
         )
         db.session.commit()
 
@@ -343,16 +536,13 @@ class SubscriptionElementService(object):
             state = SubscriptionElementState.UNCONSUMED
             batch_id = None
 
-        db.session.execute(
-            update(SubscriptionElementDao)
-            .where(SubscriptionElementDao.subscription_id == s_id)
-            .where(SubscriptionElementDao.state == state)
-            .where(SubscriptionElementDao.batch_id == batch_id)
-            .values(
-                action_id=action.id,
-                state=SubscriptionElementState.ASSIGNED
-            )
-        )
+        where_sql = 'state = :state AND batch_id IS NULL'
+        params = {'state': state}
+        if batch_id:
+            where_sql = 'state = :state AND batch_id = :batch_id'
+            params['batch_id'] = batch_id
+        _update_subscription_elements_state(s_id, where_sql, params, SubscriptionElementState.ASSIGNED,
+                                            action_id=action.id)
         db.session.commit()
 
     @staticmethod
@@ -378,20 +568,354 @@ class SubscriptionElementService(object):
         return len(results) > 0
 
     @staticmethod
-    def update_subscription_elements_state(action_id, state):
+    def update_subscription_elements_state(action_id, state, subscription_id=None):
         # because any particular row should never be consumed by more than one worker at a time,
         # we shouldn't have to deal with optimistic locking
-        kwargs = {'state': state}
+        kwargs = {}
         if state == SubscriptionElementState.CONSUMED:
             kwargs['processed'] = datetime.utcnow()
 
+        _update_subscription_elements_state(subscription_id, 'action_id = :action_id', {'action_id': action_id}, state,
+                                            **kwargs)
+        db.session.commit()
+
+    @staticmethod
+    def rebuild_subscription_element_counters(subscription_id):
+        """ recounts a subscription's elements from scratch, only locking that subscription's counter rows.  every
+            statement that changes its elements also upserts those rows (creating any missing ones first makes sure
+            of it), so a writer either committed before the locks were taken and is part of the recount, or waits on
+            them with its element changes still uncommitted, and applies its change on top of the recount. """
+        db.session.execute(text("""
+            INSERT INTO subscription_element_counter (subscription_id, state, count, file_size_sum)
+            SELECT :subscription_id, state, 0, 0
+            FROM unnest(CAST(:states AS VARCHAR[])) AS state
+            ON CONFLICT (subscription_id, state) DO NOTHING
+            """).bindparams(subscription_id=subscription_id, states=SubscriptionElementState.all()))
+        db.session.execute(text("""
+            SELECT 1 FROM subscription_element_counter
+            WHERE subscription_id = :subscription_id
+            ORDER BY state
+            FOR UPDATE
+            """).bindparams(subscription_id=subscription_id))
+        sql = """
+            WITH recount AS (
+                SELECT state, COUNT(*) AS count, SUM(file_size) AS file_size_sum
+                FROM (%s) e
+                GROUP BY state
+            )
+            UPDATE subscription_element_counter c
+            SET count = COALESCE((SELECT r.count FROM recount r WHERE r.state = c.state), 0),
+                file_size_sum = COALESCE((SELECT r.file_size_sum FROM recount r WHERE r.state = c.state), 0)
+            WHERE c.subscription_id = :subscription_id
+            """ % _ALL_ELEMENT_STATES_SQL
         db.session.execute(
-            update(SubscriptionElementDao)
-            .where(SubscriptionElementDao.action_id == action_id)
-            .values(**kwargs)
+            text(sql).bindparams(subscription_id=subscription_id, consumed=SubscriptionElementState.CONSUMED)
         )
         db.session.commit()
 
+    @staticmethod
+    def archive_subscription_elements(processed_before, limit=10000):
+        """ moves up to limit CONSUMED elements processed before processed_before into subscription_element_archive.
+            each call is one statement (and transaction), so archiving can be stopped and resumed at any point.
+            archived elements still count in the stats, and are still replayed by processed_after_s3_path queries.
+
+            :return: the number of elements archived
+            :rtype: int """
+        sql = """
+            WITH moved AS (
+                DELETE FROM subscription_element
+                WHERE (subscription_id, id) IN (
+                    SELECT subscription_id, id
+                    FROM subscription_element
+                    WHERE state = :state
+                      AND processed < :processed_before
+                    LIMIT :limit
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, created, updated, subscription_id, s3_path, file_size, action_id, processed
+            ),
+            archived AS (
+                INSERT INTO subscription_element_archive (
+                    id,
+                    created,
+                    updated,
+                    subscription_id,
+                    s3_path,
+                    file_size,
+                    action_id,
+                    processed
+                )
+                SELECT id, created, updated, subscription_id, s3_path, file_size, action_id, processed
+                FROM moved
+                ON CONFLICT (subscription_id, s3_path) DO NOTHING
+            )
+            SELECT COUNT(*) FROM moved
+            """
+        statement = text(sql).bindparams(state=SubscriptionElementState.CONSUMED, processed_before=processed_before,
+                                         limit=limit)
+        archived = db.session.execute(statement).scalar()
+        db.session.commit()
+        return archived
+
+
+class SubscriptionElementLoader(object):
+    """ bulk loads UNCONSUMED subscription elements for initial generation and large backfills: rows are buffered
+        in COPY text format, and every flush_size rows they are streamed with COPY FROM STDIN into a temporary
+        staging table and merged with INSERT ... SELECT ... ON CONFLICT DO NOTHING, so existing (subscription_id,
+        s3_path) rows are left alone, as are the rows of subscriptions that are DELETING or gone (see
+        _lock_live_subscriptions).  call flush() after the last add(). """
+
+    def __init__(self, flush_size=50000):
+        self._flush_size = flush_size
+        self._buffer = StringIO()
+        self._buffered = 0
+        self.inserted = 0
+
+    def add(self, subscription_id, s3_path, file_size):
+        self._buffer.write('%s\t%s\t%s\t%s\n' % (random_id(), _copy_text(subscription_id), _copy_text(s3_path),
+                                                 int(file_size)))
+        self._buffered += 1
+        if self._buffered >= self._flush_size:
+            self.flush()
+
+    def flush(self):
+        """ :return: the number of rows inserted (not skipped as duplicates) by this flush """
+        if self._buffered == 0:
+            return 0
+        self._buffer.seek(0)
+        cursor = db.session.connection().connection.cursor()
+        try:
+            # the staging table lives as long as the pooled connection, and is emptied by each commit
+            cursor.execute("""
+                CREATE TEMPORARY TABLE IF NOT EXISTS subscription_element_staging (
+                    id VARCHAR(36),
+                    subscription_id VARCHAR(36),
+                    s3_path VARCHAR(1024),
+                    file_size BIGINT
+                ) ON COMMIT DELETE ROWS
+                """)
+            cursor.copy_expert('COPY subscription_element_staging (id, subscription_id, s3_path, file_size) '
+                               'FROM STDIN', self._buffer)
+            # see _lock_live_subscriptions
+            cursor.execute("""
+                SELECT id
+                FROM subscription
+                WHERE id IN (SELECT DISTINCT subscription_id FROM subscription_element_staging)
+                ORDER BY id
+                FOR SHARE
+                """)
+            sql = """
+                INSERT INTO subscription_element (
+                    id,
+                    version_id,
+                    created,
+                    updated,
+                    subscription_id,
+                    s3_path,
+                    file_size,
+                    state
+                )
+                SELECT s.id, 0, NOW(), NOW(), s.subscription_id, s.s3_path, s.file_size, %(state)s
+                FROM subscription_element_staging s
+                JOIN subscription sub ON sub.id = s.subscription_id AND sub.data->>'state' <> %(deleting)s
+                WHERE NOT EXISTS (
+                    SELECT 1
+                    FROM subscription_element_archive a
+                    WHERE a.subscription_id = s.subscription_id
+                      AND a.s3_path = s.s3_path
+                )
+                ON CONFLICT (subscription_id, s3_path) DO NOTHING
+                RETURNING subscription_id, state, file_size
+                """
+            sql = _counted(sql, _INSERTED_COUNTER_CHANGES, 'SELECT COUNT(*) FROM changed')
+            cursor.execute(sql, {'state': SubscriptionElementState.UNCONSUMED,
+                                 'deleting': SubscriptionState.DELETING})
+            inserted = cursor.fetchone()[0]
+        finally:
+            cursor.close()
+        db.session.commit()
+
+        self._buffer = StringIO()
+        self._buffered = 0
+        self.inserted += inserted
+        return inserted
+
+
+def _lock_live_subscriptions(subscription_ids, states):
+    """ share-locks the rows of the given subscriptions until the current transaction ends, so that none of them can
+        change state (e.g. be marked DELETING, and then purged) while elements are added to them - the UPDATE waits
+        for this transaction instead, and a purge that follows it finds every element this transaction added.
+
+        :return: the ids of those subscriptions that still exist and are in one of states
+        :rtype: set[str] """
+    if not subscription_ids:
+        return set()
+    sql = """
+        SELECT id
+        FROM subscription
+        WHERE id = ANY(CAST(:subscription_ids AS VARCHAR[]))
+          AND data->>'state' = ANY(CAST(:states AS VARCHAR[]))
+        ORDER BY id
+        FOR SHARE
+        """
+    params = {'subscription_ids': sorted(subscription_ids), 'states': list(states)}
+    return set(r[0] for r in db.session.execute(text(sql).bindparams(**params)))
+
+
+def _copy_text(value):
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+# the changes to subscription_element_counter made by a statement, given its RETURNING rows as "changed"
+_INSERTED_COUNTER_CHANGES = """
+    SELECT subscription_id, state, 1 AS count, file_size AS file_size_sum FROM changed
+    """
+_STATE_COUNTER_CHANGES = """
+    SELECT subscription_id, old_state AS state, -1 AS count, -file_size AS file_size_sum FROM changed
+    UNION ALL
+    SELECT subscription_id, state, 1 AS count, file_size AS file_size_sum FROM changed
+    """
+
+
+# every element of :subscription_id, live or archived (archived elements are CONSUMED)
+_ALL_ELEMENT_STATES_SQL = """
+    SELECT state, file_size FROM subscription_element WHERE subscription_id = :subscription_id
+    UNION ALL
+    SELECT :consumed, file_size FROM subscription_element_archive WHERE subscription_id = :subscription_id
+    """
+
+
+def _element_columns(dao):
+    return [
+        dao.id.label('id'),
+        dao.version_id.label('version_id'),
+        dao.created.label('created'),
+        dao.updated.label('updated'),
+        dao.subscription_id.label('subscription_id'),
+        dao.s3_path.label('s3_path'),
+        dao.file_size.label('file_size'),
+        dao.state.label('state'),
+        dao.action_id.label('action_id'),
+        dao.batch_id.label('batch_id'),
+        dao.processed.label('processed'),
+    ]
+
+
+def _archived_element_columns_query():
+    dao = SubscriptionElementArchiveDao
+    return db.session.query(
+        dao.id.label('id'),
+        literal(0).label('version_id'),
+        dao.created.label('created'),
+        dao.updated.label('updated'),
+        dao.subscription_id.label('subscription_id'),
+        dao.s3_path.label('s3_path'),
+        dao.file_size.label('file_size'),
+        literal(SubscriptionElementState.CONSUMED).label('state'),
+        dao.action_id.label('action_id'),
+        null().label('batch_id'),
+        dao.processed.label('processed'),
+    )
+
+
+def _includes_archived_elements(state, gte_processed):
+    return gte_processed is not None and state in (None, SubscriptionElementState.CONSUMED)
+
+
+def _counted(sql, counter_changes_sql, select_sql):
+    """ wraps a data-modifying statement so that the same statement (and so the same transaction) applies its
+        changes to subscription_element_counter.  counter rows are upserted in key order to avoid deadlocks. """
+    return """
+        WITH changed AS (
+            %s
+        ),
+        counted AS (
+            INSERT INTO subscription_element_counter AS c (subscription_id, state, count, file_size_sum)
+            SELECT subscription_id, state, SUM(count), SUM(file_size_sum)
+            FROM (%s) counter_changes
+            GROUP BY subscription_id, state
+            ORDER BY subscription_id, state
+            ON CONFLICT (subscription_id, state) DO UPDATE
+            SET count = c.count + EXCLUDED.count,
+                file_size_sum = c.file_size_sum + EXCLUDED.file_size_sum
+        )
+        %s
+        """ % (sql, counter_changes_sql, select_sql)
+
+
+def _update_subscription_elements_state(subscription_id, where_sql, params, state, **values):
+    """ moves the elements (of subscription_id, if given) matching where_sql to state, also setting any other column
+        values given, and keeps subscription_element_counter in step.  giving the subscription_id lets postgres
+        prune a partitioned subscription_element down to that subscription's partition. """
+    sets = ''.join(', %s = :set_%s' % (k, k) for k in sorted(values))
+    subscription_sql = ''
+    if subscription_id:
+        subscription_sql = 'subscription_id = :subscription_id AND '
+        params = dict(params, subscription_id=subscription_id)
+    sql = """
+        UPDATE subscription_element se
+        SET state = :set_state%s
+        FROM (
+            SELECT subscription_id, id, state
+            FROM subscription_element
+            WHERE %s%s
+            FOR UPDATE
+        ) old
+        WHERE %sse.subscription_id = old.subscription_id
+          AND se.id = old.id
+        RETURNING se.subscription_id, old.state AS old_state, se.state, se.file_size
+        """ % (sets, subscription_sql, where_sql, 'se.' + subscription_sql if subscription_id else '')
+    params = dict(params, set_state=state, **{'set_' + k: v for k, v in values.iteritems()})
+    db.session.execute(text(_counted(sql, _STATE_COUNTER_CHANGES, 'SELECT 1')).bindparams(**params))
+
+
+def subscription_element_partition(subscription_id):
+    """ the (quoted) name of the subscription_element partition for a subscription, or None if its id can't be used
+        in one, in which case its elements stay in the default partition """
+    if not re.match(r'^[A-Za-z0-9_]{1,40}$', subscription_id or ''):
+        return None
+    return '"subscription_element_%s"' % subscription_id
+
+
+def create_subscription_element_partition(subscription_id, lock_timeout_ms=1000):
+    """ creates the partition for a subscription's elements - only for a subscription_element partitioned by
+        dart/tool/migration/partition_subscription_element.py.  it runs in its own short transaction (on a separate
+        connection, so the caller's transaction is untouched), because attaching a partition takes a lock on
+        subscription_element that must not be held while the caller carries on.  lock_timeout_ms bounds how long
+        it waits for that lock, since every other query on subscription_element queues up behind it meanwhile.
+
+        :return: whether the subscription has its own partition - if it can't get one (its id can't be used in a
+                 table name, the lock wasn't granted in time, or the default partition already holds elements with
+                 this subscription_id), its elements simply stay in the default partition """
+    partition = subscription_element_partition(subscription_id)
+    if not partition:
+        return False
+    try:
+        with db.session.get_bind().begin() as connection:
+            if connection.execute(text('SELECT to_regclass(:partition)').bindparams(partition=partition)).scalar():
+                return True
+            connection.execute("SET LOCAL lock_timeout = %s" % int(lock_timeout_ms))
+            connection.execute('CREATE TABLE %s PARTITION OF subscription_element FOR VALUES IN (\'%s\')'
+                               % (partition, subscription_id))
+        return True
+    except DBAPIError:
+        _logger.warning('subscription (id=%s) elements will stay in subscription_element_default, its partition '
+                        'could not be created:\n%s' % (subscription_id, traceback.format_exc()))
+        return False
+
+
+def drop_subscription_element_partition(subscription_id):
+    """ :return: whether the subscription had a partition to drop (otherwise its elements need deleting) """
+    partition = subscription_element_partition(subscription_id)
+    if not partition:
+        return False
+    if db.session.execute(text('SELECT to_regclass(:partition)').bindparams(partition=partition)).scalar() is None:
+        return False
+    db.session.execute('DROP TABLE %s' % partition)
+    return True
+
 
 def _update_subscription_state(subscription, state):
     """ :type subscription: dart.model.subscription.Subscription """
@@ -405,4 +929,10 @@ def _update_subscription_state(subscription, state):
     if state == SubscriptionState.ACTIVE and subscription.data.state == SubscriptionState.GENERATING:
         subscription.data.initial_active_time = datetime.now()
     subscription.data.state = state
-    return patch_difference(SubscriptionDao, source_subscription, subscription)
+    return patch_state_unless_deleting(SubscriptionDao, source_subscription, subscription, SubscriptionState.DELETING)
+
+
+def _log_generation_progress(subscription, count, start_time):
+    elapsed = max(time.time() - start_time, 0.001)
+    _logger.info('generated %s subscription elements for subscription (id=%s) in %.1fs (%.0f keys/s)'
+                 % (count, subscription.id, elapsed, count / elapsed))
@@ -0,0 +1,153 @@
+import bisect
+import logging
+import re
+import threading
+
+from sqlalchemy import text
+
+from dart.context.database import db
+from dart.context.locator import injectable
+from dart.model.orm import SubscriptionDao, DatasetDao
+from dart.model.subscription import SubscriptionState
+
+_logger = logging.getLogger(__name__)
+
+
+@injectable
+class SubscriptionMatchingIndex(object):
+    """ an in-process index of the ACTIVE subscriptions, so that matching an s3 path against them (as
+        SubscriptionService.find_matching_subscriptions does in the database) needs no round trip:
+
+            - a prefix trie over dataset locations finds the datasets containing the path
+            - per location, subscriptions sorted by s3_path_start_prefix_inclusive are bisected, leaving only the
+              end prefix and the precompiled s3_path_regex_filter to check
+
+        every lookup first runs a cheap fingerprint query (the count, max updated and version total of the
+        subscriptions and of the datasets, see _FINGERPRINT_SQL) and rebuilds the index when it changed, so a change
+        made by any process is seen by the next s3 event.  dataset locations are matched as plain prefixes and start/end prefixes compare in code point order (the order s3
+        lists keys in), rather than with LIKE wildcards and the database collation. """
+
+    def __init__(self, dart_config):
+        self._enabled = dart_config['dart'].get('use_subscription_matching_index', True)
+        self._lock = threading.Lock()
+        self._index = None
+        self._fingerprint = None
+
+    def enabled(self):
+        return self._enabled
+
+    def find_matching_subscriptions(self, s3_path):
+        """ :rtype: list[dart.model.subscription.Subscription]
+            :return: the matches, or None if the index can't answer (some regex filter is not valid python) """
+        if isinstance(s3_path, str):
+            s3_path = s3_path.decode('utf-8')
+        index = self._current_index()
+        if index.unsupported:
+            return None
+        return [s.copy() for s in index.match(s3_path)]
+
+    def _current_index(self):
+        with self._lock:
+            fingerprint = self._query_fingerprint()
+            if self._index is None or fingerprint != self._fingerprint:
+                self._index = self._build_index()
+                self._fingerprint = fingerprint
+            return self._index
+
+    @staticmethod
+    def _query_fingerprint():
+        return tuple(db.session.execute(text(_FINGERPRINT_SQL)).fetchone())
+
+    @staticmethod
+    def _build_index():
+        rows = db.session\
+            .query(SubscriptionDao, DatasetDao.data['location'].astext)\
+            .join(DatasetDao, DatasetDao.id == SubscriptionDao.data['dataset_id'].astext)\
+            .filter(SubscriptionDao.data['state'].astext == SubscriptionState.ACTIVE)\
+            .all()
+        index = _SubscriptionIndex()
+        for subscription_dao, location in rows:
+            index.add(location, subscription_dao.to_model())
+        index.seal()
+        _logger.info('built subscription matching index with %s active subscriptions' % len(rows))
+        return index
+
+
+# every insert, update (each bumps version_id and updated) and delete of a subscription or dataset changes this
+_FINGERPRINT_SQL = """
+    SELECT s.count, s.max_updated, s.versions, d.count, d.max_updated, d.versions
+    FROM (SELECT COUNT(*), MAX(updated), SUM(version_id) FROM subscription) AS s (count, max_updated, versions),
+         (SELECT COUNT(*), MAX(updated), SUM(version_id) FROM dataset) AS d (count, max_updated, versions)
+    """
+
+
+class _SubscriptionIndex(object):
+    def __init__(self):
+        self._trie = {}
+        self.unsupported = False
+
+    def add(self, location, subscription):
+        """ :type subscription: dart.model.subscription.Subscription """
+        try:
+            regex = re.compile(subscription.data.s3_path_regex_filter or '')
+        except re.error:
+            _logger.warning('subscription (id=%s) has a regex filter python cannot compile, so s3 events will be '
+                            'matched in the database' % subscription.id)
+            self.unsupported = True
+            return
+        node = self._trie
+        for ch in location or '':
+            node = node.setdefault(ch, {})
+        entries = node.get(None)
+        if entries is None:
+            entries = node[None] = _LocationEntries()
+        entries.add(subscription, regex if subscription.data.s3_path_regex_filter else None)
+
+    def seal(self):
+        stack = [self._trie]
+        while stack:
+            node = stack.pop()
+            for key, child in node.iteritems():
+                if key is None:
+                    child.seal()
+                else:
+                    stack.append(child)
+
+    def match(self, s3_path):
+        matches = []
+        node = self._trie
+        if None in node:
+            node[None].match(s3_path, matches)
+        for ch in s3_path:
+            node = node.get(ch)
+            if node is None:
+                break
+            if None in node:
+                node[None].match(s3_path, matches)
+        return matches
+
+
+class _LocationEntries(object):
+    """ the subscriptions of datasets sharing one location, sorted by start prefix so that those starting after the
+        path can be cut off with a bisect """
+
+    def __init__(self):
+        self._entries = []
+        self._starts = []
+
+    def add(self, subscription, regex):
+        data = subscription.data
+        self._entries.append((data.s3_path_start_prefix_inclusive or u'', data.s3_path_end_prefix_exclusive, regex,
+                              subscription))
+
+    def seal(self):
+        self._entries.sort(key=lambda e: e[0])
+        self._starts = [e[0] for e in self._entries]
+
+    def match(self, s3_path, matches):
+        for start, end, regex, subscription in self._entries[:bisect.bisect_right(self._starts, s3_path)]:
+            if end is not None and not s3_path < end:
+                continue
+            if regex and not regex.search(s3_path):
+                continue
+            matches.append(subscription)
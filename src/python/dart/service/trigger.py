@@ -6,7 +6,7 @@ from dart.model.exception import DartValidationException
 from dart.model.orm import TriggerDao
 from dart.context.database import db
 from dart.model.trigger import TriggerState
-from dart.schema.base import default_and_validate
+from dart.schema.base import cached_schema_validator
 from dart.schema.trigger import trigger_schema
 from dart.service.patcher import retry_stale_data, patch_difference
 from dart.trigger.base import TriggerProcessor
@@ -72,7 +72,7 @@ class TriggerService(object):
         if not trigger_processor:
             raise DartValidationException('unknown trigger_type_name: %s' % trigger_type_name)
         assert isinstance(trigger_processor, TriggerProcessor)
-        trigger = default_and_validate(trigger, trigger_schema(trigger_processor.trigger_type().params_json_schema))
+        trigger = self._schema_validator(trigger_processor).default_and_validate(trigger)
 
         trigger_dao = TriggerDao()
         trigger_dao.id = random_id()
@@ -157,7 +157,17 @@ class TriggerService(object):
     def default_and_validate_trigger(self, trigger):
         trigger_type_name = trigger.data.trigger_type_name
         trigger_processor = self._trigger_processors.get(trigger_type_name)
-        return default_and_validate(trigger, trigger_schema(trigger_processor.trigger_type().params_json_schema))
+        return self._schema_validator(trigger_processor).default_and_validate(trigger)
+
+    @staticmethod
+    def _schema_validator(trigger_processor):
+        # trigger types are defined in code, so their schemas never change while the process is running
+        trigger_type = trigger_processor.trigger_type()
+        return cached_schema_validator(
+            ('trigger', trigger_type.name),
+            None,
+            lambda: trigger_schema(trigger_type.params_json_schema)
+        )
 
     @staticmethod
     def update_trigger_workflow_ids(trigger, workflow_ids):
@@ -1,6 +1,6 @@
 from datetime import datetime
 import logging
-from sqlalchemy import DateTime, desc
+from sqlalchemy import DateTime, desc, and_, text
 from dart.context.locator import injectable
 from dart.model.action import ActionState
 from dart.model.datastore import DatastoreState
@@ -10,6 +10,7 @@ from dart.model.subscription import SubscriptionElementState
 from dart.model.workflow import WorkflowState, WorkflowInstanceState, WorkflowInstanceData
 from dart.schema.base import default_and_validate
 from dart.schema.workflow import workflow_schema, workflow_instance_schema
+from dart.service.batch_delete import delete_in_batches, patch_state_unless_deleting
 from dart.service.patcher import patch_difference, retry_stale_data
 from dart.util.rand import random_id
 
@@ -19,15 +20,17 @@ _logger = logging.getLogger(__name__)
 
 @injectable
 class WorkflowService(object):
-    def __init__(self, datastore_service, action_service, trigger_proxy, filter_service, subscription_service,
-                 subscription_element_service, emailer):
+    def __init__(self, datastore_service, action_service, trigger_proxy, subscription_proxy, filter_service,
+                 subscription_service, subscription_element_service, emailer, dart_config):
         self._datastore_service = datastore_service
         self._action_service = action_service
         self._trigger_proxy = trigger_proxy
+        self._subscription_proxy = subscription_proxy
         self._filter_service = filter_service
         self._subscription_service = subscription_service
         self._subscription_element_service = subscription_element_service
         self._emailer = emailer
+        self._delete_batch_size = dart_config['dart'].get('delete_batch_size', 1000)
 
     @staticmethod
     def save_workflow(workflow, commit=True, flush=False):
@@ -102,6 +105,7 @@ class WorkflowService(object):
     @staticmethod
     def find_workflow_instances_query(workflow_id, states=None, limit=None, offset=None):
         query = WorkflowInstanceDao.query
+        query = query.filter(WorkflowInstanceDao.data['state'].astext != WorkflowInstanceState.DELETING)
         query = query.filter(WorkflowInstanceDao.data['workflow_id'].astext == workflow_id) if workflow_id else query
         query = query.filter(WorkflowInstanceDao.data['state'].astext.in_(states)) if states else query
         query = query.order_by(desc(WorkflowInstanceDao.data['start_time'].cast(DateTime)))
@@ -139,6 +143,7 @@ class WorkflowService(object):
 
     def _query_workflow_instance_query(self, filters):
         query = WorkflowInstanceDao.query.order_by(desc(WorkflowInstanceDao.updated))
+        query = query.filter(WorkflowInstanceDao.data['state'].astext != WorkflowInstanceState.DELETING)
         for f in filters:
             query = self._filter_service.apply_filter(f, query, WorkflowInstanceDao, [workflow_instance_schema()])
         return query
@@ -159,7 +164,9 @@ class WorkflowService(object):
             action_based = SubscriptionElementState.CONSUMED if action_state == ActionState.COMPLETED\
                 else SubscriptionElementState.UNCONSUMED
             state = consume_subscription_state or action_based
-            self._subscription_element_service.update_subscription_elements_state(action.id, state)
+            self._subscription_element_service.update_subscription_elements_state(
+                action.id, state, action.data.args.get('subscription_id')
+            )
         return self._action_service.update_action_state(action, ActionState.FINISHING, action.data.error_message)
 
     @staticmethod
@@ -175,7 +182,7 @@ class WorkflowService(object):
     def update_workflow_state(workflow, state):
         source_workflow = workflow.copy()
         workflow.data.state = state
-        return patch_difference(WorkflowDao, source_workflow, workflow)
+        return patch_state_unless_deleting(WorkflowDao, source_workflow, workflow, WorkflowState.DELETING)
 
     @staticmethod
     def update_workflow_instance(workflow_instance, datastore_id):
@@ -184,21 +191,46 @@ class WorkflowService(object):
         workflow_instance.data.datastore_id = datastore_id
         return patch_difference(WorkflowInstanceDao, source_workflow_instance, workflow_instance)
 
+    def delete_workflow(self, workflow_id):
+        """ marks the workflow DELETING (so it is no longer triggered) and leaves removing it to the subscription
+            worker, see purge_workflow """
+        workflow = self.get_workflow(workflow_id)
+        self.update_workflow_state(workflow, WorkflowState.DELETING)
+        self._subscription_proxy.delete_workflow(workflow_id)
+
+    def delete_workflow_instances(self, workflow_id):
+        """ marks the workflow's instances DELETING (so they are no longer found) and leaves removing them to the
+            subscription worker, see purge_workflow_instances """
+        sql = """
+            UPDATE workflow_instance
+            SET data = jsonb_set(data, '{state}', to_jsonb(CAST(:deleting AS TEXT))),
+                version_id = version_id + 1
+            WHERE data->>'workflow_id' = :workflow_id
+              AND data->>'state' != :deleting
+            """
+        db.session.execute(text(sql).bindparams(workflow_id=workflow_id, deleting=WorkflowInstanceState.DELETING))
+        db.session.commit()
+        self._subscription_proxy.delete_workflow_instances(workflow_id)
+
     @staticmethod
     @retry_stale_data
-    def delete_workflow(workflow_id):
+    def purge_workflow(workflow_id):
+        """ removes the workflow row only, as deleting a workflow always has - its instances are removed separately,
+            see delete_workflow_instances """
         workflow_dao = WorkflowDao.query.get(workflow_id)
+        if not workflow_dao:
+            _logger.info('workflow (id=%s) is already deleted' % workflow_id)
+            return
         db.session.delete(workflow_dao)
         db.session.commit()
+        _logger.info('deleted workflow (id=%s)' % workflow_id)
 
-    @staticmethod
-    @retry_stale_data
-    def delete_workflow_instances(workflow_id):
-        # We delete with synchronize_session=False here to avoid sqlalchemy blowing up.  It basically means
-        # sqlalchemy will not try to figure out which session objects to invalidate (which is fine since the
-        # session will expire after the commit anyways)
-        WorkflowInstanceDao.query.filter(WorkflowInstanceDao.data['workflow_id'].astext == workflow_id).delete(False)
-        db.session.commit()
+    def purge_workflow_instances(self, workflow_id, keep_alive=None):
+        """ removes the workflow's instances marked DELETING by delete_workflow_instances """
+        criterion = and_(WorkflowInstanceDao.data['workflow_id'].astext == workflow_id,
+                         WorkflowInstanceDao.data['state'].astext == WorkflowInstanceState.DELETING)
+        delete_in_batches(WorkflowInstanceDao, criterion, 'instances of workflow (id=%s)' % workflow_id,
+                          self._delete_batch_size, keep_alive=keep_alive)
 
     @staticmethod
     def update_workflow_instance_state(workflow_instance, state, commit_changes=True, error_message=None):
@@ -214,7 +246,8 @@ class WorkflowService(object):
         elif state == WorkflowInstanceState.FAILED:
             workflow_instance.data.end_time = datetime.now()
             workflow_instance.data.error_message = error_message
-        return patch_difference(WorkflowInstanceDao, source_workflow_instance, workflow_instance, commit_changes)
+        return patch_state_unless_deleting(WorkflowInstanceDao, source_workflow_instance, workflow_instance,
+                                           WorkflowInstanceState.DELETING, commit_changes)
 
     def run_triggered_workflow(self, workflow_id, trigger_type, trigger_id=None):
         wf = self.get_workflow(workflow_id, raise_when_missing=False)
@@ -0,0 +1,71 @@
+import json
+import unittest
+
+from dart.client.python import dart_client
+from dart.client.python.dart_client import Dart
+from dart.model.exception import DartRequestException
+
+
+class FakeResponse(object):
+    status_code = 200
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.closed = False
+
+    def iter_lines(self, chunk_size):
+        return iter(self.lines)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeRequests(object):
+    def __init__(self, response):
+        self.response = response
+
+    def get(self, url, params=None, stream=False):
+        return self.response
+
+
+def _element(i):
+    return json.dumps({'id': 'e%s' % i, 'subscription_id': 's1', 's3_path': 's3://b/k%s' % i, 'file_size': i})
+
+
+class TestRequestStream(unittest.TestCase):
+    def setUp(self):
+        self.requests = dart_client.requests
+        self.dart = Dart('localhost')
+
+    def tearDown(self):
+        dart_client.requests = self.requests
+
+    def _stream(self, lines):
+        self.response = FakeResponse(lines)
+        dart_client.requests = FakeRequests(self.response)
+        return self.dart.stream_subscription_elements('a1')
+
+    def test_complete_stream(self):
+        elements = list(self._stream([_element(0), _element(1), json.dumps({'_end': True, 'count': 2})]))
+        self.assertEqual([e.id for e in elements], ['e0', 'e1'])
+        self.assertTrue(self.response.closed)
+
+    def test_stream_cut_short(self):
+        received = []
+        with self.assertRaises(DartRequestException):
+            for e in self._stream([_element(0), _element(1)]):
+                received.append(e.id)
+        # what did arrive was handed over, but the caller can't mistake it for the whole result
+        self.assertEqual(received, ['e0', 'e1'])
+        self.assertTrue(self.response.closed)
+
+    def test_stream_count_mismatch(self):
+        with self.assertRaises(DartRequestException):
+            list(self._stream([_element(0), json.dumps({'_end': True, 'count': 2})]))
+
+    def test_empty_stream(self):
+        self.assertEqual(list(self._stream([json.dumps({'_end': True, 'count': 0})])), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
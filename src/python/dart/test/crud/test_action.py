@@ -21,6 +21,8 @@ class TestActionCrud(unittest.TestCase):
     def tearDown(self):
         self.dart.delete_datastore(self.datastore.id)
         self.dart.delete_workflow(self.workflow.id)
+        self.dart.await_datastore_purge(self.datastore.id)
+        self.dart.await_workflow_purge(self.workflow.id)
 
     def test_crud_datastore(self):
         action0 = Action(data=ActionData(NoOpActionTypes.action_that_succeeds.name, NoOpActionTypes.action_that_succeeds.name, engine_name='no_op_engine'))
@@ -39,6 +39,8 @@ class TestDatastoreCrud(unittest.TestCase):
             self.dart.get_datastore(datastore.id)
         except DartRequestException as e:
             self.assertEqual(e.response.status_code, 404)
+            # gone from the api right away, and from the database once the subscription worker has purged it
+            self.dart.await_datastore_purge(datastore.id)
             return
 
         self.fail('datastore should have been missing after delete!')
@@ -21,6 +21,8 @@ class TestTriggerCrud(unittest.TestCase):
     def tearDown(self):
         self.dart.delete_datastore(self.datastore.id)
         self.dart.delete_workflow(self.workflow.id)
+        self.dart.await_datastore_purge(self.datastore.id)
+        self.dart.await_workflow_purge(self.workflow.id)
 
     def test_crud(self):
         args = {'completed_workflow_id': self.workflow.id}
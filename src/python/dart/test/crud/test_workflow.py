@@ -15,6 +15,7 @@ class TestWorkflowCrud(unittest.TestCase):
 
     def tearDown(self):
         self.dart.delete_datastore(self.datastore.id)
+        self.dart.await_datastore_purge(self.datastore.id)
 
     def test_crud(self):
         wf = Workflow(data=WorkflowData('test-workflow', self.datastore.id, engine_name='no_op_engine'))
@@ -37,6 +38,8 @@ class TestWorkflowCrud(unittest.TestCase):
             self.dart.get_workflow(workflow.id)
         except DartRequestException as e:
             self.assertEqual(e.response.status_code, 404)
+            # gone from the api right away, and from the database once the subscription worker has purged it
+            self.dart.await_workflow_purge(workflow.id)
             return
 
         self.fail('workflow should have been missing after delete!')
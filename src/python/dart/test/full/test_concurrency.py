@@ -43,6 +43,8 @@ class TestConcurrency(object):
         self.dart.delete_workflow_instances(self.workflow.id)
         self.dart.delete_workflow(self.workflow.id)
         self.dart.delete_datastore(self.datastore.id)
+        self.dart.await_workflow_purge(self.workflow.id)
+        self.dart.await_datastore_purge(self.datastore.id)
 
     def test_concurrency(self):
         self.dart.manually_trigger_workflow(self.workflow.id)
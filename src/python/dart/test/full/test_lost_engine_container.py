@@ -35,6 +35,7 @@ class TestLostEngineContainer(object):
 
     def tearDown(self):
         self.dart.delete_datastore(self.datastore.id)
+        self.dart.await_datastore_purge(self.datastore.id)
 
     def test_lost_engine_container(self):
         a = Action(data=ActionData(NoOpActionTypes.action_that_succeeds.name, NoOpActionTypes.action_that_succeeds.name, state=ActionState.HAS_NEVER_RUN))
@@ -44,6 +44,7 @@ class TestLostSubscriptionContainer(object):
     def tearDown(self):
         self.dart.delete_dataset(self.dataset.id)
         self.dart.delete_subscription(self.subscription.id)
+        self.dart.await_subscription_purge(self.subscription.id)
 
     def test_lost_subscription_container(self):
         subscription = self.dart.await_subscription_generation(self.subscription.id)
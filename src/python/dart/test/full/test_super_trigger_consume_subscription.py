@@ -53,6 +53,9 @@ class TestSuperTriggerConsumeSubscription(unittest.TestCase):
         self.dart.delete_datastore(self.datastore.id)
         self.dart.delete_subscription(self.subscription.id)
         self.dart.delete_dataset(self.dataset.id)
+        self.dart.await_workflow_purge(self.workflow.id)
+        self.dart.await_datastore_purge(self.datastore.id)
+        self.dart.await_subscription_purge(self.subscription.id)
 
     def test_super_trigger_consume_subscription(self):
         subscription = self.dart.await_subscription_generation(self.subscription.id)
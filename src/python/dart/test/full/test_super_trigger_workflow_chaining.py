@@ -60,6 +60,10 @@ class TestSuperTriggerWorkflowChaining(unittest.TestCase):
         self.dart.delete_workflow(self.workflow1.id)
         self.dart.delete_datastore(self.datastore0.id)
         self.dart.delete_datastore(self.datastore1.id)
+        self.dart.await_workflow_purge(self.workflow0.id)
+        self.dart.await_workflow_purge(self.workflow1.id)
+        self.dart.await_datastore_purge(self.datastore0.id)
+        self.dart.await_datastore_purge(self.datastore1.id)
 
     def test_super_trigger_workflow_chaining(self):
         self.dart.manually_trigger_workflow(self.workflow0.id)
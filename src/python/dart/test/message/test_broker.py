@@ -0,0 +1,153 @@
+import time
+import unittest
+
+from dart.message.broker import handle_tracked_message, SqsJsonMessageBroker
+from dart.model.message import MessageState
+
+
+class FakeMessage(object):
+    def __init__(self, state):
+        self.state = state
+
+
+class FakeMessageService(object):
+    def __init__(self, messages=None, ecs_task_status=None):
+        self.messages = messages or {}
+        self.ecs_task_status = ecs_task_status
+
+    def get_message(self, message_id, raise_when_missing=True):
+        return self.messages.get(message_id)
+
+    def save_message(self, message_id, message_body, state):
+        self.messages[message_id] = FakeMessage(state)
+        return self.messages[message_id]
+
+    def get_ecs_task_status(self, message):
+        return self.ecs_task_status
+
+    def update_message_state(self, message, state):
+        message.state = state
+
+    def purge_old_messages(self):
+        pass
+
+
+class TestHandleTrackedMessage(unittest.TestCase):
+    def setUp(self):
+        self.handled = []
+        self.deleted = []
+
+    def _handle(self, message_service, message_id='m1'):
+        handle_tracked_message(message_service, message_id, {'k': 'v'},
+                               lambda *args: self.handled.append(args), lambda: self.deleted.append(message_id))
+
+    def test_new_message(self):
+        message_service = FakeMessageService()
+        self._handle(message_service)
+        self.assertEqual(self.handled, [('m1', {'k': 'v'}, False)])
+        self.assertEqual(self.deleted, ['m1'])
+        self.assertEqual(message_service.messages['m1'].state, MessageState.COMPLETED)
+
+    def test_redelivered_finished_message_is_not_handled_again(self):
+        for state in [MessageState.COMPLETED, MessageState.FAILED]:
+            self.handled, self.deleted = [], []
+            self._handle(FakeMessageService({'m1': FakeMessage(state)}))
+            self.assertEqual(self.handled, [])
+            self.assertEqual(self.deleted, ['m1'])
+
+    def test_redelivered_running_message_is_left_alone(self):
+        self._handle(FakeMessageService({'m1': FakeMessage(MessageState.RUNNING)}, ecs_task_status='RUNNING'))
+        self.assertEqual(self.handled, [])
+        self.assertEqual(self.deleted, [])
+
+    def test_redelivered_lost_message_is_handled_as_failed(self):
+        message_service = FakeMessageService({'m1': FakeMessage(MessageState.RUNNING)}, ecs_task_status='STOPPED')
+        self._handle(message_service)
+        self.assertEqual(self.handled, [('m1', {'k': 'v'}, True)])
+        self.assertEqual(self.deleted, ['m1'])
+        self.assertEqual(message_service.messages['m1'].state, MessageState.FAILED)
+
+
+class FakeSqsMessage(object):
+    def __init__(self, id='m1'):
+        self.id = id
+        self.visibility_timeouts = []
+
+    def get_body(self):
+        return {'k': 'v'}
+
+    def change_visibility(self, visibility_timeout):
+        self.visibility_timeouts.append(visibility_timeout)
+
+
+class TestSqsExtendVisibility(unittest.TestCase):
+    def setUp(self):
+        self.broker = SqsJsonMessageBroker('q', visibility_timeout_seconds=30)
+        self.broker._message_service = FakeMessageService()
+        self.broker._queue = type('FakeQueue', (object,), {'delete_message': lambda queue, m: None})()
+        self.sqs_message = FakeSqsMessage()
+
+    def _handle(self, handler):
+        self.broker._handle_message(self.sqs_message, handler)
+
+    def test_extends_only_after_a_third_of_the_timeout(self):
+        def handler(message_id, message_body, previous_handler_failed):
+            self.broker.extend_visibility(message_id)
+            self.broker._in_flight[message_id][1] = time.time() - 11
+            self.broker.extend_visibility(message_id)
+            self.broker.extend_visibility(message_id)
+
+        self._handle(handler)
+        self.assertEqual(self.sqs_message.visibility_timeouts, [30])
+
+    def test_finished_messages_are_not_extended(self):
+        self._handle(lambda *args: None)
+        self.broker.extend_visibility('m1')
+        self.assertEqual(self.sqs_message.visibility_timeouts, [])
+        self.assertEqual(self.broker._in_flight, {})
+
+
+class FakeQueue(object):
+    def __init__(self, messages):
+        self.messages = messages
+        self.deleted = []
+
+    def get_messages(self, num_messages, wait_time_seconds):
+        return self.messages
+
+    def delete_message(self, sqs_message):
+        self.deleted.append(sqs_message.id)
+
+
+class TestSqsHandlerFailures(unittest.TestCase):
+    def setUp(self):
+        self.handled = []
+
+    def _receive(self, handler_pool_size):
+        broker = SqsJsonMessageBroker('q', receive_batch_size=3, handler_pool_size=handler_pool_size)
+        broker._message_service = FakeMessageService()
+        broker._queue = FakeQueue([FakeSqsMessage('m1'), FakeSqsMessage('m2'), FakeSqsMessage('m3')])
+
+        def handler(message_id, message_body, previous_handler_failed):
+            self.handled.append(message_id)
+            if message_id == 'm2':
+                raise ValueError('m2 failed')
+
+        with self.assertRaises(ValueError) as context:
+            broker.receive_message(handler, wait_time_seconds=0)
+        self.assertEqual(str(context.exception), 'm2 failed')
+        return broker
+
+    def test_serial_batch_handles_every_message_then_raises(self):
+        broker = self._receive(handler_pool_size=1)
+        self.assertEqual(self.handled, ['m1', 'm2', 'm3'])
+        self.assertEqual(broker._queue.deleted, ['m1', 'm3'])
+
+    def test_pooled_batch_handles_every_message_then_raises(self):
+        broker = self._receive(handler_pool_size=3)
+        self.assertEqual(sorted(self.handled), ['m1', 'm2', 'm3'])
+        self.assertEqual(sorted(broker._queue.deleted), ['m1', 'm3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+
+from dart.message.call import TriggerCall
+from dart.message.trigger_listener import TriggerListener
+from dart.model.action import Action, ActionData, ActionState
+from dart.model.datastore import Datastore, DatastoreData, DatastoreState
+
+
+class FakeTriggerService(object):
+    @staticmethod
+    def trigger_processors():
+        return {}
+
+
+class FakeDatastoreService(object):
+    def __init__(self, datastores):
+        self.datastores = {d.id: d for d in datastores}
+
+    def get_datastore(self, datastore_id, raise_when_missing=True):
+        return self.datastores.get(datastore_id)
+
+
+class FakeActionService(object):
+    def __init__(self, actions):
+        self.actions = actions
+
+    def find_running_or_queued_action_workflow_ids(self, datastore_id):
+        return []
+
+    def exists_running_or_queued_non_workflow_action(self, datastore_id):
+        return False
+
+    def find_next_runnable_action(self, datastore_id, not_in_workflow_ids, ensure_workflow_action):
+        for a in self.actions:
+            if a.data.datastore_id == datastore_id and a.data.state == ActionState.HAS_NEVER_RUN:
+                return a
+        return None
+
+    @staticmethod
+    def update_action_state(action, state, error_message):
+        action.data.state = state
+
+
+class FakeSubscriptionElementService(object):
+    def __init__(self):
+        self.assigned_action_ids = []
+
+    def assign_subscription_elements(self, action):
+        self.assigned_action_ids.append(action.id)
+
+
+def _action(action_id, datastore_id, action_type_name='load_dataset'):
+    return Action(id=action_id, data=ActionData(action_id, action_type_name, datastore_id=datastore_id))
+
+
+class TestTriggerListener(unittest.TestCase):
+
+    def setUp(self):
+        datastores = [
+            Datastore(id='ds-1', data=DatastoreData('ds-1', state=DatastoreState.ACTIVE)),
+            Datastore(id='ds-2', data=DatastoreData('ds-2', state=DatastoreState.DELETING)),
+        ]
+        self.actions = [_action('a1', 'ds-1', 'consume_subscription'), _action('a2', 'ds-1'), _action('a3', 'ds-2')]
+        self.subscription_element_service = FakeSubscriptionElementService()
+        self.trigger_listener = TriggerListener(
+            trigger_broker=None,
+            trigger_proxy=None,
+            trigger_service=FakeTriggerService(),
+            action_service=FakeActionService(self.actions),
+            datastore_service=FakeDatastoreService(datastores),
+            workflow_service=None,
+            emailer=None,
+            subscription_element_service=self.subscription_element_service,
+        )
+
+    def _try_next_action(self, datastore_id, previous_handler_failed=False):
+        message = {'call': TriggerCall.TRY_NEXT_ACTION, 'datastore_id': datastore_id}
+        self.trigger_listener._handle_call('m1', message, previous_handler_failed)
+
+    def _states(self):
+        return [a.data.state for a in self.actions]
+
+    def test_try_next_action_queues_one_action_per_call(self):
+        self._try_next_action('ds-1')
+        self.assertEqual(self._states(), [ActionState.QUEUED, ActionState.HAS_NEVER_RUN, ActionState.HAS_NEVER_RUN])
+        self.assertEqual(self.subscription_element_service.assigned_action_ids, ['a1'])
+
+        self._try_next_action('ds-1')
+        self.assertEqual(self._states(), [ActionState.QUEUED, ActionState.QUEUED, ActionState.HAS_NEVER_RUN])
+        self.assertEqual(self.subscription_element_service.assigned_action_ids, ['a1'])
+
+        # nothing left to run
+        self._try_next_action('ds-1')
+        self.assertEqual(self._states(), [ActionState.QUEUED, ActionState.QUEUED, ActionState.HAS_NEVER_RUN])
+
+    def test_try_next_action_skips_deleting_and_missing_datastores(self):
+        self._try_next_action('ds-2')
+        self._try_next_action('ds-missing')
+        self.assertEqual(self._states(), [ActionState.HAS_NEVER_RUN] * 3)
+
+    def test_try_next_action_previous_handler_failed(self):
+        self._try_next_action('ds-1', previous_handler_failed=True)
+        self.assertEqual(self._states(), [ActionState.HAS_NEVER_RUN] * 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
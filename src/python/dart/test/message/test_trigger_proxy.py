@@ -0,0 +1,91 @@
+import unittest
+
+from dart.message.call import TriggerCall
+from dart.message.trigger_proxy import TriggerProxy
+
+
+class RecordingBroker(object):
+    def __init__(self):
+        self.messages = []
+
+    def send_message(self, message, delay_seconds=0):
+        self.messages.append((message['datastore_id'], delay_seconds))
+        assert message['call'] == TriggerCall.TRY_NEXT_ACTION
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTriggerProxy(unittest.TestCase):
+
+    def setUp(self):
+        self.broker = RecordingBroker()
+        self.clock = FakeClock()
+
+    def _trigger_proxy(self, coalesce_seconds):
+        return TriggerProxy(self.broker, {'dart': {'try_next_action_coalesce_seconds': coalesce_seconds}}, self.clock)
+
+    def test_try_next_action_coalescing(self):
+        trigger_proxy = self._trigger_proxy(2)
+        for i in range(5):
+            trigger_proxy.try_next_action('ds-1')
+            self.clock.now += 0.1
+        trigger_proxy.try_next_action('ds-2')
+
+        # the first call per datastore is sent immediately, the second is delayed until the window ends, and the
+        # rest are covered by the delayed one
+        self.assertEqual(self.broker.messages, [('ds-1', 0), ('ds-1', 2), ('ds-2', 0)])
+        self.assertEqual(trigger_proxy.try_next_action_merged_count, 4)
+
+    def test_try_next_action_two_calls_in_a_window_send_one_immediate_and_one_trailing(self):
+        trigger_proxy = self._trigger_proxy(2)
+        trigger_proxy.try_next_action('ds-1')
+        self.clock.now += 0.5
+        trigger_proxy.try_next_action('ds-1')
+        self.clock.now += 2
+        self.assertEqual(len(self.broker.messages), 2)
+
+        (immediate, immediate_delay), (trailing, trailing_delay) = self.broker.messages
+        self.assertEqual((immediate, immediate_delay), ('ds-1', 0))
+        # the absorbed call is not lost: the trailing send is delivered no earlier than the window closes
+        self.assertEqual(trailing, 'ds-1')
+        self.assertGreaterEqual(1000.5 + trailing_delay, 1002)
+
+    def test_try_next_action_delay_covers_the_rest_of_the_window(self):
+        trigger_proxy = self._trigger_proxy(3)
+        trigger_proxy.try_next_action('ds-1')
+        self.clock.now += 1.5
+        trigger_proxy.try_next_action('ds-1')
+        self.assertEqual(self.broker.messages, [('ds-1', 0), ('ds-1', 2)])
+
+    def test_try_next_action_window_expires(self):
+        trigger_proxy = self._trigger_proxy(1)
+        trigger_proxy.try_next_action('ds-1')
+        trigger_proxy.try_next_action('ds-1')
+        self.clock.now += 1
+        trigger_proxy.try_next_action('ds-1')
+        self.assertEqual(self.broker.messages, [('ds-1', 0), ('ds-1', 1), ('ds-1', 0)])
+
+    def test_try_next_action_expired_windows_are_evicted(self):
+        trigger_proxy = self._trigger_proxy(1)
+        for i in range(100):
+            trigger_proxy.try_next_action('ds-%s' % i)
+        self.clock.now += 1
+        trigger_proxy.try_next_action('ds-x')
+        self.assertEqual(trigger_proxy._try_next_action_windows.keys(), ['ds-x'])
+
+    def test_try_next_action_coalescing_disabled(self):
+        trigger_proxy = self._trigger_proxy(0)
+        for i in range(3):
+            trigger_proxy.try_next_action('ds-1')
+        self.assertEqual(self.broker.messages, [('ds-1', 0)] * 3)
+        self.assertEqual(trigger_proxy.try_next_action_merged_count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+from datetime import datetime
+import unittest
+
+from dart.model.action import Action, ActionData, ActionState
+from dart.model.base import decode_from_dict
+from dart.model.workflow import Workflow, WorkflowData, WorkflowState
+
+
+class TestDictable(unittest.TestCase):
+
+    def test_round_trip(self):
+        now = datetime(2016, 1, 2, 3, 4, 5, 123456)
+        a = Action(id='a1', version_id=2, created=now, data=ActionData(
+            'load', 'load_dataset', {'nested': {'list': [1, 2]}}, state=ActionState.QUEUED, queued_time=now,
+            order_idx=1.5, tags=['x', 'y'],
+        ))
+        d = a.to_dict()
+        self.assertEqual(d['created'], now.isoformat())
+        self.assertEqual(d['data']['args'], {'nested': {'list': [1, 2]}})
+
+        a2 = Action.from_dict(d)
+        self.assertIsInstance(a2.data, ActionData)
+        self.assertEqual(a2.created, now)
+        self.assertEqual(a2.data.queued_time, now)
+        self.assertEqual(a2.to_dict(), d)
+        self.assertEqual(a.copy().to_dict(), d)
+
+    def test_decode_defaults_and_falsy_values(self):
+        w = Workflow.from_dict({'data': {'name': 'w', 'datastore_id': None, 'engine_name': 'e'}})
+        self.assertIsInstance(w.data, WorkflowData)
+        self.assertIsNone(w.id)
+        self.assertEqual(w.data.state, WorkflowState.INACTIVE)
+        self.assertEqual(w.data.concurrency, 1)
+
+    def test_decode_datetime(self):
+        self.assertEqual(decode_from_dict('datetime.datetime', '2016-01-02T03:04:05'), datetime(2016, 1, 2, 3, 4, 5))
+        self.assertEqual(decode_from_dict('datetime.datetime', '2016-01-02 03:04'), datetime(2016, 1, 2, 3, 4))
+        self.assertEqual(decode_from_dict('list[datetime.datetime]', ['2016-01-02T03:04:05.000001']),
+                         [datetime(2016, 1, 2, 3, 4, 5, 1)])
+        self.assertIsNone(decode_from_dict('datetime.datetime', None))
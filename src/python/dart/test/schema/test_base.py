@@ -0,0 +1,34 @@
+import unittest
+
+from dart.engine.no_op.metadata import NoOpActionTypes
+from dart.model.action import ActionData, Action
+from dart.schema.action import action_schema
+from dart.schema.base import cached_schema_validator, default_and_validate, evict_schema_validators
+
+
+class TestSchemaValidator(unittest.TestCase):
+
+    def test_cached_validator_matches_default_and_validate(self):
+        params_schema = NoOpActionTypes.copy_hdfs_to_s3_action.params_json_schema
+        schema_validator = cached_schema_validator(('action', 'test_engine', 'copy_hdfs_to_s3'), 1, lambda: action_schema(params_schema))
+        for i in range(2):
+            a = Action(data=ActionData('copy_hdfs_to_s3', 'copy_hdfs_to_s3', {
+                'source_hdfs_path': 'hdfs:///user/hive/warehouse/dtest4',
+                'destination_s3_path': 's3://fake-bucket/dart_testing',
+            }, engine_name='no_op_engine'))
+            expected = default_and_validate(a, action_schema(params_schema)).to_dict()
+            actual = schema_validator.default_and_validate(a)
+            self.assertEqual(actual.to_dict(), expected)
+
+            # defaults must not be shared with the cached schema
+            actual.data.tags.append('mutated')
+            self.assertEqual(schema_validator.schema['properties']['data']['properties']['tags']['default'], [])
+
+    def test_cache_versioning(self):
+        key = ('datastore', 'test_engine')
+        v1 = cached_schema_validator(key, 1, lambda: {'type': 'object'})
+        self.assertIs(cached_schema_validator(key, 1, lambda: {'type': 'object'}), v1)
+        v2 = cached_schema_validator(key, 2, lambda: {'type': 'object'})
+        self.assertIsNot(v2, v1)
+        evict_schema_validators('test_engine')
+        self.assertIsNot(cached_schema_validator(key, 2, lambda: {'type': 'object'}), v2)
@@ -0,0 +1,90 @@
+import unittest
+
+import dart.service.action as action_module
+from dart.model.action import Action, ActionData, ActionState
+from dart.service.action import ActionService
+
+
+class FakeActionDaoInstance(object):
+    def __init__(self, action_id):
+        self.id = action_id
+
+    def to_model(self):
+        return Action(id=self.id, data=ActionData(self.id, 'action_that_succeeds', state=ActionState.PENDING))
+
+
+class FakeQuery(object):
+    """ stands in for ActionDao.query, where ids in locked_or_moved_on are skipped the way FOR UPDATE SKIP LOCKED
+        and the QUEUED check would skip them """
+
+    def __init__(self, locked_or_moved_on):
+        self.locked_or_moved_on = locked_or_moved_on
+        self.statements = []
+        self._result = []
+
+    def from_statement(self, statement):
+        params = statement.compile().params
+        self.statements.append((str(statement), params))
+        self._result = [FakeActionDaoInstance(i) for i in params['action_ids'] if i not in self.locked_or_moved_on]
+        return self
+
+    def populate_existing(self):
+        return self
+
+    def all(self):
+        return self._result
+
+
+class FakeActionDao(object):
+    query = None
+
+
+class FakeSession(object):
+    def __init__(self):
+        self.commits = 0
+
+    def commit(self):
+        self.commits += 1
+
+
+class FakeDb(object):
+    def __init__(self):
+        self.session = FakeSession()
+
+
+class TestClaimQueuedActions(unittest.TestCase):
+
+    def setUp(self):
+        self._action_dao = action_module.ActionDao
+        self._db = action_module.db
+        action_module.ActionDao = FakeActionDao
+        action_module.db = FakeDb()
+
+    def tearDown(self):
+        action_module.ActionDao = self._action_dao
+        action_module.db = self._db
+
+    def test_claims_in_one_statement_skipping_locked_rows(self):
+        FakeActionDao.query = FakeQuery(locked_or_moved_on=['a2'])
+
+        claimed = ActionService.claim_queued_actions(['a1', 'a2', 'a3'])
+
+        self.assertEqual([a.id for a in claimed], ['a1', 'a3'])
+        self.assertEqual(len(FakeActionDao.query.statements), 1)
+        sql, params = FakeActionDao.query.statements[0]
+        self.assertIn('FOR UPDATE SKIP LOCKED', sql)
+        self.assertEqual(params['action_ids'], ('a1', 'a2', 'a3'))
+        self.assertEqual(params['queued_state'], ActionState.QUEUED)
+        self.assertEqual(params['pending'], ActionState.PENDING)
+        self.assertEqual(action_module.db.session.commits, 1)
+
+    def test_nothing_to_claim_runs_no_statement(self):
+        FakeActionDao.query = FakeQuery(locked_or_moved_on=[])
+
+        self.assertEqual(ActionService.claim_queued_actions([]), [])
+        self.assertEqual(FakeActionDao.query.statements, [])
+        self.assertEqual(action_module.db.session.commits, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+
+from sqlalchemy import Column, String, TIMESTAMP, or_
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import Query
+
+from dart.engine.no_op.metadata import NoOpActionTypes
+from dart.schema.action import action_schema
+from dart.schema.datastore import datastore_schema
+from dart.service.filter import FilterService
+
+
+class FakeDao(declarative_base()):
+    __tablename__ = 'fake'
+    id = Column(String(length=36), primary_key=True)
+    created = Column(TIMESTAMP)
+    updated = Column(TIMESTAMP)
+    data = Column(JSONB)
+
+
+SCHEMAS = tuple(
+    [action_schema(a.params_json_schema) for a in [
+        NoOpActionTypes.action_that_succeeds,
+        NoOpActionTypes.copy_hdfs_to_s3_action,
+        NoOpActionTypes.load_dataset,
+    ]] +
+    [datastore_schema({
+        'type': 'object',
+        'properties': {
+            'instance_count': {'type': 'integer'},
+            'steps': {'type': 'array', 'items': {'type': 'object', 'properties': {'name': {'type': 'string'}}}},
+        },
+    })]
+)
+
+FILTER_CASES = [
+    'id = abc',
+    'name = my_action',
+    'name ~ myact',
+    'name LIKE my%',
+    'state IN QUEUED,RUNNING',
+    'state != FAILED',
+    'order_idx > 1.5',
+    'progress <= 0.5',
+    'args.dataset_id = ds1',
+    'args.instance_count >= 3',
+    'args.steps.name = step1',
+    'tags = nightly',
+]
+
+
+def to_sql(query):
+    return str(query.statement.compile(dialect=postgresql.dialect()))
+
+
+def to_sql_and_params(query):
+    compiled = query.statement.compile(dialect=postgresql.dialect())
+    return str(compiled), compiled.params
+
+
+def apply_filter_per_schema(filter_service, f, query, dao, schemas):
+    """ apply_filter as it was before compile_filter_plan, resolving each schema's type inline """
+    op = filter_service._operator_handlers[f.operator]
+    if f.key in ['id', 'created', 'updated']:
+        return query.filter(op.evaluate(lambda v: v, getattr(dao, f.key), str, f.value))
+    path_keys = f.key.split('.')
+    filters = []
+    visited = {}
+    for schema in schemas:
+        type_, array_indexes = filter_service._get_type(path_keys, schema)
+        identifier = type_ + '@' + str(array_indexes)
+        if identifier in visited:
+            continue
+        visited[identifier] = 1
+        key_groups = filter_service.get_key_groups(array_indexes, path_keys)
+        last_is_array = array_indexes[-1] == len(path_keys) - 1 if len(array_indexes) > 0 else False
+        filters.append(filter_service.expr(0, 'data', dao.data, key_groups, type_, f.value, op, last_is_array))
+    return query.filter(filters[0]) if len(filters) == 1 else query.filter(or_(*filters))
+
+
+class TestFilterService(unittest.TestCase):
+
+    def test_from_string(self):
+        f = FilterService().from_string(' order_idx >= 1.5 ')
+        self.assertEqual((f.key, f.operator, f.value), ('order_idx', '>=', '1.5'))
+
+    def test_apply_filter_cases(self):
+        filter_service = FilterService()
+        for f_string in FILTER_CASES:
+            f = filter_service.from_string(f_string)
+            expected = to_sql_and_params(apply_filter_per_schema(filter_service, f, Query(FakeDao), FakeDao, SCHEMAS))
+            actual = to_sql_and_params(filter_service.apply_filter(f, Query(FakeDao), FakeDao, SCHEMAS))
+            self.assertEqual(actual, expected, f_string)
+
+    def test_plan_resolution(self):
+        filter_service = FilterService()
+        # the datastore schema has no order_idx, so that one falls back to a string comparison
+        self.assertEqual(filter_service.compile_filter_plan('order_idx', SCHEMAS),
+                         [('number', [['order_idx']], False), ('string', [['order_idx']], False)])
+        self.assertEqual(filter_service.compile_filter_plan('args.steps.name', SCHEMAS),
+                         [('string', [['args', 'steps', 'name']], False), ('string', [['args', 'steps'], ['name']], False)])
+        self.assertEqual(filter_service.compile_filter_plan('tags', SCHEMAS), [('array', [['tags']], True)])
+
@@ -0,0 +1,146 @@
+import json
+import unittest
+
+from dart.model.datastore import Datastore, DatastoreData, DatastoreState
+from dart.model.exception import DartValidationException
+from dart.service.batch_delete import patch_state_unless_deleting
+from dart.service.patcher import patch_difference
+
+
+class FakeDaoInstance(object):
+    def __init__(self, values):
+        self.__dict__.update(values)
+
+    def to_model(self):
+        return Datastore.from_dict({k: v for k, v in self.__dict__.iteritems()})
+
+
+class FakeQuery(object):
+    """ stands in for DatastoreDao.query over a single row, recording which path each update took """
+
+    def __init__(self, row):
+        self.row = row
+        self.statements = []
+        self.gets = 0
+        self._result = []
+
+    def from_statement(self, statement):
+        params = statement.compile().params
+        self.statements.append(str(statement))
+        self._result = []
+        if params['id'] == self.row['id'] and params['version_id'] == self.row['version_id']:
+            self.row['data'] = dict(self.row['data'], **json.loads(params['changes']))
+            self.row['version_id'] += 1
+            self._result = [FakeDaoInstance(self.row)]
+        return self
+
+    def populate_existing(self):
+        return self
+
+    def all(self):
+        return self._result
+
+    def get(self, model_id):
+        self.gets += 1
+        return FakeDaoInstance(self.row)
+
+
+class FakeDatastoreDao(object):
+    __tablename__ = 'datastore'
+    __table__ = type('FakeTable', (object,), {'columns': {'id': None, 'version_id': None, 'data': None}})
+    query = None
+
+    @classmethod
+    def promoted_column_values(cls, data):
+        return {}
+
+
+class DatastoreRowTestCase(unittest.TestCase):
+
+    def setUp(self):
+        datastore = Datastore(id='ds-1', version_id=3, data=DatastoreData('ds', args={'a': 1, 'b': {'c': 2}}))
+        self.src = datastore
+        self.query = FakeQuery(datastore.to_dict())
+        FakeDatastoreDao.query = self.query
+
+    def _dest(self, **changes):
+        dest = self.src.copy()
+        for k, v in changes.iteritems():
+            setattr(dest.data, k, v)
+        return dest
+
+
+class TestPatchDifference(DatastoreRowTestCase):
+
+    def test_changed_data_is_merged_at_the_pinned_version(self):
+        dest = self._dest(state=DatastoreState.ACTIVE, args={'a': 1, 'b': {'c': 3, 'd': 4}})
+        updated = patch_difference(FakeDatastoreDao, self.src, dest, commit=False)
+
+        self.assertEqual(len(self.query.statements), 1)
+        self.assertIn('version_id = :version_id', self.query.statements[0])
+        self.assertEqual(self.query.gets, 0)
+        self.assertEqual(updated.version_id, 4)
+        self.assertEqual(updated.data.state, DatastoreState.ACTIVE)
+        self.assertEqual(updated.data.args, {'a': 1, 'b': {'c': 3, 'd': 4}})
+
+    def test_version_conflict_falls_back_to_patch_data(self):
+        # another writer moved the row on since src was read
+        self.query.row['version_id'] = 4
+        self.query.row['data'] = dict(self.query.row['data'], concurrency=5)
+        dest = self._dest(state=DatastoreState.ACTIVE)
+        updated = patch_difference(FakeDatastoreDao, self.src, dest, commit=False)
+
+        self.assertEqual(len(self.query.statements), 1)
+        self.assertEqual(self.query.gets, 1)
+        # the patch is applied on top of the current row, keeping the other writer's change
+        self.assertEqual(updated.data.state, DatastoreState.ACTIVE)
+        self.assertEqual(updated.data.concurrency, 5)
+
+    def test_removed_nested_key_goes_through_patch_data(self):
+        dest = self._dest(args={'a': 1, 'b': {}})
+        updated = patch_difference(FakeDatastoreDao, self.src, dest, commit=False)
+
+        self.assertEqual(self.query.statements, [])
+        self.assertEqual(self.query.gets, 1)
+        self.assertEqual(updated.data.args, {'a': 1, 'b': {}})
+
+    def test_removed_key_goes_through_patch_data(self):
+        dest = self._dest(args={'b': {'c': 2}})
+        updated = patch_difference(FakeDatastoreDao, self.src, dest, commit=False)
+
+        self.assertEqual(self.query.statements, [])
+        self.assertEqual(self.query.gets, 1)
+        self.assertEqual(updated.data.args, {'b': {'c': 2}})
+
+
+class TestPatchStateUnlessDeleting(DatastoreRowTestCase):
+
+    def test_state_change_is_a_single_update(self):
+        dest = self._dest(state=DatastoreState.ACTIVE)
+        updated = patch_state_unless_deleting(FakeDatastoreDao, self.src, dest, DatastoreState.DELETING, commit=False)
+
+        self.assertEqual(len(self.query.statements), 1)
+        self.assertEqual(self.query.gets, 0)
+        self.assertEqual(updated.data.state, DatastoreState.ACTIVE)
+
+    def test_row_marked_deleting_since_it_was_read_is_rejected(self):
+        self.query.row['version_id'] = 4
+        self.query.row['data'] = dict(self.query.row['data'], state=DatastoreState.DELETING)
+        dest = self._dest(state=DatastoreState.ACTIVE)
+
+        with self.assertRaises(DartValidationException):
+            patch_state_unless_deleting(FakeDatastoreDao, self.src, dest, DatastoreState.DELETING, commit=False)
+        self.assertEqual(self.query.row['data']['state'], DatastoreState.DELETING)
+
+    def test_model_read_as_deleting_is_rejected_without_an_update(self):
+        self.src.data.state = DatastoreState.DELETING
+        self.query.row['data'] = dict(self.query.row['data'], state=DatastoreState.DELETING)
+        dest = self._dest(state=DatastoreState.ACTIVE)
+
+        with self.assertRaises(DartValidationException):
+            patch_state_unless_deleting(FakeDatastoreDao, self.src, dest, DatastoreState.DELETING, commit=False)
+        self.assertEqual(self.query.statements, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
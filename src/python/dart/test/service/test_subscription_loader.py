@@ -0,0 +1,75 @@
+import unittest
+
+import dart.service.subscription as subscription_module
+from dart.model.subscription import SubscriptionState
+from dart.service.subscription import _copy_text, SubscriptionElementService
+
+
+class FakeSession(object):
+    def __init__(self, live_subscription_ids):
+        self.live_subscription_ids = live_subscription_ids
+        self.statements = []
+        self.commits = 0
+
+    def execute(self, clause):
+        sql = str(clause)
+        self.statements.append((sql, clause.compile().params))
+        if 'FOR SHARE' in sql:
+            return [(sid,) for sid in self.live_subscription_ids]
+        return [(p,) for k, p in sorted(clause.compile().params.items()) if k.startswith('sid_')]
+
+    def commit(self):
+        self.commits += 1
+
+
+class FakeDb(object):
+    def __init__(self, session):
+        self.session = session
+
+
+class TestSubscriptionElementLoader(unittest.TestCase):
+
+    def test_copy_text_escapes_special_characters(self):
+        self.assertEqual(_copy_text('s3://bucket/a\tb\nc\rd\\e'), 's3://bucket/a\\tb\\nc\\rd\\\\e')
+
+    def test_copy_text_encodes_unicode(self):
+        self.assertEqual(_copy_text(u's3://bucket/caf\xe9'), 's3://bucket/caf\xc3\xa9')
+
+
+class TestInsertSubscriptionElements(unittest.TestCase):
+
+    def setUp(self):
+        self._db = subscription_module.db
+
+    def tearDown(self):
+        subscription_module.db = self._db
+
+    def test_skips_subscriptions_that_are_no_longer_active(self):
+        session = FakeSession(live_subscription_ids=['s1'])
+        subscription_module.db = FakeDb(session)
+        elements = [('s1', 's3://b/1', 1), ('s2', 's3://b/2', 2), ('s1', 's3://b/3', 3)]
+
+        inserted = SubscriptionElementService.insert_subscription_elements(elements)
+
+        self.assertEqual(inserted, ['s1', 's1'])
+        lock_sql, lock_params = session.statements[0]
+        self.assertIn('FOR SHARE', lock_sql)
+        self.assertEqual(lock_params['subscription_ids'], ['s1', 's2'])
+        self.assertEqual(lock_params['states'], [SubscriptionState.ACTIVE])
+        insert_sql, insert_params = session.statements[1]
+        self.assertNotIn('s2', insert_params.values())
+        self.assertEqual(session.commits, 1)
+
+    def test_inserts_nothing_when_no_subscription_is_live(self):
+        session = FakeSession(live_subscription_ids=[])
+        subscription_module.db = FakeDb(session)
+
+        inserted = SubscriptionElementService.insert_subscription_elements([('s2', 's3://b/2', 2)])
+
+        self.assertEqual(inserted, [])
+        self.assertEqual(len(session.statements), 1)
+        self.assertEqual(session.commits, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+
+import dart.service.subscription_matching as subscription_matching_module
+from dart.model.subscription import Subscription, SubscriptionData
+from dart.service.subscription_matching import _SubscriptionIndex, SubscriptionMatchingIndex
+
+
+def _subscription(id, start=None, end=None, regex=None):
+    return Subscription(id=id, data=SubscriptionData(id, 'ds', s3_path_start_prefix_inclusive=start,
+                                                     s3_path_end_prefix_exclusive=end, s3_path_regex_filter=regex))
+
+
+class TestSubscriptionIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = _SubscriptionIndex()
+        self.index.add(u's3://bucket/a/', _subscription('all_a'))
+        self.index.add(u's3://bucket/a/', _subscription('a_from_2016', start=u's3://bucket/a/2016'))
+        self.index.add(u's3://bucket/a/', _subscription('a_2016', start=u's3://bucket/a/2016', end=u's3://bucket/a/2017'))
+        self.index.add(u's3://bucket/a/', _subscription('a_gz', regex=r'\.gz$'))
+        self.index.add(u's3://bucket/a/b/', _subscription('all_a_b'))
+        self.index.add(u's3://bucket/c/', _subscription('all_c'))
+        self.index.seal()
+
+    def match_ids(self, s3_path):
+        return sorted(s.id for s in self.index.match(s3_path))
+
+    def test_nested_locations(self):
+        self.assertEqual(self.match_ids(u's3://bucket/a/b/x'), ['a_from_2016', 'all_a', 'all_a_b'])
+        self.assertEqual(self.match_ids(u's3://bucket/c/x'), ['all_c'])
+        self.assertEqual(self.match_ids(u's3://bucket/d/x'), [])
+
+    def test_start_and_end_prefixes(self):
+        self.assertEqual(self.match_ids(u's3://bucket/a/2015/x'), ['all_a'])
+        self.assertEqual(self.match_ids(u's3://bucket/a/2016/x'), ['a_2016', 'a_from_2016', 'all_a'])
+        self.assertEqual(self.match_ids(u's3://bucket/a/2017/x'), ['a_from_2016', 'all_a'])
+
+    def test_regex_filter(self):
+        self.assertEqual(self.match_ids(u's3://bucket/a/2015/x.gz'), ['a_gz', 'all_a'])
+
+    def test_invalid_regex_is_unsupported(self):
+        index = _SubscriptionIndex()
+        index.add(u's3://bucket/a/', _subscription('bad', regex='(?<bad'))
+        self.assertTrue(index.unsupported)
+
+
+class FakeResult(object):
+    def __init__(self, row):
+        self.row = row
+
+    def fetchone(self):
+        return self.row
+
+
+class FakeSession(object):
+    def __init__(self):
+        self.fingerprint = (1, '2016-01-01', 1, 1, '2016-01-01', 1)
+        self.fingerprint_queries = 0
+
+    def execute(self, statement):
+        self.fingerprint_queries += 1
+        return FakeResult(self.fingerprint)
+
+
+class FakeDb(object):
+    def __init__(self):
+        self.session = FakeSession()
+
+
+class CountingMatchingIndex(SubscriptionMatchingIndex):
+    def __init__(self):
+        super(CountingMatchingIndex, self).__init__({'dart': {}})
+        self.builds = 0
+
+    def _build_index(self):
+        self.builds += 1
+        index = _SubscriptionIndex()
+        index.add(u's3://bucket/a/', _subscription('all_a_%s' % self.builds))
+        index.seal()
+        return index
+
+
+class TestSubscriptionMatchingIndex(unittest.TestCase):
+
+    def setUp(self):
+        self._db = subscription_matching_module.db
+        self.db = subscription_matching_module.db = FakeDb()
+        self.matching_index = CountingMatchingIndex()
+
+    def tearDown(self):
+        subscription_matching_module.db = self._db
+
+    def match_ids(self, s3_path):
+        return [s.id for s in self.matching_index.find_matching_subscriptions(s3_path)]
+
+    def test_fingerprint_is_checked_on_every_lookup(self):
+        self.assertEqual(self.match_ids(u's3://bucket/a/x'), ['all_a_1'])
+        self.assertEqual(self.match_ids(u's3://bucket/a/y'), ['all_a_1'])
+        self.assertEqual(self.db.session.fingerprint_queries, 2)
+        self.assertEqual(self.matching_index.builds, 1)
+
+    def test_changed_fingerprint_rebuilds_the_index(self):
+        self.match_ids(u's3://bucket/a/x')
+        # e.g. another process moved a subscription out of ACTIVE
+        self.db.session.fingerprint = (1, '2016-01-02', 2, 1, '2016-01-01', 1)
+        self.assertEqual(self.match_ids(u's3://bucket/a/x'), ['all_a_2'])
+        self.assertEqual(self.matching_index.builds, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,237 @@
+import time
+import unittest
+
+from dart.model.action import Action, ActionData, ActionState
+from dart.model.datastore import Datastore, DatastoreData, DatastoreState
+from dart.model.engine import Engine, EngineData
+from dart.service.action import ActionService
+from dart.service.datastore import DatastoreService
+from dart.service.engine import EngineService
+from dart.worker.engine import EngineWorker, LocalEngineProcessPool, Schedule
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeProcess(object):
+    def __init__(self, alive):
+        self.alive = alive
+        self.joined = False
+        self.pid = 1
+        self.exitcode = None if alive else 0
+
+    def is_alive(self):
+        return self.alive
+
+    def join(self):
+        self.joined = True
+
+
+class FakeEngineInstance(object):
+    def run(self):
+        pass
+
+
+class FakePool(object):
+    def __init__(self, free_slots=10):
+        self.max_processes = free_slots
+        self._free_slots = free_slots
+        self.reaps = 0
+
+    def reap(self):
+        self.reaps += 1
+
+    def free_slots(self):
+        return self._free_slots
+
+    def in_use(self):
+        return self.max_processes - self._free_slots
+
+
+# the worker asserts the types of its services, so the fakes subclass them (without running their constructors)
+class FakeActionService(ActionService):
+    def __init__(self, queued_actions, action_counts):
+        self.queued_actions = queued_actions
+        self.action_counts = action_counts
+        self.action_count_queries = []
+        self.claimed_ids = None
+
+    def find_actions(self, states=None, **kwargs):
+        assert states == [ActionState.QUEUED]
+        return self.queued_actions
+
+    def find_action_counts_by_datastore(self, datastore_ids, states):
+        self.action_count_queries.append(sorted(datastore_ids))
+        return dict(self.action_counts)
+
+    def claim_queued_actions(self, action_ids):
+        self.claimed_ids = action_ids
+        return []
+
+
+class FakeDatastoreService(DatastoreService):
+    def __init__(self, datastores):
+        self.datastores = datastores
+        self.lookups = []
+
+    def get_datastores(self, datastore_ids):
+        self.lookups.append(sorted(datastore_ids))
+        return [d for d in self.datastores if d.id in datastore_ids]
+
+
+class FakeEngineService(EngineService):
+    def __init__(self, engine_names):
+        self.engine_names = engine_names
+        self.lookups = []
+
+    def get_engines_by_name(self, engine_names):
+        self.lookups.append(sorted(engine_names))
+        return [Engine(id=n, data=EngineData(n, n, {}, [])) for n in engine_names if n in self.engine_names]
+
+
+def _action(id, datastore_id, engine_name='no_op_engine'):
+    return Action(id=id, data=ActionData(id, 'action_that_succeeds', state=ActionState.QUEUED,
+                                         engine_name=engine_name, datastore_id=datastore_id))
+
+
+def _datastore(id, state=DatastoreState.ACTIVE, concurrency=1):
+    return Datastore(id=id, data=DatastoreData(id, state=state, concurrency=concurrency))
+
+
+def _worker(action_service=None, datastore_service=None, engine_service=None, pool=None):
+    worker = EngineWorker.__new__(EngineWorker)
+    worker._action_service = action_service
+    worker._datastore_service = datastore_service
+    worker._engine_service = engine_service
+    worker._local_engine_pool = pool
+    worker._dispatch_listener = None
+    worker._sleep_seconds = 0
+    worker._engine_taskrunner_ecs_cluster = None
+    worker._schedule = Schedule(transition_queued=60, transition_stale=60, transition_orphaned=60, scale_down=60)
+    return worker
+
+
+class TestSchedule(unittest.TestCase):
+
+    def test_keys_are_due_once_per_interval(self):
+        clock = FakeClock()
+        schedule = Schedule(clock=clock, fast=1.4, slow=42)
+        self.assertFalse(schedule.is_due('fast'))
+
+        clock.now += 1.5
+        self.assertTrue(schedule.is_due('fast'))
+        self.assertFalse(schedule.is_due('fast'))
+        self.assertFalse(schedule.is_due('slow'))
+
+        clock.now += 41
+        self.assertTrue(schedule.is_due('fast'))
+        self.assertTrue(schedule.is_due('slow'))
+        self.assertFalse(schedule.is_due('slow'))
+
+    def test_intervals_are_measured_from_the_last_run(self):
+        clock = FakeClock()
+        schedule = Schedule(clock=clock, fast=1.4)
+        # a late check does not make the next one due any sooner
+        clock.now += 3
+        self.assertTrue(schedule.is_due('fast'))
+        clock.now += 1
+        self.assertFalse(schedule.is_due('fast'))
+
+
+class TestLocalEngineProcessPool(unittest.TestCase):
+
+    def test_reap_joins_and_frees_finished_processes(self):
+        pool = LocalEngineProcessPool(3)
+        finished, running = FakeProcess(alive=False), FakeProcess(alive=True)
+        pool._processes_by_action_id = {'a1': finished, 'a2': running}
+
+        self.assertEqual(pool.free_slots(), 2)
+        self.assertTrue(finished.joined)
+        self.assertFalse(running.joined)
+        self.assertEqual(pool.in_use(), 1)
+
+    def test_free_slots_never_go_negative(self):
+        pool = LocalEngineProcessPool(1)
+        pool._processes_by_action_id = {'a1': FakeProcess(alive=True), 'a2': FakeProcess(alive=True)}
+        self.assertEqual(pool.free_slots(), 0)
+
+    def test_launch_runs_the_engine_in_a_process_and_rejects_when_full(self):
+        pool = LocalEngineProcessPool(1)
+        engine = Engine(id='e1', data=EngineData('no_op_engine', 'no op', {}, []))
+        pool.launch(engine, FakeEngineInstance(), _action('a1', 'ds1'))
+        self.assertEqual(pool.in_use(), 1)
+        self.assertRaises(AssertionError, pool.launch, engine, FakeEngineInstance(), _action('a2', 'ds1'))
+
+        deadline = time.time() + 10
+        while pool.in_use() and time.time() < deadline:
+            time.sleep(0.05)
+            pool.reap()
+        self.assertEqual(pool.in_use(), 0)
+
+
+class TestEngineWorker(unittest.TestCase):
+
+    def test_every_tick_reaps_local_engines(self):
+        pool = FakePool()
+        worker = _worker(pool=pool)
+        worker.run()
+        worker.run()
+        # nothing was due or queued, so only the per-tick reap touched the pool
+        self.assertEqual(pool.reaps, 2)
+
+    def test_dispatch_looks_up_in_bulk_and_tracks_concurrency_in_memory(self):
+        action_service = FakeActionService(
+            queued_actions=[
+                _action('a1', 'ds1'),
+                _action('a2', 'ds1'),
+                _action('a3', 'ds1'),
+                _action('a4', 'ds2'),
+                _action('a5', 'ds3'),
+                _action('a6', 'ds1', engine_name='missing_engine'),
+                _action('a7', 'ds_missing'),
+            ],
+            action_counts={'ds1': 1},
+        )
+        datastore_service = FakeDatastoreService([
+            _datastore('ds1', concurrency=3),
+            _datastore('ds2'),
+            _datastore('ds3', state=DatastoreState.INACTIVE),
+        ])
+        engine_service = FakeEngineService(['no_op_engine'])
+        worker = _worker(action_service, datastore_service, engine_service)
+
+        worker._transition_queued_actions_to_pending()
+
+        # ds1 has one action in flight and room for two more, ds3 is inactive, and the rest can't be dispatched
+        self.assertEqual(action_service.claimed_ids, ['a1', 'a2', 'a4'])
+        self.assertEqual(datastore_service.lookups, [['ds1', 'ds2', 'ds3', 'ds_missing']])
+        self.assertEqual(engine_service.lookups, [['missing_engine', 'no_op_engine']])
+        self.assertEqual(action_service.action_count_queries, [['ds1', 'ds2', 'ds3', 'ds_missing']])
+
+    def test_dispatch_is_limited_to_free_local_engine_slots(self):
+        action_service = FakeActionService([_action('a1', 'ds1'), _action('a2', 'ds1')], {})
+        worker = _worker(action_service, FakeDatastoreService([_datastore('ds1', concurrency=5)]),
+                         FakeEngineService(['no_op_engine']), FakePool(free_slots=1))
+
+        worker._transition_queued_actions_to_pending()
+
+        self.assertEqual(action_service.claimed_ids, ['a1'])
+
+    def test_nothing_queued_skips_the_lookups(self):
+        action_service = FakeActionService([], {})
+        datastore_service = FakeDatastoreService([])
+        worker = _worker(action_service, datastore_service, FakeEngineService([]))
+
+        worker._transition_queued_actions_to_pending()
+
+        self.assertIsNone(action_service.claimed_ids)
+        self.assertEqual(datastore_service.lookups, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import argparse
+from datetime import datetime, timedelta
+import logging
+import time
+
+from dart.service.subscription import SubscriptionElementService
+from dart.tool.tool_runner import Tool
+
+_logger = logging.getLogger(__name__)
+
+
+class ArchiveSubscriptionElementsTool(Tool):
+    """ moves CONSUMED subscription elements processed more than retention days ago into
+        subscription_element_archive, one committed batch at a time - so it can be stopped at any point and run again
+        (e.g. from cron) to pick up where it left off """
+
+    def __init__(self, retention_days, batch_size):
+        super(ArchiveSubscriptionElementsTool, self).__init__(_logger, configure_app_context=False)
+        self.retention_days = retention_days
+        if self.retention_days is None:
+            self.retention_days = self.dart_config['dart'].get('subscription_element_retention_days', 0)
+        self.batch_size = batch_size
+
+    def run(self):
+        if self.retention_days <= 0:
+            _logger.info('subscription element retention is disabled (subscription_element_retention_days=%s)'
+                         % self.retention_days)
+            return
+
+        processed_before = datetime.utcnow() - timedelta(days=self.retention_days)
+        _logger.info('archiving CONSUMED subscription elements processed before %s' % processed_before)
+        start_time = time.time()
+        total = 0
+        while True:
+            archived = SubscriptionElementService.archive_subscription_elements(processed_before, self.batch_size)
+            if archived == 0:
+                break
+            total += archived
+            elapsed = max(time.time() - start_time, 0.001)
+            _logger.info('archived %s subscription elements in %.1fs (%.0f elements/s)'
+                         % (total, elapsed, total / elapsed))
+
+        _logger.info('done - archived %s subscription elements' % total)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-d', '--retention-days', action='store', dest='retention_days', type=int, default=None)
+    parser.add_argument('-b', '--batch-size', action='store', dest='batch_size', type=int, default=10000)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    ArchiveSubscriptionElementsTool(args.retention_days, args.batch_size).run()
@@ -0,0 +1,93 @@
+import argparse
+from datetime import datetime
+import json
+import logging
+import timeit
+
+from dart.model.action import ActionData, ActionState
+from dart.model.orm import ActionDao, SubscriptionElementDao
+from dart.model.subscription import SubscriptionElementState
+from dart.tool.tool_runner import Tool
+from dart.util.json_util import DartJsonEncoder
+from dart.util.rand import random_id
+
+_logger = logging.getLogger(__name__)
+
+
+def to_model_via_json(dao):
+    # the original conversion path, kept here as the baseline
+    return dao.__modelclass__.from_dict(json.loads(json.dumps(dao, cls=DartJsonEncoder)))
+
+
+class ToModelBenchmark(Tool):
+    """ compares the json round trip conversion of daos to models against VersionedAuditableSerializable.to_model,
+        using in-memory daos so no database is needed """
+
+    def __init__(self, count, repeat):
+        super(ToModelBenchmark, self).__init__(_logger, configure_app_context=False)
+        self.count = count
+        self.repeat = repeat
+
+    def run(self):
+        for name, daos in [('action', self._action_daos()), ('subscription_element', self._element_daos())]:
+            for dao in daos:
+                assert dao.to_model().to_dict() == to_model_via_json(dao).to_dict()
+            json_seconds = min(timeit.repeat(lambda: [to_model_via_json(d) for d in daos], number=1, repeat=self.repeat))
+            fast_seconds = min(timeit.repeat(lambda: [d.to_model() for d in daos], number=1, repeat=self.repeat))
+            _logger.info('%s x %s: json round trip=%.4fs, to_model=%.4fs, speedup=%.1fx'
+                         % (name, self.count, json_seconds, fast_seconds, json_seconds / fast_seconds))
+
+    def _action_daos(self):
+        daos = []
+        for i in range(self.count):
+            dao = ActionDao()
+            dao.id = random_id()
+            dao.version_id = 3
+            dao.created = datetime.now()
+            dao.updated = datetime.now()
+            dao.data = ActionData(
+                name='action-%s' % i,
+                action_type_name='load_dataset',
+                args={'dataset_id': random_id(), 's3_path_start_prefix_inclusive': 's3://bucket/prefix/2016/01/01'},
+                state=ActionState.COMPLETED,
+                queued_time=datetime.now(),
+                start_time=datetime.now(),
+                end_time=datetime.now(),
+                progress=1,
+                order_idx=i,
+                engine_name='redshift_engine',
+                datastore_id=random_id(),
+                tags=['benchmark'],
+            ).to_dict()
+            daos.append(dao)
+        return daos
+
+    def _element_daos(self):
+        daos = []
+        for i in range(self.count):
+            dao = SubscriptionElementDao()
+            dao.id = random_id()
+            dao.version_id = 1
+            dao.created = datetime.now()
+            dao.updated = datetime.now()
+            dao.subscription_id = random_id()
+            dao.s3_path = 's3://bucket/prefix/2016/01/01/part-%05d.gz' % i
+            dao.file_size = 1024 * i
+            dao.state = SubscriptionElementState.CONSUMED
+            dao.action_id = random_id()
+            dao.batch_id = random_id()
+            dao.processed = datetime.now()
+            daos.append(dao)
+        return daos
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--count', action='store', dest='count', type=int, default=5000)
+    parser.add_argument('-r', '--repeat', action='store', dest='repeat', type=int, default=3)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    ToModelBenchmark(args.count, args.repeat).run()
@@ -0,0 +1,55 @@
+import logging
+import traceback
+
+from dart.context.database import db
+from dart.tool.tool_runner import Tool
+
+_logger = logging.getLogger(__name__)
+
+
+class AddActionDispatchTrigger(Tool):
+    """ installs the action_notify_dispatch trigger from src/database/triggers.sql on databases created before it
+        existed, so engine workers with use_action_dispatch_notifications are woken up by postgres """
+
+    def __init__(self):
+        super(AddActionDispatchTrigger, self).__init__(_logger)
+
+    def run(self):
+        try:
+            db.session.execute("""
+                CREATE OR REPLACE FUNCTION notify_action_dispatch()
+                RETURNS TRIGGER AS $$
+                DECLARE
+                    old_state TEXT;
+                    new_state TEXT := NEW.data->>'state';
+                BEGIN
+                    IF TG_OP = 'UPDATE' THEN
+                        old_state := OLD.data->>'state';
+                    END IF;
+                    IF (new_state = 'QUEUED' AND old_state IS DISTINCT FROM 'QUEUED'
+                            AND old_state IS DISTINCT FROM 'PENDING')
+                        OR (old_state IN ('PENDING', 'RUNNING', 'FINISHING')
+                            AND new_state NOT IN ('PENDING', 'RUNNING', 'FINISHING'))
+                    THEN
+                        PERFORM pg_notify('dart_action_dispatch', NEW.id);
+                    END IF;
+                    RETURN NEW;
+                END;
+                $$ language 'plpgsql'
+                """)
+            db.session.execute('DROP TRIGGER IF EXISTS action_notify_dispatch ON action')
+            db.session.execute(
+                'CREATE TRIGGER action_notify_dispatch AFTER INSERT OR UPDATE ON action'
+                ' FOR EACH ROW EXECUTE PROCEDURE notify_action_dispatch()'
+            )
+            db.session.commit()
+            _logger.info('done - created action_notify_dispatch')
+
+        except Exception as e:
+            db.session.rollback()
+            _logger.error(traceback.format_exc())
+            raise e
+
+
+if __name__ == '__main__':
+    AddActionDispatchTrigger().run()
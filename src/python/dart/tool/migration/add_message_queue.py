@@ -0,0 +1,31 @@
+import logging
+import traceback
+
+from dart.context.database import db
+from dart.model.orm import QueuedMessageDao
+from dart.tool.tool_runner import Tool
+
+_logger = logging.getLogger(__name__)
+
+
+class AddMessageQueue(Tool):
+    """ creates the message_queue table (and its queue_name/visible_after index) that PostgresMessageBroker reads and
+        writes, for databases created before it existed """
+
+    def __init__(self):
+        super(AddMessageQueue, self).__init__(_logger)
+
+    def run(self):
+        try:
+            QueuedMessageDao.__table__.create(db.session.get_bind(), checkfirst=True)
+            db.session.commit()
+            _logger.info('done - created message_queue')
+
+        except Exception as e:
+            db.session.rollback()
+            _logger.error(traceback.format_exc())
+            raise e
+
+
+if __name__ == '__main__':
+    AddMessageQueue().run()
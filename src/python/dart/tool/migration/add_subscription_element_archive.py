@@ -0,0 +1,35 @@
+import logging
+import traceback
+
+from dart.context.database import db
+from dart.model.orm import SubscriptionElementArchiveDao
+from dart.tool.tool_runner import Tool
+
+_logger = logging.getLogger(__name__)
+
+
+class AddSubscriptionElementArchive(Tool):
+    """ creates subscription_element_archive and the partial index that archive_subscription_elements uses to find
+        CONSUMED elements past retention """
+
+    def __init__(self):
+        super(AddSubscriptionElementArchive, self).__init__(_logger)
+
+    def run(self):
+        try:
+            SubscriptionElementArchiveDao.__table__.create(db.session.get_bind(), checkfirst=True)
+            db.session.execute(
+                'CREATE INDEX IF NOT EXISTS ix_subscription_element_processed_consumed'
+                " ON subscription_element (processed) WHERE state = 'CONSUMED'"
+            )
+            db.session.commit()
+            _logger.info('done - created subscription_element_archive and ix_subscription_element_processed_consumed')
+
+        except Exception as e:
+            db.session.rollback()
+            _logger.error(traceback.format_exc())
+            raise e
+
+
+if __name__ == '__main__':
+    AddSubscriptionElementArchive().run()
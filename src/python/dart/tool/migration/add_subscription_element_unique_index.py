@@ -0,0 +1,58 @@
+import logging
+import traceback
+
+from dart.context.database import db
+from dart.tool.tool_runner import Tool
+
+_logger = logging.getLogger(__name__)
+
+
+class AddSubscriptionElementUniqueIndex(Tool):
+    """ removes duplicate (subscription_id, s3_path) elements and adds the unique index that the
+        INSERT ... ON CONFLICT ingest path relies on (requires postgres 9.5+) """
+
+    def __init__(self):
+        super(AddSubscriptionElementUniqueIndex, self).__init__(_logger)
+
+    def run(self):
+        try:
+            # keep the most progressed copy of each element (anything beyond UNCONSUMED), then the oldest
+            sql = """
+                DELETE FROM subscription_element
+                WHERE id IN (
+                    SELECT id
+                    FROM (
+                        SELECT
+                            id,
+                            row_number() OVER (
+                                PARTITION BY subscription_id, s3_path
+                                ORDER BY (state = 'UNCONSUMED'), created, id
+                            ) AS rn
+                        FROM subscription_element
+                    ) ranked
+                    WHERE rn > 1
+                )
+                """
+            result = db.session.execute(sql)
+            _logger.info('deleted %s duplicate subscription elements' % result.rowcount)
+
+            db.session.execute('DROP INDEX IF EXISTS ix_subscription_element_subscription_id_s3_path')
+            db.session.execute(
+                'CREATE UNIQUE INDEX ix_subscription_element_subscription_id_s3_path'
+                ' ON subscription_element (subscription_id, s3_path)'
+            )
+            db.session.execute(
+                'CREATE INDEX IF NOT EXISTS ix_subscription_element_action_id_s3_path'
+                ' ON subscription_element (action_id, s3_path)'
+            )
+            db.session.commit()
+            _logger.info('done - created ix_subscription_element_subscription_id_s3_path')
+
+        except Exception as e:
+            db.session.rollback()
+            _logger.error(traceback.format_exc())
+            raise e
+
+
+if __name__ == '__main__':
+    AddSubscriptionElementUniqueIndex().run()
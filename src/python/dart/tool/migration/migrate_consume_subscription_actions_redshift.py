@@ -43,9 +43,16 @@ class MigrateConsumeSubscriptionActionsRedshift(Tool):
                     args.pop('s3_path_regex_filter', None)
 
                     # we need to use a manual update statement here because the sqlalchemy orm layer doesn't seem
-                    # to be able to commit the removal of a key with a null value (within a JSONB column) properly
-                    sql = """ UPDATE action SET data=CAST(:data AS JSONB) WHERE id=:id """
-                    statement = text(sql).bindparams(id=action_dao.id, data=json.dumps(data))
+                    # to be able to commit the removal of a key with a null value (within a JSONB column) properly.
+                    # that also skips ActionDao's validator, so the promoted columns are written here as well
+                    sql = """
+                        UPDATE action
+                        SET data=CAST(:data AS JSONB), state=:state, datastore_id=:datastore_id,
+                            workflow_id=:workflow_id, order_idx=:order_idx
+                        WHERE id=:id
+                        """
+                    columns = ActionDao.promoted_column_values(data)
+                    statement = text(sql).bindparams(id=action_dao.id, data=json.dumps(data), **columns)
                     db.session.execute(statement)
 
                 db.session.commit()
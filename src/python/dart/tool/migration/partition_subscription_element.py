@@ -0,0 +1,132 @@
+import logging
+import time
+import traceback
+from sqlalchemy import text
+
+from dart.context.database import db
+from dart.model.orm import SubscriptionDao
+from dart.service.subscription import create_subscription_element_partition
+from dart.tool.tool_runner import Tool
+
+_logger = logging.getLogger(__name__)
+
+_COLUMNS = 'id, version_id, created, updated, subscription_id, s3_path, file_size, state, action_id, batch_id, processed'
+
+
+class PartitionSubscriptionElement(Tool):
+    """ turns subscription_element into a table LIST partitioned by subscription_id, with one partition per
+        subscription (plus a default partition), so that busy subscriptions stop competing for one heap and deleting
+        a subscription drops its partition.  set subscription_element_partitioned: true in the dart config once this
+        has run, so that new subscriptions get their own partitions (created when the subscription worker generates
+        their elements).
+
+        requires postgres 13+ (partitioned unique indexes for ON CONFLICT, and BEFORE UPDATE row triggers on the
+        partitioned table).  run it with the dart workers and web stopped - the existing table is renamed to
+        subscription_element_unpartitioned and drained into the new one a subscription at a time, so an interrupted
+        run can simply be re-run. """
+
+    def __init__(self):
+        super(PartitionSubscriptionElement, self).__init__(_logger)
+
+    def run(self):
+        version = int(db.session.execute('SHOW server_version_num').scalar())
+        if version < 130000:
+            raise Exception('partitioning subscription_element requires postgres 13+ (server_version_num=%s)' % version)
+
+        try:
+            if not self._is_partitioned():
+                self._create_partitioned_table()
+            self._move_elements()
+
+        except Exception as e:
+            db.session.rollback()
+            _logger.error(traceback.format_exc())
+            raise e
+
+    @staticmethod
+    def _is_partitioned():
+        sql = "SELECT COUNT(*) FROM pg_partitioned_table WHERE partrelid = to_regclass('subscription_element')"
+        return db.session.execute(sql).scalar() > 0
+
+    @staticmethod
+    def _create_partitioned_table():
+        _logger.info('renaming subscription_element to subscription_element_unpartitioned')
+        db.session.execute('ALTER TABLE subscription_element RENAME TO subscription_element_unpartitioned')
+        for index in ['subscription_element_pkey',
+                      'ix_subscription_element_subscription_id_s3_path',
+                      'ix_subscription_element_action_id_s3_path',
+                      'ix_subscription_element_processed_consumed']:
+            db.session.execute('ALTER INDEX IF EXISTS %s RENAME TO %s' % (index, index.replace(
+                'subscription_element', 'subscription_element_unpartitioned', 1)))
+
+        _logger.info('creating partitioned subscription_element')
+        db.session.execute("""
+            CREATE TABLE subscription_element (
+                id VARCHAR(36) NOT NULL,
+                version_id INTEGER NOT NULL DEFAULT 0,
+                created TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                subscription_id VARCHAR(36) NOT NULL,
+                s3_path VARCHAR(1024) NOT NULL,
+                file_size BIGINT NOT NULL,
+                state VARCHAR(50) NOT NULL,
+                action_id VARCHAR(36),
+                batch_id VARCHAR(36),
+                processed TIMESTAMP,
+                PRIMARY KEY (subscription_id, id)
+            ) PARTITION BY LIST (subscription_id)
+            """)
+        db.session.execute('CREATE TABLE subscription_element_default PARTITION OF subscription_element DEFAULT')
+        db.session.execute('CREATE UNIQUE INDEX ix_subscription_element_subscription_id_s3_path'
+                           ' ON subscription_element (subscription_id, s3_path)')
+        db.session.execute('CREATE INDEX ix_subscription_element_action_id_s3_path'
+                           ' ON subscription_element (action_id, s3_path)')
+        db.session.execute('CREATE INDEX ix_subscription_element_processed_consumed'
+                           " ON subscription_element (processed) WHERE state = 'CONSUMED'")
+        db.session.execute('CREATE TRIGGER subscription_element_update_timestamp BEFORE UPDATE ON subscription_element'
+                           ' FOR EACH ROW EXECUTE PROCEDURE update_timestamp()')
+        db.session.commit()
+
+    @staticmethod
+    def _move_elements():
+        if db.session.execute("SELECT to_regclass('subscription_element_unpartitioned')").scalar() is None:
+            _logger.info('done - subscription_element is already partitioned')
+            return
+
+        subscription_ids = [r[0] for r in db.session.query(SubscriptionDao.id).order_by(SubscriptionDao.id).all()]
+        start_time = time.time()
+        total = 0
+        for i, subscription_id in enumerate(subscription_ids):
+            create_subscription_element_partition(subscription_id)
+            moved = _move_subscription_elements('WHERE subscription_id = :subscription_id', subscription_id)
+            db.session.commit()
+            total += moved
+            elapsed = max(time.time() - start_time, 0.001)
+            _logger.info('moved %s elements of subscription (id=%s), %s of %s subscriptions (%.0f elements/s)'
+                         % (moved, subscription_id, i + 1, len(subscription_ids), total / elapsed))
+
+        # anything left belongs to no subscription, and lands in the default partition
+        moved = _move_subscription_elements('', None)
+        db.session.execute('DROP TABLE subscription_element_unpartitioned')
+        db.session.commit()
+        _logger.info('done - moved %s orphaned elements to subscription_element_default, and dropped '
+                     'subscription_element_unpartitioned' % moved)
+
+
+def _move_subscription_elements(where_sql, subscription_id):
+    sql = """
+        WITH moved AS (
+            DELETE FROM subscription_element_unpartitioned
+            %s
+            RETURNING %s
+        )
+        INSERT INTO subscription_element (%s)
+        SELECT %s FROM moved
+        ON CONFLICT DO NOTHING
+        """ % (where_sql, _COLUMNS, _COLUMNS, _COLUMNS)
+    statement = text(sql).bindparams(subscription_id=subscription_id) if subscription_id else text(sql)
+    return db.session.execute(statement).rowcount
+
+
+if __name__ == '__main__':
+    PartitionSubscriptionElement().run()
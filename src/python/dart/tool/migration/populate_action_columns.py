@@ -0,0 +1,102 @@
+import logging
+import traceback
+from sqlalchemy import text
+
+from dart.context.database import db
+from dart.tool.tool_runner import Tool
+
+_logger = logging.getLogger(__name__)
+
+
+class PopulateActionColumns(Tool):
+    """ adds the relational columns that mirror the hot action JSONB fields (state, datastore_id, workflow_id,
+        order_idx) and backfills them for existing rows.  new rows are dual-written by ActionDao, so this only
+        needs to run once per environment, and it is safe to re-run.
+
+        the action_update_timestamp trigger stays enabled, so engine and worker updates made during the backfill
+        keep moving updated (find_stale_pending_actions relies on it).  rows the backfill changes get updated set to
+        the time of their batch, and rows that are already in sync are left alone. """
+
+    def __init__(self):
+        super(PopulateActionColumns, self).__init__(_logger)
+
+    def run(self):
+        self._add_columns()
+        try:
+            limit = 1000
+            last_id = ''
+            while True:
+                _logger.info('starting batch with limit=%s after id=%s' % (limit, last_id))
+                sql = """
+                    WITH batch AS (
+                        SELECT id
+                        FROM action
+                        WHERE id > :last_id
+                        ORDER BY id
+                        LIMIT :limit
+                    ),
+                    synced AS (
+                        UPDATE action a
+                        SET state = a.data->>'state',
+                            datastore_id = a.data->>'datastore_id',
+                            workflow_id = a.data->>'workflow_id',
+                            order_idx = CAST(a.data->>'order_idx' AS FLOAT)
+                        FROM batch
+                        WHERE a.id = batch.id
+                          AND (a.state IS DISTINCT FROM a.data->>'state'
+                               OR a.datastore_id IS DISTINCT FROM a.data->>'datastore_id'
+                               OR a.workflow_id IS DISTINCT FROM a.data->>'workflow_id'
+                               OR a.order_idx IS DISTINCT FROM CAST(a.data->>'order_idx' AS FLOAT))
+                        RETURNING a.id
+                    )
+                    SELECT (SELECT MAX(id) FROM batch), (SELECT COUNT(*) FROM synced)
+                    """
+                statement = text(sql).bindparams(last_id=last_id, limit=limit)
+                batch_last_id, updated_count = db.session.execute(statement).first()
+                if batch_last_id is None:
+                    _logger.info('done - no more entities left')
+                    break
+
+                db.session.commit()
+                last_id = batch_last_id
+                _logger.info('completed batch ending with id=%s, %s actions updated' % (last_id, updated_count))
+
+        except Exception as e:
+            db.session.rollback()
+            _logger.error(traceback.format_exc())
+            raise e
+
+        self._add_indexes()
+
+    @staticmethod
+    def _add_columns():
+        existing = {r[0] for r in db.session.execute(
+            "SELECT column_name FROM information_schema.columns WHERE table_name = 'action'"
+        )}
+        for name, column_type in [
+            ('state', 'VARCHAR(50)'),
+            ('datastore_id', 'VARCHAR(36)'),
+            ('workflow_id', 'VARCHAR(36)'),
+            ('order_idx', 'FLOAT'),
+        ]:
+            if name not in existing:
+                _logger.info('adding column action.%s' % name)
+                db.session.execute('ALTER TABLE action ADD COLUMN %s %s' % (name, column_type))
+        db.session.commit()
+
+    @staticmethod
+    def _add_indexes():
+        for name, columns in [
+            ('ix_action_datastore_id_state_order_idx', 'datastore_id, state, order_idx'),
+            ('ix_action_workflow_id_state', 'workflow_id, state'),
+            ('ix_action_state_updated', 'state, updated'),
+            ('ix_action_updated_id', 'updated, id'),
+            ('ix_action_created_id', 'created, id'),
+        ]:
+            _logger.info('creating index %s' % name)
+            db.session.execute('CREATE INDEX IF NOT EXISTS %s ON action (%s)' % (name, columns))
+        db.session.commit()
+
+
+if __name__ == '__main__':
+    PopulateActionColumns().run()
@@ -0,0 +1,43 @@
+import logging
+import traceback
+
+from dart.context.database import db
+from dart.model.orm import SubscriptionDao
+from dart.service.subscription import SubscriptionElementService
+from dart.tool.tool_runner import Tool
+
+_logger = logging.getLogger(__name__)
+
+
+class PopulateSubscriptionElementCounters(Tool):
+    """ counts the existing elements of every subscription into subscription_element_counter (which new inserts and
+        state changes keep up to date from then on).  each subscription is recounted in its own short transaction,
+        so this is safe to run against a live environment, and to re-run. """
+
+    def __init__(self):
+        super(PopulateSubscriptionElementCounters, self).__init__(_logger)
+
+    def run(self):
+        db.session.execute('CREATE TABLE IF NOT EXISTS subscription_element_counter ('
+                           'subscription_id VARCHAR(36) NOT NULL, '
+                           'state VARCHAR(50) NOT NULL, '
+                           'count BIGINT NOT NULL DEFAULT 0, '
+                           'file_size_sum BIGINT NOT NULL DEFAULT 0, '
+                           'PRIMARY KEY (subscription_id, state))')
+        db.session.commit()
+
+        subscription_ids = [r[0] for r in db.session.query(SubscriptionDao.id).order_by(SubscriptionDao.id).all()]
+        for i, subscription_id in enumerate(subscription_ids):
+            try:
+                SubscriptionElementService.rebuild_subscription_element_counters(subscription_id)
+                _logger.info('counted elements of subscription (id=%s), %s of %s'
+                             % (subscription_id, i + 1, len(subscription_ids)))
+
+            except Exception as e:
+                db.session.rollback()
+                _logger.error(traceback.format_exc())
+                raise e
+
+
+if __name__ == '__main__':
+    PopulateSubscriptionElementCounters().run()
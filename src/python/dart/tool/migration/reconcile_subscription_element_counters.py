@@ -0,0 +1,45 @@
+import logging
+import traceback
+
+from dart.context.database import db
+from dart.model.orm import SubscriptionDao
+from dart.service.subscription import SubscriptionElementService
+from dart.tool.tool_runner import Tool
+
+_logger = logging.getLogger(__name__)
+
+
+class ReconcileSubscriptionElementCounters(Tool):
+    """ compares each subscription's element stats (served from subscription_element_counter) with a fresh count of
+        its elements, and rebuilds the counters of any subscription that has drifted, e.g. after elements were
+        changed with ad hoc SQL """
+
+    def __init__(self):
+        super(ReconcileSubscriptionElementCounters, self).__init__(_logger)
+
+    def run(self):
+        service = SubscriptionElementService
+        subscription_ids = [r[0] for r in db.session.query(SubscriptionDao.id).order_by(SubscriptionDao.id).all()]
+        rebuilt = 0
+        for subscription_id in subscription_ids:
+            try:
+                counted = [s.to_dict() for s in service.count_subscription_element_stats(subscription_id)]
+                stats = [s.to_dict() for s in service.get_subscription_element_stats(subscription_id)]
+                db.session.rollback()
+                if counted == stats:
+                    continue
+                _logger.info('rebuilding counters of subscription (id=%s): counters=%s, elements=%s'
+                             % (subscription_id, stats, counted))
+                service.rebuild_subscription_element_counters(subscription_id)
+                rebuilt += 1
+
+            except Exception as e:
+                db.session.rollback()
+                _logger.error(traceback.format_exc())
+                raise e
+
+        _logger.info('done - rebuilt the counters of %s of %s subscriptions' % (rebuilt, len(subscription_ids)))
+
+
+if __name__ == '__main__':
+    ReconcileSubscriptionElementCounters().run()
@@ -15,3 +15,12 @@ class DartJsonEncoder(DynamicJSONEncoder):
 
         # Fallback
         return super(DartJsonEncoder, self).default(o)
+
+
+def copy_json(value):
+    """ a cheap deep copy for values that are already plain json (dicts, lists and scalars) """
+    if isinstance(value, dict):
+        return {k: copy_json(v) for k, v in value.iteritems()}
+    if isinstance(value, list):
+        return [copy_json(v) for v in value]
+    return value
@@ -0,0 +1,39 @@
+import select
+
+import psycopg2
+import psycopg2.extensions
+from sqlalchemy.engine.url import make_url
+
+
+class PostgresNotificationListener(object):
+    def __init__(self, database_uri, channel):
+        self._database_uri = database_uri
+        self._channel = channel
+        self._conn = None
+
+    def drain(self):
+        """ discards notifications received so far, anything sent afterwards will wake up await_notifications """
+        self.conn.poll()
+        del self.conn.notifies[:]
+
+    def await_notifications(self, timeout_seconds):
+        """ :rtype: list[str]
+            :return the payloads received within the timeout (empty if none were received) """
+        conn = self.conn
+        if not conn.notifies and select.select([conn], [], [], timeout_seconds) == ([], [], []):
+            return []
+        conn.poll()
+        payloads = [n.payload for n in conn.notifies]
+        del conn.notifies[:]
+        return payloads
+
+    @property
+    def conn(self):
+        if self._conn and not self._conn.closed:
+            return self._conn
+        url = make_url(self._database_uri)
+        self._conn = psycopg2.connect(host=url.host, port=url.port, user=url.username, password=url.password,
+                                      dbname=url.database)
+        self._conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        self._conn.cursor().execute('LISTEN "%s"' % self._channel)
+        return self._conn
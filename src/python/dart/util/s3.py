@@ -1,5 +1,10 @@
+from collections import deque
 from datetime import datetime
+from itertools import islice
+from multiprocessing.pool import ThreadPool
 import re
+import boto
+from boto.s3.prefix import Prefix
 from retrying import retry
 from dart.util.shell import call
 from dart.util.strings import substitute_date_tokens
@@ -23,6 +28,75 @@ def yield_s3_keys(bucket, s3_path_root_prefix, s3_path_start_prefix_inclusive=No
     s3_path_end_prefix_exclusive = substitute_date_tokens(s3_path_end_prefix_exclusive, now, s3_path_end_prefix_exclusive_date_offset_in_seconds)
     s3_path_regex_filter = substitute_date_tokens(s3_path_regex_filter, now, s3_path_regex_filter_date_offset_in_seconds)
 
+    return _yield_s3_keys(bucket, s3_path_root_prefix, s3_path_start_prefix_inclusive, s3_path_end_prefix_exclusive,
+                          s3_path_regex_filter)
+
+
+def yield_s3_keys_parallel(bucket, s3_path_root_prefix, s3_path_start_prefix_inclusive=None,
+                           s3_path_end_prefix_exclusive=None, s3_path_regex_filter=None, pool_size=8, shard_depth=1):
+    """ yields the keys yield_s3_keys would, in the same (sorted) order, but splits the listing on the common
+        prefixes shard_depth "/" levels below s3_path_root_prefix (e.g. date partitions) and lists up to pool_size
+        of them at once, each with its own connection.  only a window of shards is held in memory. """
+    now = datetime.utcnow()
+    s3_path_start_prefix_inclusive = substitute_date_tokens(s3_path_start_prefix_inclusive, now)
+    s3_path_end_prefix_exclusive = substitute_date_tokens(s3_path_end_prefix_exclusive, now)
+    s3_path_regex_filter = substitute_date_tokens(s3_path_regex_filter, now)
+
+    def list_shard(shard):
+        s3_path = 's3://' + bucket.name + '/' + shard.name
+        if not isinstance(shard, Prefix):
+            if s3_path.rstrip('/') == s3_path_root_prefix.rstrip('/'):
+                return []
+            if s3_path_start_prefix_inclusive and s3_path < s3_path_start_prefix_inclusive:
+                return []
+            if s3_path_regex_filter and not re.search(s3_path_regex_filter, s3_path):
+                return []
+            return [shard]
+        # shards entirely before the start prefix were already skipped, so it only applies to the one containing it
+        start = s3_path_start_prefix_inclusive
+        if start and not start.startswith(s3_path):
+            start = None
+        shard_bucket = boto.connect_s3().get_bucket(bucket.name, validate=False)
+        return list(_yield_s3_keys(shard_bucket, s3_path_root_prefix, start, s3_path_end_prefix_exclusive,
+                                   s3_path_regex_filter, s3_path))
+
+    shards = iter(_find_s3_shards(bucket, get_key_name(s3_path_root_prefix), s3_path_start_prefix_inclusive,
+                                  s3_path_end_prefix_exclusive, shard_depth))
+    pool = ThreadPool(pool_size)
+    try:
+        pending = deque(pool.apply_async(list_shard, (shard,)) for shard in islice(shards, pool_size * 2))
+        while pending:
+            key_objs = pending.popleft().get()
+            pending.extend(pool.apply_async(list_shard, (shard,)) for shard in islice(shards, 1))
+            for key_obj in key_objs:
+                yield key_obj
+    finally:
+        pool.terminate()
+
+
+def _find_s3_shards(bucket, key_prefix, s3_path_start_prefix_inclusive, s3_path_end_prefix_exclusive, depth):
+    """ the keys and common prefixes depth levels below key_prefix that may hold keys in the start/end range,
+        sorted (s3 returns a page's keys before its common prefixes) """
+    shards = []
+    for item in bucket.list(prefix=key_prefix, delimiter='/'):
+        s3_path = 's3://' + bucket.name + '/' + item.name
+        if s3_path_end_prefix_exclusive and s3_path >= s3_path_end_prefix_exclusive:
+            continue
+        if isinstance(item, Prefix):
+            start = s3_path_start_prefix_inclusive
+            if start and s3_path < start and not start.startswith(s3_path):
+                continue
+            if depth > 1:
+                shards.extend(_find_s3_shards(bucket, item.name, s3_path_start_prefix_inclusive,
+                                              s3_path_end_prefix_exclusive, depth - 1))
+                continue
+        shards.append(item)
+    shards.sort(key=lambda item: item.name)
+    return shards
+
+
+def _yield_s3_keys(bucket, s3_path_root_prefix, s3_path_start_prefix_inclusive, s3_path_end_prefix_exclusive,
+                   s3_path_regex_filter, s3_path_list_prefix=None):
     start_key_prefix = get_key_name(s3_path_start_prefix_inclusive) if s3_path_start_prefix_inclusive else None
     first_key = bucket.get_all_keys(prefix=start_key_prefix, max_keys=1) if start_key_prefix else None
     marker = first_key[0].key if first_key else ''
@@ -30,7 +104,7 @@ def yield_s3_keys(bucket, s3_path_root_prefix, s3_path_start_prefix_inclusive=No
     if first_key and (not s3_path_regex_filter or re.search(s3_path_regex_filter, get_s3_path(first_key[0]))):
         yield first_key[0]
 
-    for key_obj in bucket.list(prefix=get_key_name(s3_path_root_prefix), marker=marker):
+    for key_obj in bucket.list(prefix=get_key_name(s3_path_list_prefix or s3_path_root_prefix), marker=marker):
         s3_path = get_s3_path(key_obj)
         if s3_path.rstrip('/') == s3_path_root_prefix.rstrip('/'):
             continue
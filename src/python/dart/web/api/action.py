@@ -1,5 +1,6 @@
 import json
 
+import dateutil.parser
 from flask import Blueprint, request, current_app
 from flask.ext.jsontools import jsonapi
 from jsonpatch import JsonPatch
@@ -74,6 +75,18 @@ def get_datastore_actions():
     if workflow_id:
         filters.append(Filter('workflow_id', Operator.EQ, workflow_id))
 
+    cursor = request.args.get('cursor')
+    if cursor is not None:
+        if order_by:
+            return {'results': 'ERROR', 'error_message': 'order_by is not supported with cursor paging'}, 400, None
+        actions = action_service().query_actions_after(filters, limit, _decode_action_cursor(cursor))
+        return {
+            'results': [a.to_dict() for a in actions],
+            'limit': limit,
+            'cursor': cursor,
+            'next_cursor': _encode_action_cursor(actions[-1]) if len(actions) == limit else None,
+        }
+
     actions = action_service().query_actions(filters, limit, offset, order_by)
     return {
         'results': [a.to_dict() for a in actions],
@@ -83,6 +96,18 @@ def get_datastore_actions():
     }
 
 
+def _encode_action_cursor(action):
+    return '%s|%s' % (action.created.isoformat(), action.id)
+
+
+def _decode_action_cursor(cursor):
+    # an empty cursor requests the first page
+    if not cursor:
+        return None
+    created, action_id = cursor.split('|', 1)
+    return dateutil.parser.parse(created), action_id
+
+
 @api_action_bp.route('/action/<action>', methods=['GET'])
 @fetch_model
 @jsonapi
@@ -1,6 +1,9 @@
 from functools import wraps
-from flask import abort, current_app
+from flask import abort, current_app, request
 from dart.context.locator import injectable
+from dart.model.datastore import DatastoreState
+from dart.model.subscription import SubscriptionState
+from dart.model.workflow import WorkflowState, WorkflowInstanceState
 
 
 @injectable
@@ -19,24 +22,36 @@ class EntityLookupService(object):
             'subscription': subscription_service.get_subscription,
             'event': event_service.get_event,
         }
+        # entities being deleted in the background are treated as already gone (unless include_deleting is asked
+        # for, which lets the client wait for a delete to finish)
+        self._deleting_states = {
+            'datastore': DatastoreState.DELETING,
+            'workflow': WorkflowState.DELETING,
+            'workflow_instance': WorkflowInstanceState.DELETING,
+            'subscription': SubscriptionState.DELETING,
+        }
 
     def unsupported_entity_type(self, entity_type):
         return self._services.get(entity_type) is None
 
-    def get_entity(self, entity_type, id):
+    def get_entity(self, entity_type, id, include_deleting=False):
         get_func = self._services[entity_type]
-        return get_func(id, raise_when_missing=False)
+        entity = get_func(id, raise_when_missing=False)
+        if include_deleting or not entity or entity_type not in self._deleting_states:
+            return entity
+        return None if entity.data.state == self._deleting_states[entity_type] else entity
 
 
 def fetch_model(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
         lookup_service = current_app.dart_context.get(EntityLookupService)
+        include_deleting = request.method == 'GET' and request.args.get('include_deleting') == 'true'
         entities_by_type = {}
         for url_param_name, value in kwargs.iteritems():
             if lookup_service.unsupported_entity_type(url_param_name):
                 continue
-            model = lookup_service.get_entity(url_param_name, value)
+            model = lookup_service.get_entity(url_param_name, value, include_deleting)
             if not model:
                 abort(404)
             entities_by_type[url_param_name] = model
@@ -1,5 +1,7 @@
 import json
-from flask import Blueprint, request, current_app
+import zlib
+
+from flask import Blueprint, Response, request, current_app, stream_with_context
 
 from flask.ext.jsontools import jsonapi
 from jsonpatch import JsonPatch
@@ -81,9 +83,84 @@ def find_action_subscription_elements(action):
     return subscription_elements(action_id, state, subscription_id)
 
 
+@api_subscription_bp.route('/subscription/<subscription>/elements/stream', methods=['GET'])
+@fetch_model
+def stream_subscription_elements(subscription):
+    """ :type subscription: dart.model.subscription.Subscription """
+    state = request.args.get('state')
+    processed_after_s3_path = request.args.get('processed_after_s3_path')
+    gte_processed = None
+    if processed_after_s3_path:
+        se = subscription_element_service().get_subscription_element(subscription.id, processed_after_s3_path)
+        gte_processed = se.processed
+    return subscription_elements_stream(None, state, subscription.id, gte_processed, processed_after_s3_path)
+
+
+@api_subscription_bp.route('/action/<action>/subscription/elements/stream', methods=['GET'])
+@fetch_model
+def stream_action_subscription_elements(action):
+    """ :type action: dart.model.action.Action """
+    if 'subscription_id' not in action.data.args:
+        error_message = 'action (id=%s) does not appear to consume a subscription' % action.id
+        return Response(json.dumps({'results': 'ERROR', 'error_message': error_message}), 400, mimetype='application/json')
+    subscription_id = action.data.args['subscription_id']
+    return subscription_elements_stream(action.id, SubscriptionElementState.ASSIGNED, subscription_id)
+
+
+def subscription_elements_stream(action_id, state, subscription_id, gte_processed=None, gt_s3_path=None):
+    """ gzip compressed, newline delimited json - one element per line, ordered by s3_path, then a last
+        {"_end": true, "count": N} line.  a stream cut short by an error still decompresses fine, so clients must
+        treat a missing end line (or a count that doesn't match) as a failure.  elements are read a page at a time
+        without holding a transaction between pages, but the uwsgi process stays busy until the client has read the
+        whole response (see uwsgi.ini) """
+    elements = subscription_element_service().stream_subscription_elements(
+        subscription_id=subscription_id,
+        state=state,
+        action_id=action_id,
+        gt_s3_path=gt_s3_path,
+        gte_processed=gte_processed
+    )
+
+    def generate():
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        lines = []
+        count = 0
+        for e in elements:
+            lines.append(json.dumps(e) + '\n')
+            count += 1
+            if len(lines) >= 1000:
+                yield compressor.compress(''.join(lines)) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                lines = []
+        lines.append(json.dumps({'_end': True, 'count': count}) + '\n')
+        yield compressor.compress(''.join(lines)) + compressor.flush()
+
+    headers = {'Content-Encoding': 'gzip'}
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson', headers=headers)
+
+
 def subscription_elements(action_id, state, subscription_id, gte_processed=None, gt_s3_path=None):
     limit = int(request.args.get('limit', 10000))
     offset = int(request.args.get('offset', 0))
+
+    # cursor paging orders by s3_path, and the cursor is the last s3_path seen (empty for the first page)
+    cursor = request.args.get('cursor')
+    if cursor is not None:
+        elements = subscription_element_service().find_subscription_elements(
+            subscription_id=subscription_id,
+            state=state,
+            limit=limit,
+            action_id=action_id,
+            gt_s3_path=gt_s3_path,
+            gte_processed=gte_processed,
+            after_s3_path=cursor or None
+        )
+        return {
+            'results': [e.to_dict() for e in elements],
+            'limit': limit,
+            'cursor': cursor,
+            'next_cursor': elements[-1].s3_path if len(elements) == limit else None,
+        }
+
     elements = subscription_element_service().find_subscription_elements(
         subscription_id=subscription_id,
         state=state,
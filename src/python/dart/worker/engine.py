@@ -15,13 +15,13 @@ from dart.context.database import db
 from dart.message.trigger_proxy import TriggerProxy
 from dart.model.action import ActionState
 from dart.model.datastore import DatastoreState
-from dart.model.exception import DartConditionalUpdateFailedException
 from dart.model.mutex import Mutexes
 from dart.service.action import ActionService
 from dart.service.datastore import DatastoreService
 from dart.service.engine import EngineService
 from dart.service.mutex import db_mutex
 from dart.tool.tool_runner import Tool
+from dart.util.pg_notify import PostgresNotificationListener
 from dart.worker.worker import Worker
 
 _logger = logging.getLogger(__name__)
@@ -36,24 +36,59 @@ class EngineWorker(Tool):
         self._datastore_service = self.app_context.get(DatastoreService)
         self._trigger_proxy = self.app_context.get(TriggerProxy)
         self._sleep_seconds = 0.7
-        self._counter = Counter(transition_queued=1, transition_stale=1, transition_orphaned=60, scale_down=120)
+        self._dispatch_listener = None
+        transition_queued_seconds = 1.4
+        if self.dart_config['dart'].get('use_action_dispatch_notifications'):
+            # actions are dispatched as soon as a notification arrives, so the periodic scan is only a safety net
+            database_uri = self.dart_config['flask']['SQLALCHEMY_DATABASE_URI']
+            self._dispatch_listener = PostgresNotificationListener(database_uri, 'dart_action_dispatch')
+            transition_queued_seconds = self.dart_config['dart'].get('action_dispatch_safety_scan_seconds', 30)
+            self._warn_if_dispatch_trigger_missing()
+        self._local_engine_pool = None
+        if self.dart_config['dart'].get('use_local_engines'):
+            max_processes = self.dart_config['dart'].get('local_engine_max_processes', 4)
+            self._local_engine_pool = LocalEngineProcessPool(max_processes)
+        # notifications end a tick early, so periodic work is scheduled by elapsed time rather than by tick count
+        self._schedule = Schedule(transition_queued=transition_queued_seconds, transition_stale=1.4,
+                                  transition_orphaned=42, scale_down=84)
 
     def run(self):
-        time.sleep(self._sleep_seconds)
-        self._counter.increment()
+        # reaped here rather than only when queued actions are dispatched, so that finished engine processes don't
+        # linger as zombies (holding their slots) while nothing is queued
+        if self._local_engine_pool:
+            self._local_engine_pool.reap()
 
-        if self._counter.is_ready('transition_queued'):
+        notified = self._await_dispatch_notification()
+
+        scan_due = self._schedule.is_due('transition_queued')
+        if notified or scan_due:
             self._transition_queued_actions_to_pending()
 
-        if self._counter.is_ready('transition_stale'):
+        if self._schedule.is_due('transition_stale'):
             self._transition_stale_pending_actions_to_queued()
 
-        if self._counter.is_ready('transition_orphaned'):
+        if self._schedule.is_due('transition_orphaned'):
             self._transition_orphaned_actions_to_failed()
 
-        if self._counter.is_ready('scale_down') and self._engine_taskrunner_ecs_cluster:
+        if self._schedule.is_due('scale_down') and self._engine_taskrunner_ecs_cluster:
             self._scale_down_unused_ecs_container_instances()
 
+    @staticmethod
+    def _warn_if_dispatch_trigger_missing():
+        sql = "SELECT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'action_notify_dispatch')"
+        installed = db.session.execute(sql).scalar()
+        db.session.rollback()
+        if not installed:
+            _logger.warn('use_action_dispatch_notifications is set, but the action_notify_dispatch trigger is missing'
+                         ' (see dart/tool/migration/add_action_dispatch_trigger.py), so actions will only be'
+                         ' dispatched by the periodic scan')
+
+    def _await_dispatch_notification(self):
+        if not self._dispatch_listener:
+            time.sleep(self._sleep_seconds)
+            return False
+        return len(self._dispatch_listener.await_notifications(self._sleep_seconds)) > 0
+
     def _transition_queued_actions_to_pending(self):
         _logger.info('transitioning queued actions to pending')
         action_service = self._action_service
@@ -63,32 +98,60 @@ class EngineWorker(Tool):
         assert isinstance(engine_service, EngineService)
         assert isinstance(datastore_service, DatastoreService)
         queued_actions = action_service.find_actions(states=[ActionState.QUEUED])
+        if not queued_actions:
+            return
+
+        # look everything up in bulk and track concurrency in memory, so the number of queries per pass does not
+        # depend on the number of queued actions
+        datastore_ids = list({a.data.datastore_id for a in queued_actions if a.data.datastore_id})
+        engine_names = list({a.data.engine_name for a in queued_actions})
+        datastores_by_id = {d.id: d for d in datastore_service.get_datastores(datastore_ids)}
+        engines_by_name = {e.data.name: e for e in engine_service.get_engines_by_name(engine_names)}
+        states = [ActionState.PENDING, ActionState.RUNNING, ActionState.FINISHING]
+        action_counts = action_service.find_action_counts_by_datastore(datastore_ids, states)
+
+        candidates = []
         for action in queued_actions:
+            datastore = datastores_by_id.get(action.data.datastore_id)
+            if not datastore or datastore.data.state != DatastoreState.ACTIVE:
+                continue
+
+            if action_counts.get(datastore.id, 0) >= datastore.data.concurrency:
+                _logger.info('datastore (id=%s) has reached max concurrency' % datastore.id)
+                continue
+
+            if action.data.engine_name not in engines_by_name:
+                _logger.error('error transitioning action (id=%s) to PENDING: engine with name=%s not found'
+                              % (action.id, action.data.engine_name))
+                continue
+
+            action_counts[datastore.id] = action_counts.get(datastore.id, 0) + 1
+            candidates.append(action)
+
+        if self._local_engine_pool:
+            # anything beyond the free slots stays QUEUED and is picked up once running engines finish
+            free_slots = self._local_engine_pool.free_slots()
+            _logger.info('local engine pool: %s of %s processes in use'
+                         % (self._local_engine_pool.in_use(), self._local_engine_pool.max_processes))
+            candidates = candidates[:free_slots]
+
+        # claiming skips actions that other engine workers have already locked or transitioned, so multiple
+        # engine workers can run side by side without failing on each other's updates
+        claimed_actions = action_service.claim_queued_actions([a.id for a in candidates])
+        _logger.info('claimed %s of %s candidate queued actions' % (len(claimed_actions), len(candidates)))
+
+        for action in claimed_actions:
             try:
-                datastore = datastore_service.get_datastore(action.data.datastore_id, raise_when_missing=False)
-                if not datastore or datastore.data.state != DatastoreState.ACTIVE:
-                    continue
-
-                states = [ActionState.PENDING, ActionState.RUNNING, ActionState.FINISHING]
-                action_count = self._action_service.find_action_count(datastore.id, states)
-                if action_count >= datastore.data.concurrency:
-                    _logger.info('datastore (id=%s) has reached max concurrency' % datastore.id)
-                    continue
-
-                # conditionally updating queued actions as pending allows multiple concurrent engine workers if needed
-                action_service.update_action_state(
-                    action=action,
-                    state=ActionState.PENDING,
-                    error_message=action.data.error_message,
-                    conditional=lambda a: a.data.state == ActionState.QUEUED
-                )
-
-                engine = engine_service.get_engine_by_name(action.data.engine_name)
-
-                if self.dart_config['dart'].get('use_local_engines'):
+                if action.data.queued_time:
+                    latency = (datetime.now() - action.data.queued_time).total_seconds()
+                    _logger.info('action (id=%s) dispatched %.3f seconds after being queued' % (action.id, latency))
+
+                engine = engines_by_name[action.data.engine_name]
+
+                if self._local_engine_pool:
                     config = self.dart_config['engines'][engine.data.name]
                     engine_instance = locate(config['path'])(**config.get('options', {}))
-                    self._launch_in_memory_engine(engine, engine_instance, action)
+                    self._local_engine_pool.launch(engine, engine_instance, action)
                     # empty string allows differentiation from null, yet is still falsey
                     action_service.update_action_ecs_task_arn(action, '')
 
@@ -104,10 +167,6 @@ class EngineWorker(Tool):
                     msg = 'engine %s has no ecs_task_definition and local engines are not allowed'
                     raise Exception(msg % engine.data.name)
 
-            except DartConditionalUpdateFailedException:
-                # another engine worker picked it up
-                continue
-
             except Exception as e:
                 _logger.error('error transitioning action (id=%s) to PENDING: %s' % (action.id, e.message))
 
@@ -244,31 +303,60 @@ class EngineWorker(Tool):
                             )
                             break
 
-    @staticmethod
-    def _launch_in_memory_engine(engine, engine_instance, action):
-        def target():
-            engine_instance.run()
-        os.environ['DART_ACTION_ID'] = action.id
-        p = Process(target=target)
-        p.start()
-        values = (engine.data.name, p.pid, action.id)
-        _logger.info('started in memory engine (name=%s) in process (pid=%s) to run action (id=%s)' % values)
 
+def _monotonic_seconds():
+    # elapsed real time since a fixed point in the past, which unlike time.time() does not jump with clock changes
+    return os.times()[4]
 
-class Counter(object):
-    def __init__(self, **thresholds):
-        self._thresholds = thresholds
-        self._current = {k: 0 for k, v in self._thresholds.iteritems()}
 
-    def increment(self):
-        for k in self._current: self._current[k] += 1
+class Schedule(object):
+    def __init__(self, clock=_monotonic_seconds, **intervals_seconds):
+        self._clock = clock
+        self._intervals_seconds = intervals_seconds
+        now = clock()
+        self._last_run = {k: now for k in intervals_seconds}
 
-    def is_ready(self, key):
-        if self._current[key] > self._thresholds[key]:
-            self._current[key] = 0
+    def is_due(self, key):
+        now = self._clock()
+        if now - self._last_run[key] >= self._intervals_seconds[key]:
+            self._last_run[key] = now
             return True
         return False
 
 
+class LocalEngineProcessPool(object):
+    def __init__(self, max_processes):
+        self.max_processes = max_processes
+        self._processes_by_action_id = {}
+
+    def in_use(self):
+        return len(self._processes_by_action_id)
+
+    def free_slots(self):
+        self.reap()
+        return max(self.max_processes - self.in_use(), 0)
+
+    def reap(self):
+        for action_id, p in self._processes_by_action_id.items():
+            if not p.is_alive():
+                p.join()
+                values = (p.pid, p.exitcode, action_id)
+                _logger.info('reaped in memory engine process (pid=%s, exitcode=%s) for action (id=%s)' % values)
+                del self._processes_by_action_id[action_id]
+
+    def launch(self, engine, engine_instance, action):
+        assert self.in_use() < self.max_processes, 'no free local engine slots'
+
+        def target():
+            os.environ['DART_ACTION_ID'] = action.id
+            engine_instance.run()
+        p = Process(target=target)
+        p.start()
+        self._processes_by_action_id[action.id] = p
+        values = (engine.data.name, p.pid, action.id, self.in_use(), self.max_processes)
+        _logger.info('started in memory engine (name=%s) in process (pid=%s) to run action (id=%s), %s of %s in use'
+                     % values)
+
+
 if __name__ == '__main__':
     Worker(EngineWorker(), _logger).run()